@@ -1,5 +1,5 @@
 # app.py - 会話記憶システム + 関係性レベル + より人間らしい会話実装版（京友禅職人版）
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, Response
 from flask_socketio import SocketIO, emit
 from werkzeug.utils import secure_filename
 from dotenv import load_dotenv
@@ -10,32 +10,54 @@ import json
 import uuid
 import time
 import re
-from datetime import datetime, timedelta
+import threading
+from datetime import datetime, timedelta, timezone
 from collections import defaultdict, deque
-from typing import Dict, Tuple, List, Set
+from typing import Dict, Tuple, List, Set, Optional, Union
 
 # Add current directory to Python path for imports
 current_dir = os.path.dirname(os.path.abspath(__file__))
 if current_dir not in sys.path:
     sys.path.insert(0, current_dir)
 
-from supabase import create_client, Client
+from supabase import Client
 from modules.rag_system import RAGSystem
 from modules.speech_processor import SpeechProcessor
+from modules.voice_activity import VoiceActivityDetector
 from modules.openai_tts_client import OpenAITTSClient
 from modules.coe_font_client import CoeFontClient
 from modules.emotion_voice_params import get_emotion_voice_params
-from openai import OpenAI
+from modules.tts_pipeline import SentenceTTSPipeline
+from modules.tts_cache import TTSAudioCache
+from modules.audio_store import AudioStore
+from modules.audio_clip import AudioClip
+from modules.audio_encoder import AudioEncoder
+from modules.character_state import CharacterStateStore
+from modules.conversation_history import ConversationHistoryManager
+from modules.write_behind import WriteBehindQueue
+from modules.context_assembler import ContextAssembler
+from modules.prompt_templates import PromptTemplates
+from modules.vector_index import NumpyVectorIndex
+from modules.embedding_cache import CachedEmbeddings
+from modules.semantic_cache import SemanticResponseCache
+from modules.async_openai_service import AsyncOpenAIService
+from modules import http_pool
+from langchain_openai import OpenAIEmbeddings
 
 # 静的Q&Aシステム
 try:
-    from static_qa_data import get_static_response, STATIC_QA_PAIRS
+    from static_qa_data import get_static_response, get_static_audio, get_all_suggestion_texts, STATIC_QA_PAIRS, GREETING
 except ImportError as e:
     print(f"Warning: Could not import static_qa_data: {e}")
     # Fallback functions if static_qa_data is not available
-    def get_static_response(query):
+    def get_static_response(query, question_count=1, selected_suggestions=None):
         return None
+    def get_static_audio(parts):
+        return None
+    def get_all_suggestion_texts():
+        return []
     STATIC_QA_PAIRS = []
+    GREETING = None
 
 # 環境変数の読み込み
 load_dotenv()
@@ -48,8 +70,16 @@ application = Flask(__name__)
 app = application  # For compatibility
 application.config.from_object(Config)
 
-# Supabaseクライアントの初期化
-supabase: Client = create_client(
+# 外部APIとのコネクションプール（OpenAI・CoeFont・Supabaseで共有）
+http_pool.configure(
+    pool_connections=Config.HTTP_POOL_CONNECTIONS,
+    pool_maxsize=Config.HTTP_POOL_MAXSIZE,
+    max_connections=Config.HTTP_MAX_CONNECTIONS,
+    keepalive_expiry=Config.HTTP_KEEPALIVE_EXPIRY
+)
+
+# Supabaseクライアントの初期化（RAGSystemと共有）
+supabase: Client = http_pool.get_supabase_client(
     os.environ.get('SUPABASE_URL', Config.SUPABASE_URL),
     os.environ.get('SUPABASE_KEY', Config.SUPABASE_KEY)
 )
@@ -64,17 +94,44 @@ socketio = SocketIO(
     logger=True,
     engineio_logger=True,
     path='socket.io',
-    max_http_buffer_size=5e7  # 50MB
+    max_http_buffer_size=Config.SOCKETIO_MAX_HTTP_BUFFER_MB * 1024 * 1024  # 音声はバイナリで送るのでBase64分の余裕は不要
 )
 
 # 一時アップロードディレクトリの作成
 os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
 
+# 非同期OpenAIサービス（有効時はGPT-4・TTS・Whisperの待ち時間中もほかの会話を処理できる）
+openai_service = AsyncOpenAIService(
+    limits={
+        'chat': Config.ASYNC_OPENAI_MAX_CHAT,
+        'tts': Config.ASYNC_OPENAI_MAX_TTS,
+        'transcription': Config.ASYNC_OPENAI_MAX_TRANSCRIPTION
+    },
+    timeouts={
+        'chat': Config.ASYNC_OPENAI_CHAT_TIMEOUT,
+        'tts': Config.ASYNC_OPENAI_TTS_TIMEOUT,
+        'transcription': Config.ASYNC_OPENAI_TRANSCRIPTION_TIMEOUT
+    }
+) if Config.ASYNC_OPENAI_ENABLED else None
+
 # インスタンスの初期化
-rag_system = RAGSystem()
-speech_processor = SpeechProcessor()
-tts_client = OpenAITTSClient()
-coe_font_client = CoeFontClient()
+speech_processor = SpeechProcessor(
+    openai_service=openai_service,
+    vad=VoiceActivityDetector(
+        threshold_db=Config.VAD_THRESHOLD_DB,
+        min_speech_ms=Config.VAD_MIN_SPEECH_MS,
+        max_pause_ms=Config.VAD_MAX_PAUSE_MS
+    ) if Config.VAD_ENABLED else None,
+    vad_passthrough_max_trim_ms=Config.VAD_PASSTHROUGH_MAX_TRIM_MS
+)
+tts_client = OpenAITTSClient(openai_service=openai_service, response_format=Config.OPENAI_TTS_FORMAT)
+coe_font_client = CoeFontClient(
+    deadline_seconds=Config.COEFONT_DEADLINE_SECONDS,
+    max_retries=Config.COEFONT_MAX_RETRIES,
+    connect_timeout=Config.COEFONT_CONNECT_TIMEOUT
+)
+# CoeFontはWAVしか返さないため、送信前にサーバー側で圧縮する
+coe_font_encoder = AudioEncoder(codec=Config.COEFONT_AUDIO_CODEC, bitrate=Config.COEFONT_AUDIO_BITRATE)
 
 # キャッシュ統計情報
 cache_stats = {
@@ -83,16 +140,108 @@ cache_stats = {
     'cache_misses': 0,
     'total_time_saved': 0.0,
     'coe_font_requests': 0,
-    'openai_tts_requests': 0
+    'openai_tts_requests': 0,
+    'coe_font_fallbacks': 0
 }
 
+# クエリ埋め込みキャッシュ（同じ質問文の埋め込みは再計算しない）
+query_embeddings = CachedEmbeddings(
+    # 埋め込みAPIもチャット・TTSと同じkeep-aliveのコネクションプールを通す
+    OpenAIEmbeddings(
+        http_client=http_pool.get_httpx_client(),
+        http_async_client=http_pool.get_async_httpx_client()
+    ),
+    cache_path=Config.EMBEDDING_CACHE_PATH,
+    max_items=Config.EMBEDDING_CACHE_MAX_ITEMS,
+    stats=cache_stats
+)
+# 言い換え質問の回答を再利用するセマンティックキャッシュ
+semantic_cache = SemanticResponseCache(
+    threshold=Config.SEMANTIC_CACHE_THRESHOLD,
+    ttl_seconds=Config.SEMANTIC_CACHE_TTL_SECONDS,
+    max_entries=Config.SEMANTIC_CACHE_MAX_ENTRIES,
+    stats=cache_stats
+)
+# プロンプトの文脈をトークン予算内で組み立てるアセンブラ
+context_assembler = ContextAssembler(token_budget=Config.CONTEXT_TOKEN_BUDGET)
+# システムプロンプトを固定の接頭部として使い回すテンプレート（プロンプトキャッシュ用）
+prompt_templates = PromptTemplates()
+# Chromaの埋め込みをメモリに展開したベクトル索引（VECTOR_INDEX_MODE=chroma なら使わない）
+vector_index = NumpyVectorIndex(query_embeddings) if Config.VECTOR_INDEX_MODE == 'numpy' else None
+rag_system = RAGSystem(
+    persist_directory=Config.CHROMA_DB_PATH,
+    embeddings=query_embeddings,
+    semantic_cache=semantic_cache,
+    openai_service=openai_service,
+    context_assembler=context_assembler,
+    prompt_templates=prompt_templates,
+    retriever_options={
+        'lexical_k': Config.RETRIEVAL_LEXICAL_K,
+        'vector_k': Config.RETRIEVAL_VECTOR_K,
+        'rrf_k': Config.RETRIEVAL_RRF_K,
+        'max_results': Config.RETRIEVAL_MAX_RESULTS,
+        'max_tokens': Config.RETRIEVAL_MAX_TOKENS,
+        'vector_timeout': Config.RETRIEVAL_VECTOR_TIMEOUT
+    },
+    vector_index=vector_index,
+    answer_model=Config.ANSWER_MODEL
+)
+
+# サジェスチョン文言の埋め込みをバックグラウンドでまとめて事前取得
+threading.Thread(
+    target=query_embeddings.prefetch,
+    args=(RAGSystem.get_all_suggestion_texts() + get_all_suggestion_texts(),),
+    daemon=True
+).start()
+
+# TTS音声キャッシュ（同じテキスト・声・パラメータの音声は再生成しない）
+tts_cache = TTSAudioCache(
+    cache_dir=Config.TTS_CACHE_DIR,
+    max_memory_items=Config.TTS_CACHE_MEMORY_ITEMS,
+    max_memory_bytes=Config.TTS_CACHE_MEMORY_MB * 1024 * 1024,
+    max_disk_bytes=Config.TTS_CACHE_DISK_MB * 1024 * 1024,
+    stats=cache_stats
+)
+
+# /audio/<id> で受け渡す短命な音声（バイナリを扱えないクライアント・録音のHTTPアップロード用）
+audio_store = AudioStore(
+    ttl_seconds=Config.AUDIO_STORE_TTL_SECONDS,
+    max_bytes=Config.AUDIO_STORE_MAX_MB * 1024 * 1024
+)
+
+# 訪問者ごとのキャラクター内面状態（LRU + TTLで上限を保つ）
+character_states = CharacterStateStore(
+    max_sessions=Config.CHARACTER_STATE_MAX_SESSIONS,
+    ttl_seconds=Config.CHARACTER_STATE_TTL_SECONDS
+)
+
+# 会話の保存は応答を返した後にまとめて書き込む（複数行insert、失敗時は再試行）
+write_behind = WriteBehindQueue(
+    supabase,
+    batch_size=Config.WRITE_BEHIND_BATCH_SIZE,
+    flush_interval=Config.WRITE_BEHIND_FLUSH_INTERVAL,
+    max_retries=Config.WRITE_BEHIND_MAX_RETRIES,
+    max_queue=Config.WRITE_BEHIND_MAX_QUEUE
+)
+
+# /api/chat の会話履歴（直近の往復 + 古い会話の要約でプロンプトの大きさを一定に保つ）
+history_manager = ConversationHistoryManager(
+    supabase,
+    openai_service=openai_service,
+    max_turns=Config.HISTORY_MAX_TURNS,
+    token_budget=Config.HISTORY_TOKEN_BUDGET,
+    summary_model=Config.HISTORY_SUMMARY_MODEL,
+    summary_max_chars=Config.HISTORY_SUMMARY_MAX_CHARS,
+    summary_batch_turns=Config.HISTORY_SUMMARY_BATCH_TURNS,
+    write_behind=write_behind
+)
+
 # セッションデータの一時保存（メモリキャッシュ）
 session_data = {}
 
-def generate_ai_response(message: str, conversation_history: List[Dict]) -> str:
-    """AIの応答を生成"""
+def generate_ai_response(message: str, conversation_history: List[Dict], summary: str = "") -> str:
+    """AIの応答を生成（conversation_historyは直近の会話、summaryはそれより前の会話の要約）"""
     try:
-        client = OpenAI()
         messages = []
         
         # システムメッセージを追加
@@ -101,6 +250,13 @@ def generate_ai_response(message: str, conversation_history: List[Dict]) -> str:
             "content": "あなたは京友禅の職人で、手描友禅を15年やっているREIです。"
         })
         
+        # 古い会話は要約だけを渡す
+        if summary:
+            messages.append({
+                "role": "system",
+                "content": f"これまでの会話の要約:\n{summary}"
+            })
+        
         # 会話履歴を追加
         for conv in conversation_history:
             messages.append({
@@ -115,19 +271,110 @@ def generate_ai_response(message: str, conversation_history: List[Dict]) -> str:
         })
         
         # GPT-4で応答を生成
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=500
-        )
+        completion_params = {
+            "model": "gpt-4",
+            "messages": messages,
+            "temperature": 0.7,
+            "max_tokens": 500
+        }
+        if openai_service:
+            return openai_service.chat(**completion_params)
         
+        response = http_pool.get_openai_client().chat.completions.create(**completion_params)
         return response.choices[0].message.content
         
     except Exception as e:
         print(f"AI応答生成エラー: {e}")
         return "申し訳ありません。応答の生成中にエラーが発生しました。"
 
+def synthesize_speech(text: str, emotion: Optional[str] = None) -> Optional[AudioClip]:
+    """応答テキストを音声化（CoeFont優先、失敗時はOpenAI TTSにフォールバック）"""
+    if not text:
+        return None
+    
+    if coe_font_client.is_available():
+        audio = tts_cache.get_or_generate(
+            'coefont',
+            tts_cache.make_key(
+                'coefont',
+                coe_font_client.coefont_id,
+                text,
+                dict(coe_font_client._get_emotion_params(emotion) if emotion else {}, **coe_font_encoder.params)
+            ),
+            lambda: generate_coe_font_audio(text, emotion),
+            has_fallback=True
+        )
+        if audio:
+            return audio
+        
+        # CoeFontが失敗・制限時間切れの場合はOpenAI TTSで生成
+        cache_stats['coe_font_fallbacks'] += 1
+        print("🔁 CoeFontの代わりにOpenAI TTSで音声を生成します")
+    
+    return tts_cache.get_or_generate(
+        'openai',
+        tts_cache.make_key(
+            'openai',
+            tts_client.voice,
+            text,
+            {'model': tts_client.model, 'speed': tts_client.speed, 'format': tts_client.response_format}
+        ),
+        lambda: generate_openai_audio(text, emotion)
+    )
+
+def generate_coe_font_audio(text: str, emotion: Optional[str] = None) -> Optional[AudioClip]:
+    """CoeFont APIで音声を生成し、設定したコーデックに圧縮（キャッシュミス時のみ呼ばれる）"""
+    cache_stats['coe_font_requests'] += 1
+    clip = coe_font_client.generate_clip(text, emotion)
+    return coe_font_encoder.encode(clip) if clip else None
+
+def generate_openai_audio(text: str, emotion: Optional[str] = None) -> Optional[AudioClip]:
+    """OpenAI TTSで音声を生成（キャッシュミス時のみ呼ばれる）"""
+    cache_stats['openai_tts_requests'] += 1
+    return tts_client.generate_clip(text, emotion_params=get_emotion_voice_params(emotion))
+
+def audio_payload(audio: Optional[Union[str, AudioClip]]) -> Dict:
+    """
+    クライアントへ送る音声フィールドを作成
+    
+    URL（事前生成の静的音声）はそのまま audioUrl で、AudioClipはSocket.IOのバイナリ添付
+    （audio + audioMime）で送る。AUDIO_TRANSPORT=url の場合は /audio/<id> に置いてURLで渡す。
+    """
+    if not audio:
+        return {'audio': None}
+    if isinstance(audio, str):
+        return {'audio': None, 'audioUrl': audio}
+    
+    if Config.AUDIO_TRANSPORT == 'url':
+        audio_id = audio_store.put(audio.mime, audio.data)
+        if audio_id:
+            # TTSパイプラインのスレッドからも呼ばれるため、url_forは使わずにパスを組み立てる
+            return {'audio': None, 'audioUrl': f"/audio/{audio_id}", 'audioDuration': audio.duration}
+    return {'audio': audio.data, 'audioMime': audio.mime, 'audioDuration': audio.duration}
+
+def normalize_question(question: str) -> str:
+    """質問を正規化（クライアントの visitorManager.normalizeQuestion と同じ規則）"""
+    question = re.sub(r'[？?。、！!]', '', question.lower())
+    return re.sub(r'\s+', '', question).strip()
+
+def build_conversation_context(conversation_history: List[Dict], current_message: str = "") -> str:
+    """クライアントから届いた最近の会話履歴をプロンプト用の文脈に整形"""
+    lines = []
+    for conv in conversation_history:
+        content = (conv or {}).get('content')
+        if not content:
+            continue
+        speaker = 'ユーザー' if conv.get('role') == 'user' else 'あなた'
+        lines.append(f"{speaker}: {content}")
+    
+    # 送信直前に履歴へ追加された今回の質問は除外
+    if current_message and lines and lines[-1] == f"ユーザー: {current_message}":
+        lines.pop()
+    
+    if not lines:
+        return ""
+    return "【最近の会話】\n" + "\n".join(lines)
+
 # ファイルアップロード処理の関数
 def save_uploaded_file(file):
     """ファイルをSupabaseストレージにアップロード"""
@@ -193,32 +440,82 @@ def chat():
     if not session_id:
         return jsonify({'error': 'Invalid session'}), 400
     
-    # 会話履歴を取得
-    result = supabase.table('conversations').select('*').eq('session_id', session_id).order('created_at').execute()
-    conversation_history = result.data if result.data else []
+    # 直近の会話と、それより前の会話の要約を取得
+    history = history_manager.load(session_id)
     
     # AIの応答を生成
-    response = generate_ai_response(message, conversation_history)
-    
-    # 会話履歴を保存
-    conversation_data = {
-        'session_id': session_id,
-        'role': 'user',
-        'content': message,
-        'created_at': datetime.utcnow().isoformat()
-    }
-    supabase.table('conversations').insert(conversation_data).execute()
+    response = generate_ai_response(message, history['messages'], history['summary'])
     
-    conversation_data = {
-        'session_id': session_id,
-        'role': 'assistant',
-        'content': response,
-        'created_at': datetime.utcnow().isoformat()
-    }
-    supabase.table('conversations').insert(conversation_data).execute()
+    # 会話履歴を保存（書き込みは待たずに応答を返す）
+    write_behind.enqueue('conversations', [
+        {
+            'session_id': session_id,
+            'role': 'user',
+            'content': message,
+            'created_at': datetime.now(timezone.utc).isoformat()
+        },
+        {
+            'session_id': session_id,
+            'role': 'assistant',
+            'content': response,
+            'created_at': datetime.now(timezone.utc).isoformat()
+        }
+    ])
+    
+    # 直近の窓から外れた会話を要約に畳み込む（応答は待たせない）
+    history_manager.schedule_refresh(session_id)
     
     return jsonify({'response': response})
 
+@app.route('/audio/<audio_id>')
+def get_audio(audio_id):
+    """短命な音声をIDで取得（期限切れなら404）"""
+    audio = audio_store.get(audio_id)
+    if not audio:
+        return jsonify({'error': 'Audio not found'}), 404
+    
+    mime_type, audio_bytes = audio
+    response = Response(audio_bytes, mimetype=mime_type)
+    response.headers['Cache-Control'] = f'private, max-age={int(Config.AUDIO_STORE_TTL_SECONDS)}'
+    return response
+
+@app.route('/audio', methods=['POST'])
+def upload_audio():
+    """録音をバイナリのままアップロード（audio_message の audioId で参照する）"""
+    audio_bytes = request.get_data(cache=False)
+    if not audio_bytes:
+        return jsonify({'error': 'Empty audio'}), 400
+    if len(audio_bytes) > Config.SOCKETIO_MAX_HTTP_BUFFER_MB * 1024 * 1024:
+        return jsonify({'error': 'Audio too large'}), 413
+    
+    audio_id = audio_store.put(request.mimetype or 'application/octet-stream', audio_bytes)
+    if not audio_id:
+        return jsonify({'error': 'Failed to store audio'}), 500
+    return jsonify({'id': audio_id})
+
+@app.route('/api/cache_stats')
+def get_cache_stats():
+    """キャッシュ統計情報を取得"""
+    return jsonify({
+        'stats': cache_stats,
+        'embedding_cache': query_embeddings.get_stats(),
+        'semantic_cache': semantic_cache.get_stats(),
+        'async_openai': openai_service.get_stats() if openai_service else None,
+        'http_pool': http_pool.get_stats(),
+        'coe_font': coe_font_client.stats,
+        'coe_font_encoder': coe_font_encoder.get_stats(),
+        'speech': speech_processor.get_metrics(),
+        'audio_store': audio_store.get_stats(),
+        'conversation_history': history_manager.get_stats(),
+        'write_behind': write_behind.get_stats(),
+        'context_assembler': context_assembler.get_stats(),
+        'prompt_templates': prompt_templates.get_stats(),
+        'knowledge_index': rag_system.knowledge_index.get_stats(),
+        'retriever': rag_system.retriever.get_stats(),
+        'vector_index': vector_index.get_stats() if vector_index else None,
+        'tts_cache': tts_cache.get_stats()
+    })
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     """ファイルアップロードエンドポイント"""
@@ -239,6 +536,139 @@ def upload_file():
         'storage_path': uploaded_file.get('storage_path')
     })
 
+# ====== Socket.IOイベントハンドラー ======
+@socketio.on('connect')
+def handle_connect():
+    """接続時に挨拶メッセージを送信（音声はビルド時生成のものを優先）"""
+    if not GREETING:
+        return
+    
+    emit('greeting', {
+        'message': GREETING['message'],
+        'emotion': GREETING['emotion'],
+        **audio_payload(get_static_audio([GREETING['message']]) or synthesize_speech(GREETING['message'], GREETING['emotion']))
+    })
+
+@socketio.on('message')
+def handle_message(data):
+    """テキストメッセージを受信し、応答をストリーミングで返す"""
+    data = data or {}
+    message = (data.get('message') or '').strip()
+    if not message:
+        emit('error', {'message': 'メッセージが空です'})
+        return
+    
+    respond_to_message(data, message, int(data.get('questionCount') or 1))
+
+@socketio.on('audio_message')
+def handle_audio_message(data):
+    """録音を受信して文字起こしし、テキストメッセージと同じ流れで応答する"""
+    data = data or {}
+    
+    # バイナリ添付（bytes）、/audio にアップロード済みのID、旧クライアントのBase64文字列のいずれか
+    audio = data.get('audio')
+    if not audio and data.get('audioId'):
+        uploaded = audio_store.pop(data['audioId'])
+        audio = uploaded[1] if uploaded else None
+    if not audio:
+        emit('error', {'message': '音声データが見つかりません'})
+        return
+    
+    # 失敗時のメッセージは発言ではないので、応答を生成せずエラーとして返す
+    message, error_message = speech_processor.transcribe(audio, data.get('language') or 'ja')
+    if not message:
+        emit('error', {'message': error_message or '音声を認識できませんでした。もう一度お話しください。'})
+        return
+    
+    emit('transcription', {'text': message})
+    
+    # クライアントは文字起こしを受け取ってから質問回数を数えるので、送られてきた回数から求める
+    question_counts = (data.get('visitData') or {}).get('questionCounts') or {}
+    question_count = int(question_counts.get(normalize_question(message)) or 0) + 1
+    respond_to_message(data, message, question_count)
+
+def respond_to_message(data: Dict, message: str, question_count: int):
+    """ユーザーの発言に応答（静的Q&A → RAGのストリーミング応答 + 文単位の音声化）"""
+    # 訪問者IDごとに内面状態を保持（再接続しても気分が続く）
+    character_state = character_states.get(data.get('visitorId') or request.sid)
+    relationship_style = data.get('relationshipLevel') or 'formal'
+    selected_suggestions = data.get('selectedSuggestions') or []
+    cache_stats['total_requests'] += 1
+    
+    try:
+        # 静的Q&Aにマッチすれば即座に返す
+        static_response = get_static_response(message, question_count, selected_suggestions)
+        if static_response:
+            character_state.current_emotion = static_response['emotion']
+            emit('response', {
+                'message': static_response['answer'],
+                'emotion': static_response['emotion'],
+                'suggestions': static_response['suggestions'],
+                # 事前生成音声があればAPIを呼ばずに済む
+                **audio_payload(static_response.get('audio') or synthesize_speech(static_response['answer'], static_response['emotion']))
+            })
+            return
+        
+        sid = request.sid
+        speech_emotion = character_state.current_emotion
+        
+        # 🎯 完成した文から順に音声化し、連番順にアバターへ送る
+        def emit_audio_chunk(index, text, audio):
+            socketio.emit('audio_chunk', {
+                'index': index,
+                'text': text,
+                'emotion': speech_emotion,
+                **audio_payload(audio)
+            }, to=sid)
+        
+        tts_pipeline = SentenceTTSPipeline(
+            synthesize_speech,
+            emit_audio_chunk,
+            emotion=speech_emotion,
+            transform=lambda sentence: rag_system.postprocess_sentence(sentence, relationship_style),
+            max_chars=Config.TTS_PIPELINE_MAX_CHARS
+        )
+        
+        # 🎯 生成されたテキスト断片をクライアントへ中継しつつTTSパイプラインに流す
+        def relay_delta(delta):
+            emit('response_chunk', {'text': delta})
+            tts_pipeline.feed(delta)
+        
+        try:
+            result = rag_system.answer_with_suggestions(
+                message,
+                build_conversation_context(data.get('conversationHistory') or [], message),
+                question_count,
+                relationship_style,
+                character_state.current_emotion,
+                selected_suggestions,
+                on_delta=relay_delta,
+                state=character_state
+            )
+        finally:
+            # 残りの文を投入（完了は待たずに応答を確定させる）
+            tts_pipeline.finish(wait=False)
+        
+        answer = result['answer']
+        emotion = result.get('current_emotion') or 'neutral'
+        audio_streamed = tts_pipeline.sentence_count > 0
+        
+        # 後処理済みの完成版で表示を確定させる
+        emit('response', {
+            'message': answer,
+            'emotion': emotion,
+            'suggestions': result.get('suggestions', []),
+            'currentTopic': rag_system.extract_topic(message, answer),
+            'audioStreamed': audio_streamed,
+            **audio_payload(None if audio_streamed else synthesize_speech(answer, emotion))
+        })
+        
+    except Exception as e:
+        print(f"メッセージ処理エラー: {e}")
+        import traceback
+        traceback.print_exc()
+        emit('error', {'message': '応答の生成中にエラーが発生しました'})
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     socketio.run(application, host='0.0.0.0', port=port)
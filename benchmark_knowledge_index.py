@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+専門知識検索のマイクロベンチマーク
+
+静的Q&Aの回答文から作った専門知識（knowledge_base と同じ形）を1k・10k・100k項目に増やし、
+KnowledgeIndex（文字バイグラムの転置インデックス + BM25）の構築時間・差分更新・検索レイテンシを、
+項目ごとのバイグラムを事前に数えておき、全項目のBM25スコアを毎回計算する線形走査と比較します。
+線形走査は枝刈りをしない正解でもあるので、索引の上位k件が一致することも確認します。
+
+使い方:
+    python benchmark_knowledge_index.py
+"""
+
+import math
+import time
+import random
+from static_qa_data import STATIC_QA_PAIRS, SUGGESTION_CATEGORIES
+from modules.knowledge_index import KnowledgeIndex, char_ngrams
+
+def build_knowledge_base(item_count):
+    """静的Q&Aの回答文を項目にした knowledge_base（item_count項目）"""
+    answers = [qa["answer"] for qa in STATIC_QA_PAIRS]
+    knowledge_base = {}
+    for index in range(item_count):
+        qa = STATIC_QA_PAIRS[index % len(STATIC_QA_PAIRS)]
+        category = f"{qa['category']}_{index // 500}"
+        subcategory = qa["patterns"][0]
+        # 同じ文が並ばないよう、別の回答の一部と通し番号を混ぜる
+        item = f"{answers[index % len(answers)]} {answers[(index * 7) % len(answers)][:15]} (その{index})"
+        knowledge_base.setdefault(category, {}).setdefault(subcategory, []).append(item)
+    return knowledge_base
+
+def build_queries():
+    queries = []
+    for category in SUGGESTION_CATEGORIES.values():
+        queries.extend(category["suggestions"])
+    queries.extend([
+        "糸目糊って何？",
+        "休みの日は何してるの",
+        "今日はいい天気ですね",
+        "Hello there",
+    ])
+    return queries
+
+class LinearBM25:
+    """比較用: 項目ごとのn-gramの出現回数を事前に数えておき、検索のたびに全項目のBM25を計算する"""
+
+    def __init__(self, index):
+        # 索引と同じ項目・同じ出現回数（見出しの重みを含む）を使う
+        self.entries = [(index._entries[doc_id], terms, index._doc_lengths[doc_id])
+                        for doc_id, terms in index._doc_terms.items()]
+        self.k1 = index.k1
+        self.b = index.b
+        # 索引は平均文書長が大きくずれるまで重みを計算し直さないので、索引が使っている値に揃える
+        self.avg_length = index._weight_avg_length
+        self.df = {}
+        for _, terms, _ in self.entries:
+            for gram in terms:
+                self.df[gram] = self.df.get(gram, 0) + 1
+
+    def search(self, query, k=10):
+        doc_count = len(self.entries)
+        idf = {}
+        for gram in set(char_ngrams(query)):
+            df = self.df.get(gram)
+            if df:
+                idf[gram] = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+        scored = []
+        for position, (entry, terms, length) in enumerate(self.entries):
+            norm = self.k1 * (1 - self.b + self.b * length / self.avg_length)
+            score = 0.0
+            for gram, weight in idf.items():
+                tf = terms.get(gram)
+                if tf:
+                    score += weight * tf * (self.k1 + 1) / (tf + norm)
+            if score > 0:
+                scored.append((-score, position, entry))
+        scored.sort()
+        return [(-neg_score, entry) for neg_score, _, entry in scored[:k]]
+
+def check_exact(index, linear, queries, k=10):
+    """索引の上位k件が全件のBM25と一致するか（同点の並びは問わない）"""
+    mismatches = 0
+    for query in queries:
+        indexed = index.search(query, k)
+        expected = linear.search(query, k)
+        if len(indexed) != len(expected):
+            mismatches += 1
+            continue
+        for (score, entry), (expected_score, expected_entry) in zip(indexed, expected):
+            if abs(score - expected_score) > 1e-9 * max(1.0, abs(expected_score)):
+                mismatches += 1
+                break
+    return mismatches
+
+def benchmark(label, func, queries, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            func(query)
+    elapsed = time.perf_counter() - start
+    per_query_us = elapsed / (repeat * len(queries)) * 1_000_000
+    print(f"  {label:<12} {per_query_us:12.2f} µs/クエリ")
+    return per_query_us
+
+def main():
+    random.seed(0)
+    queries = build_queries()
+    print(f"=== 専門知識検索ベンチマーク ({len(queries)}クエリ, 上位10件) ===")
+
+    for item_count in (1_000, 10_000, 100_000):
+        knowledge_base = build_knowledge_base(item_count)
+
+        index = KnowledgeIndex()
+        build_start = time.perf_counter()
+        index.build(knowledge_base)
+        build_ms = (time.perf_counter() - build_start) * 1000
+
+        # process_documents で1%の項目が増えた場合の差分更新
+        knowledge_base["追加資料"] = {
+            "_general": [f"追加資料{number}: {STATIC_QA_PAIRS[number % len(STATIC_QA_PAIRS)]['answer']}"
+                         for number in range(item_count // 100)]
+        }
+        update_start = time.perf_counter()
+        added, removed = index.update(knowledge_base)
+        update_ms = (time.perf_counter() - update_start) * 1000
+
+        print(f"\n■ {len(index)}項目 (n-gram数: {index.get_stats()['ngrams']}, "
+              f"構築: {build_ms:.1f} ms, 差分更新 +{added}/-{removed}: {update_ms:.1f} ms)")
+        linear_bm25 = LinearBM25(index)
+        mismatches = check_exact(index, linear_bm25, queries)
+        print(f"  全件BM25との不一致: {mismatches}/{len(queries)}クエリ")
+        assert mismatches == 0, "KnowledgeIndex.search の結果が全件のBM25と一致しません"
+
+        repeat = max(1, 10_000 // item_count)
+        linear = benchmark("線形走査", lambda q: linear_bm25.search(q), queries, repeat)
+        indexed = benchmark("BM25索引", lambda q: index.search(q, 10), queries, repeat * 20)
+        print(f"  高速化: {linear / indexed:.1f}倍")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+静的Q&A照合のマイクロベンチマーク
+
+従来の線形走査（クエリごとに全パターンを正規化して比較）と、
+起動時に構築するStaticQAMatcher（Aho–Corasick + 接尾辞オートマトン）を
+現在のパターン数の1倍・10倍・100倍で比較します。
+
+結果（優先順位）が従来と一致することは test_static_qa_data.py で確認しています。
+
+使い方:
+    python benchmark_static_qa.py
+"""
+
+import time
+import random
+from static_qa_data import STATIC_QA_PAIRS, SUGGESTION_CATEGORIES, StaticQAMatcher, normalize_query
+
+def find_matching_qa_linear(query, qa_pairs):
+    """従来の実装（比較用）"""
+    normalized_query = normalize_query(query)
+    
+    for qa in qa_pairs:
+        for pattern in qa["patterns"]:
+            normalized_pattern = normalize_query(pattern)
+            if normalized_query == normalized_pattern:
+                return qa
+            if normalized_pattern in normalized_query:
+                return qa
+            if normalized_query in normalized_pattern:
+                return qa
+    
+    return None
+
+def scale_qa_pairs(multiplier):
+    """パターン数を増やしたQ&Aセットを作成（元のQ&Aを先頭に保つ）"""
+    qa_pairs = list(STATIC_QA_PAIRS)
+    for copy_index in range(1, multiplier):
+        for qa in STATIC_QA_PAIRS:
+            qa_pairs.append({
+                **qa,
+                "patterns": [f"{pattern}その{copy_index}" for pattern in qa["patterns"]]
+            })
+    return qa_pairs
+
+def build_queries():
+    """実際に届く質問に近いクエリ集（サジェスチョン・パターン・マッチしない質問）"""
+    queries = []
+    for category in SUGGESTION_CATEGORIES.values():
+        queries.extend(category["suggestions"])
+    for qa in STATIC_QA_PAIRS:
+        queries.extend(f"{pattern}について教えて" for pattern in qa["patterns"][:2])
+    queries.extend([
+        "今日はいい天気ですね",
+        "着物の値段ってどれくらい？",
+        "友禅",
+        "ありがとう！",
+        "Hello there",
+    ])
+    return queries
+
+def benchmark(label, func, queries, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            func(query)
+    elapsed = time.perf_counter() - start
+    per_query_us = elapsed / (repeat * len(queries)) * 1_000_000
+    print(f"  {label:<12} {per_query_us:10.2f} µs/クエリ")
+    return per_query_us
+
+def main():
+    random.seed(0)
+    queries = build_queries()
+    print(f"=== 静的Q&A照合ベンチマーク ({len(queries)}クエリ) ===")
+    
+    for multiplier in (1, 10, 100):
+        qa_pairs = scale_qa_pairs(multiplier)
+        
+        build_start = time.perf_counter()
+        matcher = StaticQAMatcher(qa_pairs)
+        build_ms = (time.perf_counter() - build_start) * 1000
+        
+        print(f"\n■ {multiplier}倍 (パターン数: {matcher.pattern_count}, インデックス構築: {build_ms:.1f} ms)")
+        repeat = max(1, 200 // multiplier)
+        linear = benchmark("線形走査", lambda q: find_matching_qa_linear(q, qa_pairs), queries, repeat)
+        indexed = benchmark("インデックス", matcher.find, queries, repeat * 10)
+        print(f"  高速化: {linear / indexed:.1f}倍")
+
+if __name__ == "__main__":
+    main()
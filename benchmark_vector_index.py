@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ベクトル検索のマイクロベンチマーク
+
+OpenAIの埋め込みと同じ1536次元の正規化済みランダムベクトルを1k・10k・100k件用意し、
+NumpyVectorIndex（float32行列 × ベクトル + argpartition）と Chroma.similarity_search_by_vector の
+検索レイテンシを比較します（どちらも埋め込みAPIの時間は含めない）。search_many のまとめ検索も測ります。
+
+使い方:
+    python benchmark_vector_index.py
+"""
+
+import time
+import shutil
+import tempfile
+import numpy as np
+from langchain_core.documents import Document
+from modules.vector_index import NumpyVectorIndex
+
+DIMENSIONS = 1536
+TOP_K = 4
+QUERY_COUNT = 50
+
+def random_unit_vectors(rng, count):
+    vectors = rng.standard_normal((count, DIMENSIONS)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def build_chroma(vectors, documents, directory):
+    """埋め込み計算を通さずにChromaのコレクションへ直接登録"""
+    from langchain_community.vectorstores import Chroma
+    db = Chroma(collection_name="benchmark", persist_directory=directory)
+    batch_size = 5000
+    for start in range(0, len(vectors), batch_size):
+        db._collection.add(
+            ids=[str(i) for i in range(start, min(start + batch_size, len(vectors)))],
+            embeddings=vectors[start:start + batch_size].tolist(),
+            documents=documents[start:start + batch_size]
+        )
+    return db
+
+def benchmark(label, func, queries):
+    start = time.perf_counter()
+    for query in queries:
+        func(query)
+    per_query_us = (time.perf_counter() - start) / len(queries) * 1_000_000
+    print(f"  {label:<20} {per_query_us:12.1f} µs/クエリ")
+    return per_query_us
+
+def main():
+    rng = np.random.default_rng(0)
+    queries = random_unit_vectors(rng, QUERY_COUNT)
+    print(f"=== ベクトル検索ベンチマーク ({DIMENSIONS}次元, 上位{TOP_K}件, {QUERY_COUNT}クエリ) ===")
+
+    for count in (1_000, 10_000, 100_000):
+        vectors = random_unit_vectors(rng, count)
+        documents = [f"チャンク{i}" for i in range(count)]
+
+        index = NumpyVectorIndex()
+        load_start = time.perf_counter()
+        index.load(vectors, [Document(page_content=text) for text in documents], fingerprint=str(count))
+        load_ms = (time.perf_counter() - load_start) * 1000
+        print(f"\n■ {count}件 (行列: {vectors.nbytes / 1024 / 1024:.0f} MB, 読み込み: {load_ms:.0f} ms)")
+
+        numpy_us = benchmark("NumPy索引", lambda q: index.search_by_vector(q, TOP_K), queries)
+        batch_start = time.perf_counter()
+        batched = index.search_many_by_vector(queries, TOP_K)
+        batch_us = (time.perf_counter() - batch_start) / len(queries) * 1_000_000
+        print(f"  {'NumPy索引(まとめ)':<18} {batch_us:12.1f} µs/クエリ")
+
+        # 正解（全件の内積を並べた順位）と一致することを確認
+        for query, results in zip(queries[:5], batched[:5]):
+            expected = np.argsort(-(vectors @ query))[:TOP_K]
+            assert [document.page_content for document, _ in results] == [documents[i] for i in expected]
+
+        directory = tempfile.mkdtemp(prefix="chroma_benchmark_")
+        try:
+            build_start = time.perf_counter()
+            db = build_chroma(vectors, documents, directory)
+            build_s = time.perf_counter() - build_start
+            print(f"  (Chroma登録: {build_s:.1f} 秒)")
+            chroma_us = benchmark("Chroma", lambda q: db.similarity_search_by_vector(q.tolist(), k=TOP_K), queries)
+            print(f"  高速化: {chroma_us / numpy_us:.1f}倍")
+        except ImportError as e:
+            print(f"  Chromaが見つからないため比較を省略しました: {e}")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
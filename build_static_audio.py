@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+静的Q&Aの回答・挨拶・繰り返し質問用の前置き/締めを事前に音声化するビルドスクリプト
+
+使い方:
+    python build_static_audio.py            # 未生成のクリップだけ作成
+    python build_static_audio.py --force    # すべて作り直す
+    python build_static_audio.py --engine openai
+"""
+
+import argparse
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from config import Config
+from modules.coe_font_client import CoeFontClient
+from modules.audio_encoder import AudioEncoder
+from modules.openai_tts_client import OpenAITTSClient
+from modules.emotion_voice_params import get_emotion_voice_params
+from static_qa_data import STATIC_AUDIO_DIR, get_static_speech_items
+from modules.static_audio import StaticAudioLibrary
+
+def main():
+    parser = argparse.ArgumentParser(description='静的Q&A音声のビルド')
+    parser.add_argument('--engine', choices=['auto', 'coefont', 'openai'], default='auto',
+                        help='使用するTTSエンジン（auto: CoeFontが設定済みならCoeFont）')
+    parser.add_argument('--force', action='store_true', help='既存のクリップも作り直す')
+    args = parser.parse_args()
+
+    engine = args.engine
+    coe_font_client = None
+    if engine in ('auto', 'coefont'):
+        # オフラインのビルドなので制限時間は長めにとる
+        coe_font_client = CoeFontClient(deadline_seconds=120.0, max_retries=3)
+        if coe_font_client.is_available():
+            engine = 'coefont'
+        elif engine == 'coefont':
+            print("❌ CoeFont設定が不完全です")
+            return
+        else:
+            engine = 'openai'
+
+    if engine == 'coefont':
+        # CoeFontClient._get_emotion_params で感情パラメータが適用される
+        # 配信時と同じ形式に圧縮して保存する
+        encoder = AudioEncoder(codec=Config.COEFONT_AUDIO_CODEC, bitrate=Config.COEFONT_AUDIO_BITRATE)
+
+        def synthesize(text, emotion):
+            clip = coe_font_client.generate_clip(text, emotion)
+            return encoder.encode(clip) if clip else None
+    else:
+        tts_client = OpenAITTSClient(response_format=Config.OPENAI_TTS_FORMAT)
+        synthesize = lambda text, emotion: tts_client.generate_clip(
+            text, emotion_params=get_emotion_voice_params(emotion)
+        )
+
+    items = get_static_speech_items()
+    print(f"=== 静的音声ビルド開始: {len(items)}クリップ (エンジン: {engine}) ===")
+
+    library = StaticAudioLibrary(STATIC_AUDIO_DIR)
+    result = library.build(items, synthesize, engine, force=args.force)
+
+    print("\n=== 静的音声ビルド完了 ===")
+    print(f"生成: {result['generated']} / スキップ: {result['skipped']} / 失敗: {result['failed']}")
+    print(f"出力先: {STATIC_AUDIO_DIR}")
+
+if __name__ == "__main__":
+    main()
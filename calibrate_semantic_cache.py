@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+セマンティック回答キャッシュのしきい値の確認
+
+本番と同じ埋め込みモデル（OpenAIEmbeddings）で、言い換えの組（同じ回答を返してよい）と
+同じ話題の別の質問の組（別の回答が必要）のコサイン類似度を測り、
+SEMANTIC_CACHE_THRESHOLD で誤ヒット・取りこぼしがいくつ出るかを表示します。
+
+使い方:
+    OPENAI_API_KEY=... python calibrate_semantic_cache.py
+"""
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_openai import OpenAIEmbeddings
+from config import Config
+
+# 同じ回答を返してよい組
+PARAPHRASE_PAIRS = [
+    ("京友禅って何？", "京友禅とは何ですか？"),
+    ("京友禅について教えて", "京友禅のことを教えてください"),
+    ("糸目糊って何？", "糸目糊とはなんですか"),
+    ("友禅の工程を教えて", "友禅はどんな工程で作るの？"),
+    ("この仕事を始めたきっかけは？", "どうしてこの仕事を始めたんですか？"),
+    ("仕事のやりがいは何ですか", "この仕事のやりがいって何？"),
+    ("休みの日は何してるの", "休日は何をして過ごしていますか？"),
+    ("好きな食べ物は？", "好きな食べ物は何ですか"),
+    ("着物はどうやってお手入れするの？", "着物のお手入れ方法を教えてください"),
+    ("京友禅と加賀友禅の違いは？", "加賀友禅と京友禅はどう違うの？"),
+]
+
+# 同じ話題だが別の回答が必要な組
+DISTINCT_PAIRS = [
+    ("京友禅って何？", "京友禅の歴史を教えて"),
+    ("京友禅って何？", "京友禅はいくらくらいするの？"),
+    ("糸目糊って何？", "糸目糊は何でできているの？"),
+    ("友禅の工程を教えて", "一番難しい工程はどれ？"),
+    ("この仕事を始めたきっかけは？", "この仕事を何年続けていますか？"),
+    ("仕事のやりがいは何ですか", "仕事で大変なことは何ですか"),
+    ("休みの日は何してるの", "仕事のある日は何時に起きるの？"),
+    ("好きな食べ物は？", "嫌いな食べ物は？"),
+    ("着物はどうやってお手入れするの？", "着物はどこで買えるの？"),
+    ("京友禅と加賀友禅の違いは？", "京友禅と江戸小紋の違いは？"),
+]
+
+
+def cosine_similarities(embeddings, pairs):
+    texts = sorted({text for pair in pairs for text in pair})
+    vectors = dict(zip(texts, embeddings.embed_documents(texts)))
+    similarities = []
+    for left, right in pairs:
+        a = np.asarray(vectors[left], dtype=np.float32)
+        b = np.asarray(vectors[right], dtype=np.float32)
+        similarities.append(float(a @ b / (np.linalg.norm(a) * np.linalg.norm(b))))
+    return similarities
+
+
+def main():
+    load_dotenv()
+    embeddings = OpenAIEmbeddings()
+    threshold = Config.SEMANTIC_CACHE_THRESHOLD
+
+    paraphrase = cosine_similarities(embeddings, PARAPHRASE_PAIRS)
+    distinct = cosine_similarities(embeddings, DISTINCT_PAIRS)
+
+    print(f"=== セマンティックキャッシュのしきい値確認 (現在: {threshold}) ===")
+    print("\n■ 言い換え（ヒットしてよい）")
+    for (left, right), similarity in zip(PARAPHRASE_PAIRS, paraphrase):
+        mark = "✅" if similarity >= threshold else "・"
+        print(f"  {mark} {similarity:.4f}  {left} / {right}")
+    print("\n■ 別の質問（ヒットしてはいけない）")
+    for (left, right), similarity in zip(DISTINCT_PAIRS, distinct):
+        mark = "❌" if similarity >= threshold else "✅"
+        print(f"  {mark} {similarity:.4f}  {left} / {right}")
+
+    false_hits = sum(1 for similarity in distinct if similarity >= threshold)
+    recalled = sum(1 for similarity in paraphrase if similarity >= threshold)
+    print(f"\n誤ヒット: {false_hits}/{len(distinct)}, 言い換えのヒット: {recalled}/{len(paraphrase)}")
+    print(f"別の質問の最大類似度: {max(distinct):.4f} （しきい値はこれより高くすること）")
+
+
+if __name__ == "__main__":
+    main()
@@ -31,4 +31,96 @@ class Config:
     
     # CoeFontの設定
     COE_FONT_API_KEY = os.getenv('COE_FONT_API_KEY')
-    COE_FONT_SPEAKER_ID = os.getenv('COE_FONT_SPEAKER_ID') 
\ No newline at end of file
+    COE_FONT_SPEAKER_ID = os.getenv('COE_FONT_SPEAKER_ID')
+    
+    # 文単位TTSパイプラインの設定（回答の切り詰め長に合わせる）
+    TTS_PIPELINE_MAX_CHARS = int(os.getenv('TTS_PIPELINE_MAX_CHARS', '200'))
+    
+    # TTS音声キャッシュの設定
+    TTS_CACHE_DIR = os.getenv('TTS_CACHE_DIR', 'data/tts_cache')
+    TTS_CACHE_MEMORY_ITEMS = int(os.getenv('TTS_CACHE_MEMORY_ITEMS', '256'))
+    TTS_CACHE_MEMORY_MB = int(os.getenv('TTS_CACHE_MEMORY_MB', '64'))
+    TTS_CACHE_DISK_MB = int(os.getenv('TTS_CACHE_DISK_MB', '1024'))
+    
+    # 訪問者ごとのキャラクター内面状態の保持設定
+    CHARACTER_STATE_MAX_SESSIONS = int(os.getenv('CHARACTER_STATE_MAX_SESSIONS', '1000'))
+    CHARACTER_STATE_TTL_SECONDS = int(os.getenv('CHARACTER_STATE_TTL_SECONDS', '3600'))
+    
+    # クエリ埋め込みキャッシュの設定
+    EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', 'data/embedding_cache.npz')
+    EMBEDDING_CACHE_MAX_ITEMS = int(os.getenv('EMBEDDING_CACHE_MAX_ITEMS', '5000'))
+    
+    # セマンティック回答キャッシュの設定（類似度がしきい値以上の言い換え質問に過去の回答を返す）
+    # しきい値は calibrate_semantic_cache.py の結果で調整する
+    SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', '0.97'))
+    SEMANTIC_CACHE_TTL_SECONDS = int(os.getenv('SEMANTIC_CACHE_TTL_SECONDS', '86400'))
+    SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv('SEMANTIC_CACHE_MAX_ENTRIES', '1000'))
+    
+    # 非同期OpenAIサービスの設定（同時実行数と1呼び出しあたりのタイムアウト秒数）
+    ASYNC_OPENAI_ENABLED = os.getenv('ASYNC_OPENAI_ENABLED', 'false').lower() == 'true'
+    ASYNC_OPENAI_MAX_CHAT = int(os.getenv('ASYNC_OPENAI_MAX_CHAT', '8'))
+    ASYNC_OPENAI_MAX_TTS = int(os.getenv('ASYNC_OPENAI_MAX_TTS', '4'))
+    ASYNC_OPENAI_MAX_TRANSCRIPTION = int(os.getenv('ASYNC_OPENAI_MAX_TRANSCRIPTION', '4'))
+    ASYNC_OPENAI_CHAT_TIMEOUT = float(os.getenv('ASYNC_OPENAI_CHAT_TIMEOUT', '60'))
+    ASYNC_OPENAI_TTS_TIMEOUT = float(os.getenv('ASYNC_OPENAI_TTS_TIMEOUT', '30'))
+    ASYNC_OPENAI_TRANSCRIPTION_TIMEOUT = float(os.getenv('ASYNC_OPENAI_TRANSCRIPTION_TIMEOUT', '60'))
+    
+    # 外部API（OpenAI・CoeFont）とのコネクションプールの設定
+    HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '10'))
+    HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '20'))
+    HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '50'))
+    HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', '30'))
+    
+    # CoeFontの制限時間とリトライ（制限時間内に生成できなければOpenAI TTSにフォールバック）
+    COEFONT_DEADLINE_SECONDS = float(os.getenv('COEFONT_DEADLINE_SECONDS', '8'))
+    COEFONT_MAX_RETRIES = int(os.getenv('COEFONT_MAX_RETRIES', '2'))
+    COEFONT_CONNECT_TIMEOUT = float(os.getenv('COEFONT_CONNECT_TIMEOUT', '3'))
+    
+    # 音声認識前の無音トリミング（VAD）の設定
+    VAD_ENABLED = os.getenv('VAD_ENABLED', 'true').lower() == 'true'
+    VAD_THRESHOLD_DB = float(os.getenv('VAD_THRESHOLD_DB', '10'))
+    VAD_MIN_SPEECH_MS = int(os.getenv('VAD_MIN_SPEECH_MS', '200'))
+    VAD_MAX_PAUSE_MS = int(os.getenv('VAD_MAX_PAUSE_MS', '600'))
+    VAD_PASSTHROUGH_MAX_TRIM_MS = int(os.getenv('VAD_PASSTHROUGH_MAX_TRIM_MS', '500'))
+    
+    # 音声の受け渡し方法（binary: Socket.IOのバイナリ添付 / url: /audio/<id> から取得）
+    AUDIO_TRANSPORT = os.getenv('AUDIO_TRANSPORT', 'binary')
+    AUDIO_STORE_TTL_SECONDS = float(os.getenv('AUDIO_STORE_TTL_SECONDS', '120'))
+    AUDIO_STORE_MAX_MB = int(os.getenv('AUDIO_STORE_MAX_MB', '64'))
+    # Base64をやめたので、1メッセージの上限は録音1件分に収まる大きさで足りる
+    SOCKETIO_MAX_HTTP_BUFFER_MB = int(os.getenv('SOCKETIO_MAX_HTTP_BUFFER_MB', '10'))
+    
+    # TTS音声の出力形式（CoeFontはWAVしか返さないのでサーバー側で変換。wavを指定すると無変換）
+    COEFONT_AUDIO_CODEC = os.getenv('COEFONT_AUDIO_CODEC', 'mp3')  # mp3 / opus / aac / wav
+    COEFONT_AUDIO_BITRATE = os.getenv('COEFONT_AUDIO_BITRATE', '64k')
+    OPENAI_TTS_FORMAT = os.getenv('OPENAI_TTS_FORMAT', 'mp3')  # mp3 / opus / aac / flac / wav
+    
+    # /api/chat の会話履歴（直近の往復だけをそのまま使い、古い会話は要約する）
+    HISTORY_MAX_TURNS = int(os.getenv('HISTORY_MAX_TURNS', '6'))
+    HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', '1500'))
+    HISTORY_SUMMARY_MODEL = os.getenv('HISTORY_SUMMARY_MODEL', 'gpt-3.5-turbo')
+    HISTORY_SUMMARY_MAX_CHARS = int(os.getenv('HISTORY_SUMMARY_MAX_CHARS', '400'))
+    HISTORY_SUMMARY_BATCH_TURNS = int(os.getenv('HISTORY_SUMMARY_BATCH_TURNS', '2'))
+    
+    # 会話の保存（ライトビハインド）。この行数たまるか、この秒数経ったらまとめて書き込む
+    WRITE_BEHIND_BATCH_SIZE = int(os.getenv('WRITE_BEHIND_BATCH_SIZE', '50'))
+    WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv('WRITE_BEHIND_FLUSH_INTERVAL', '0.5'))
+    WRITE_BEHIND_MAX_RETRIES = int(os.getenv('WRITE_BEHIND_MAX_RETRIES', '5'))
+    WRITE_BEHIND_MAX_QUEUE = int(os.getenv('WRITE_BEHIND_MAX_QUEUE', '10000'))  # 超えたら古い行から破棄
+    
+    # 回答生成のモデル（gpt-4o などプロンプトキャッシュ対応モデルにすると、固定のシステムプロンプトがキャッシュされる）
+    ANSWER_MODEL = os.getenv('ANSWER_MODEL', 'gpt-4')
+    
+    # 回答プロンプトの文脈（会話・性格・専門知識・検索結果）に使うトークン数の上限
+    CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', '2500'))
+    
+    # 専門知識の検索（語彙検索とベクトル検索をRRFで統合。ベクトル検索が間に合わなければ語彙検索だけ）
+    RETRIEVAL_LEXICAL_K = int(os.getenv('RETRIEVAL_LEXICAL_K', '12'))
+    RETRIEVAL_VECTOR_K = int(os.getenv('RETRIEVAL_VECTOR_K', '4'))
+    RETRIEVAL_RRF_K = int(os.getenv('RETRIEVAL_RRF_K', '60'))
+    RETRIEVAL_MAX_RESULTS = int(os.getenv('RETRIEVAL_MAX_RESULTS', '8'))
+    RETRIEVAL_MAX_TOKENS = int(os.getenv('RETRIEVAL_MAX_TOKENS', '1200'))
+    RETRIEVAL_VECTOR_TIMEOUT = float(os.getenv('RETRIEVAL_VECTOR_TIMEOUT', '3.0'))
+    
+    # ベクトル検索の方式（numpy: 起動時・コレクション更新時にChromaの埋め込みをメモリに展開して検索 / chroma: 毎回Chromaで検索）
+    VECTOR_INDEX_MODE = os.getenv('VECTOR_INDEX_MODE', 'numpy')
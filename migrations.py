@@ -1,20 +1,41 @@
-from sqlalchemy import create_engine
-from models import Base
-from config import DATABASE_URL
+from sqlalchemy import create_engine, inspect, text
+from models import db
+from config import Config
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# create_all() は既存のテーブルに列を足さないので、後から追加した列はここでALTERする
+# (テーブル, 列, 型)
+ADDED_COLUMNS = [
+    # 会話要約（ConversationHistoryManager）
+    ('sessions', 'summary', 'TEXT'),
+    ('sessions', 'summary_until', 'TIMESTAMP'),
+    ('sessions', 'summary_updated_at', 'TIMESTAMP'),
+]
+
+def add_missing_columns(engine):
+    inspector = inspect(engine)
+    with engine.begin() as connection:
+        for table, column, column_type in ADDED_COLUMNS:
+            existing = {info['name'] for info in inspector.get_columns(table)}
+            if column not in existing:
+                logger.info(f"Adding column {table}.{column}...")
+                connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}"))
+
 def run_migrations():
     try:
-        engine = create_engine(DATABASE_URL)
+        engine = create_engine(Config.SQLALCHEMY_DATABASE_URI)
         logger.info("Creating database tables...")
-        Base.metadata.create_all(engine)
+        db.metadata.create_all(engine)
         logger.info("Database tables created successfully!")
+
+        add_missing_columns(engine)
+        logger.info("Added columns are up to date!")
     except Exception as e:
         logger.error(f"Error during migration: {e}")
         raise
 
 if __name__ == "__main__":
-    run_migrations() 
\ No newline at end of file
+    run_migrations()
@@ -14,6 +14,10 @@ class Session(db.Model):
     conversation_history = db.Column(JSON)
     language = db.Column(db.String(10), default='ja')
     relationship_style = db.Column(db.String(20), default='formal')
+    # 直近の窓より古い会話の要約と、要約に含めた最後の会話の時刻
+    summary = db.Column(db.Text)
+    summary_until = db.Column(db.DateTime)
+    summary_updated_at = db.Column(db.DateTime)
     
     emotion_history = db.relationship('EmotionHistory', backref='session', lazy=True)
 
@@ -0,0 +1,227 @@
+# modules/async_openai_service.py - AsyncOpenAIを専用イベントループで動かし、同期コードから呼び出すサービス層
+import asyncio
+import threading
+import concurrent.futures
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+from openai import AsyncOpenAI
+from .http_pool import get_async_httpx_client
+
+# eventletのmonkey_patch下でも本物のOSスレッド・セレクタでasyncioを動かす
+try:
+    import eventlet
+    from eventlet import tpool
+    _native_threading = eventlet.patcher.original('threading')
+    _native_selectors = eventlet.patcher.original('selectors')
+    EVENTLET_AVAILABLE = True
+except ImportError:
+    import selectors as _native_selectors
+    _native_threading = threading
+    tpool = None
+    EVENTLET_AVAILABLE = False
+
+# 種類ごとの同時実行数と1呼び出しあたりのタイムアウト（秒）の既定値
+DEFAULT_LIMITS = {'chat': 8, 'tts': 4, 'transcription': 4}
+DEFAULT_TIMEOUTS = {'chat': 60.0, 'tts': 30.0, 'transcription': 60.0}
+# イベントループのスレッドの起動を待つ秒数
+START_TIMEOUT = 10.0
+# run() で timeout を省略したときに、呼び出しごとのタイムアウトに足す余裕（秒）
+RUN_TIMEOUT_MARGIN = 5.0
+
+
+class AsyncOpenAIService:
+    def __init__(self, limits: Optional[Dict[str, int]] = None, timeouts: Optional[Dict[str, float]] = None):
+        """
+        非同期OpenAIサービスの初期化
+
+        イベントループは専用のOSスレッドで動かす。Flask/Socket.IOのハンドラ（eventletの
+        グリーンスレッド）からは run() / iterate() で呼び出し、待っている間はtpool経由で
+        ほかのグリーンスレッドに処理を譲る。
+
+        Args:
+            limits: 種類（chat/tts/transcription）ごとの同時実行数
+            timeouts: 種類ごとの1呼び出しあたりのタイムアウト秒数
+        """
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.timeouts = dict(DEFAULT_TIMEOUTS, **(timeouts or {}))
+        self.stats = {'calls': 0, 'timeouts': 0, 'errors': 0, 'in_flight': 0}
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[AsyncOpenAI] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._started = _native_threading.Event()
+        self._start_error: Optional[BaseException] = None
+        self._start_lock = threading.Lock()
+
+    # ---- イベントループ ----
+
+    def start(self):
+        """イベントループ用のスレッドを起動（初回呼び出し時に自動で呼ばれる）"""
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            self._started.clear()
+            self._start_error = None
+            self._loop = asyncio.SelectorEventLoop(_native_selectors.DefaultSelector())
+            thread = _native_threading.Thread(target=self._run_loop, name='async-openai', daemon=True)
+            thread.start()
+
+            # 起動に失敗したら次の呼び出しでやり直せるようにループを捨てる
+            if not self._started.wait(START_TIMEOUT) or self._start_error is not None:
+                error = self._start_error or TimeoutError(f"イベントループが{START_TIMEOUT}秒以内に起動しませんでした")
+                loop, self._loop = self._loop, None
+                if self._start_error is None:
+                    loop.call_soon_threadsafe(loop.stop)
+                print(f"❌ AsyncOpenAIServiceの起動に失敗しました: {error}")
+                raise error
+        print(f"⚡ AsyncOpenAIService起動完了 (同時実行数: {self.limits})")
+
+    def _run_loop(self):
+        loop = self._loop
+        asyncio.set_event_loop(loop)
+        try:
+            # クライアントとセマフォはループのスレッドで作る（ループに紐づくため）
+            self._client = AsyncOpenAI(http_client=get_async_httpx_client())
+            self._semaphores = {kind: asyncio.Semaphore(limit) for kind, limit in self.limits.items()}
+        except BaseException as e:
+            self._start_error = e
+        finally:
+            self._started.set()
+        if self._start_error is not None:
+            loop.close()
+            return
+        loop.run_forever()
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """
+        コルーチンをサービスのループで実行し、結果を同期的に返す
+
+        timeout を省略した場合も、最長の呼び出しタイムアウトに余裕を足した秒数で打ち切る。
+        """
+        if self._loop is None:
+            try:
+                self.start()
+            except BaseException:
+                coro.close()
+                raise
+        if timeout is None:
+            timeout = max(self.timeouts.values()) + RUN_TIMEOUT_MARGIN
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            if EVENTLET_AVAILABLE:
+                # 待機はネイティブスレッドプールで行い、グリーンスレッドをブロックしない
+                return tpool.execute(future.result, timeout)
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self.stats['timeouts'] += 1
+            raise
+
+    def iterate(self, agen: AsyncIterator) -> Iterator:
+        """非同期イテレータを同期ジェネレータとして消費"""
+        try:
+            while True:
+                try:
+                    yield self.run(agen.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            # 途中で打ち切られた場合もストリームを閉じる
+            if hasattr(agen, 'aclose'):
+                try:
+                    self.run(agen.aclose())
+                except Exception:
+                    pass
+
+    async def _call(self, kind: str, coro):
+        """同時実行数とタイムアウトを適用して呼び出す"""
+        async with self._semaphores[kind]:
+            self.stats['calls'] += 1
+            self.stats['in_flight'] += 1
+            try:
+                return await asyncio.wait_for(coro, self.timeouts[kind])
+            except asyncio.TimeoutError:
+                self.stats['timeouts'] += 1
+                print(f"⏱️ OpenAI呼び出しがタイムアウトしました ({kind}, {self.timeouts[kind]}秒)")
+                raise
+            except Exception:
+                self.stats['errors'] += 1
+                raise
+            finally:
+                self.stats['in_flight'] -= 1
+
+    # ---- 非同期API ----
+
+    async def achat(self, usage_sink: Optional[Dict] = None, **kwargs) -> str:
+        """チャット補完を実行し、回答テキストを返す（usage_sink を渡すとトークン使用量を書き込む）"""
+        response = await self._call('chat', self._client.chat.completions.create(**kwargs))
+        if usage_sink is not None and response.usage is not None:
+            usage_sink['usage'] = response.usage
+        return response.choices[0].message.content
+
+    async def astream_chat(self, usage_sink: Optional[Dict] = None, **kwargs) -> AsyncIterator[str]:
+        """
+        チャット補完をストリーミングで実行し、テキスト断片を順に返す
+
+        usage_sink を渡すと、最後のチャンクで届くトークン使用量を書き込む
+        （stream_options.include_usage を付けて呼んだ場合）。
+        """
+        async with self._semaphores['chat']:
+            self.stats['calls'] += 1
+            self.stats['in_flight'] += 1
+            try:
+                stream = await asyncio.wait_for(
+                    self._client.chat.completions.create(stream=True, **kwargs),
+                    self.timeouts['chat']
+                )
+                iterator = stream.__aiter__()
+                while True:
+                    # 断片の間隔にもタイムアウトを適用（途中で止まったストリームを待ち続けない）
+                    try:
+                        chunk = await asyncio.wait_for(iterator.__anext__(), self.timeouts['chat'])
+                    except StopAsyncIteration:
+                        break
+                    usage = getattr(chunk, 'usage', None)
+                    if usage_sink is not None and usage is not None:
+                        usage_sink['usage'] = usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        yield delta
+            except asyncio.TimeoutError:
+                self.stats['timeouts'] += 1
+                print(f"⏱️ OpenAIストリーミングがタイムアウトしました ({self.timeouts['chat']}秒)")
+                raise
+            except Exception:
+                self.stats['errors'] += 1
+                raise
+            finally:
+                self.stats['in_flight'] -= 1
+
+    async def aspeech(self, **kwargs) -> bytes:
+        """音声合成を実行し、音声バイト列を返す"""
+        response = await self._call('tts', self._client.audio.speech.create(**kwargs))
+        return response.content
+
+    async def atranscribe(self, **kwargs) -> str:
+        """音声認識を実行し、テキストを返す"""
+        transcript = await self._call('transcription', self._client.audio.transcriptions.create(**kwargs))
+        return transcript if isinstance(transcript, str) else getattr(transcript, 'text', str(transcript))
+
+    # ---- 同期アダプタ（Flask/Socket.IOハンドラ用） ----
+
+    def chat(self, usage_sink: Optional[Dict] = None, **kwargs) -> str:
+        return self.run(self.achat(usage_sink, **kwargs))
+
+    def stream_chat(self, usage_sink: Optional[Dict] = None, **kwargs) -> Iterator[str]:
+        return self.iterate(self.astream_chat(usage_sink, **kwargs))
+
+    def speech(self, **kwargs) -> bytes:
+        return self.run(self.aspeech(**kwargs))
+
+    def transcribe(self, **kwargs) -> str:
+        return self.run(self.atranscribe(**kwargs))
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats, limits=self.limits)
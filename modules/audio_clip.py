@@ -0,0 +1,75 @@
+# modules/audio_clip.py - TTS音声を形式・長さ・サイズと一緒に扱う音声オブジェクト
+from typing import Dict, Optional
+
+from .audio_probe import probe_bytes
+
+# コーデック（またはコンテナ）とMIMEタイプ・拡張子の対応
+CODEC_MIMES = {
+    'wav': 'audio/wav',
+    'mp3': 'audio/mpeg',
+    'opus': 'audio/ogg',
+    'vorbis': 'audio/ogg',
+    'aac': 'audio/aac',
+    'flac': 'audio/flac',
+}
+MIME_EXTENSIONS = {
+    'audio/wav': 'wav',
+    'audio/mp3': 'mp3',
+    'audio/mpeg': 'mp3',
+    'audio/ogg': 'ogg',
+    'audio/webm': 'webm',
+    'audio/aac': 'aac',
+    'audio/flac': 'flac',
+}
+EXTENSION_MIMES = {
+    'wav': 'audio/wav',
+    'mp3': 'audio/mpeg',
+    'ogg': 'audio/ogg',
+    'webm': 'audio/webm',
+    'aac': 'audio/aac',
+    'flac': 'audio/flac',
+}
+
+
+class AudioClip:
+    """音声データとそのコーデック・MIMEタイプ・長さ（秒、不明ならNone）"""
+
+    __slots__ = ('data', 'codec', 'mime', 'duration')
+
+    def __init__(self, data: bytes, codec: str, mime: Optional[str] = None, duration: Optional[float] = None):
+        self.data = data
+        self.codec = codec
+        self.mime = mime or CODEC_MIMES.get(codec, 'application/octet-stream')
+        self.duration = duration
+
+    @classmethod
+    def from_bytes(cls, data: bytes, mime: Optional[str] = None) -> 'AudioClip':
+        """ヘッダーを解析してコーデックと長さを埋める（判定できなければMIMEタイプから推定）"""
+        info = probe_bytes(data) if data else None
+        # ADTS(AAC)はMP3と同期ワードが似ているため、MIMEタイプと食い違う判定は採用しない
+        if info and (mime is None or MIME_EXTENSIONS.get(mime) == MIME_EXTENSIONS.get(info['mime'])):
+            codec = info.get('codec') or info['format']
+            return cls(data, codec, mime or info['mime'], info['duration'])
+        codec = MIME_EXTENSIONS.get(mime, 'unknown')
+        return cls(data, codec, mime)
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    @property
+    def extension(self) -> str:
+        """保存時の拡張子"""
+        return MIME_EXTENSIONS.get(self.mime, 'bin')
+
+    def describe(self) -> Dict:
+        """ログ・統計用のメタデータ（音声データ本体は含まない）"""
+        return {
+            'codec': self.codec,
+            'mime': self.mime,
+            'duration': round(self.duration, 2) if self.duration is not None else None,
+            'size': self.size,
+        }
+
+    def __repr__(self) -> str:
+        return f"AudioClip(codec={self.codec!r}, size={self.size}, duration={self.duration})"
@@ -0,0 +1,88 @@
+# modules/audio_encoder.py - WAVしか返さないTTSエンジン向けのサーバー側エンコード（FFmpegのパイプ）
+import time
+import subprocess
+from typing import Dict
+
+from .audio_clip import AudioClip, CODEC_MIMES
+from .speech_processor import FFMPEG_AVAILABLE
+
+# 出力コーデックごとの (FFmpegのエンコーダ, 出力コンテナ)
+ENCODERS = {
+    'mp3': ('libmp3lame', 'mp3'),
+    'opus': ('libopus', 'ogg'),
+    'aac': ('aac', 'adts'),
+}
+
+
+class AudioEncoder:
+    def __init__(self, codec: str = 'mp3', bitrate: str = '64k', timeout_seconds: float = 10.0):
+        """
+        音声エンコーダの初期化
+
+        Args:
+            codec: 出力コーデック（mp3 / opus / aac。wavなど対象外の値なら変換しない）
+            bitrate: 出力ビットレート（FFmpegの -b:a 形式。例: 64k）
+            timeout_seconds: 1回のエンコードの制限時間（超えたら元の音声を使う）
+        """
+        self.codec = codec
+        self.bitrate = bitrate
+        self.timeout_seconds = timeout_seconds
+        self.enabled = codec in ENCODERS and FFMPEG_AVAILABLE
+        self.stats = {'encoded': 0, 'failures': 0, 'source_bytes': 0, 'output_bytes': 0, 'encode_ms_total': 0.0}
+
+        if codec in ENCODERS and not FFMPEG_AVAILABLE:
+            print(f"⚠️ FFmpegが利用できないため、TTS音声を{codec}に変換できません（WAVのまま送信）")
+
+    @property
+    def params(self) -> Dict:
+        """キャッシュキーに含める出力設定（設定を変えたら別の音声として扱う）"""
+        if not self.enabled:
+            return {}
+        return {'codec': self.codec, 'bitrate': self.bitrate}
+
+    def encode(self, clip: AudioClip) -> AudioClip:
+        """音声を設定したコーデックに変換（変換不要・失敗時は元の音声を返す）"""
+        if not self.enabled or clip.codec == self.codec:
+            return clip
+
+        encoder, container = ENCODERS[self.codec]
+        start_time = time.time()
+        try:
+            result = subprocess.run([
+                'ffmpeg',
+                '-loglevel', 'error',
+                '-i', 'pipe:0',
+                '-vn',
+                '-c:a', encoder,
+                '-b:a', self.bitrate,
+                '-f', container,
+                'pipe:1'
+            ], input=clip.data, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                timeout=self.timeout_seconds, check=False)
+        except (subprocess.SubprocessError, OSError) as e:
+            print(f"❌ TTS音声のエンコードエラー: {e}")
+            self.stats['failures'] += 1
+            return clip
+
+        if result.returncode != 0 or not result.stdout:
+            print(f"❌ TTS音声のエンコードに失敗しました: {result.stderr.decode('utf-8', 'ignore').strip()}")
+            self.stats['failures'] += 1
+            return clip
+
+        elapsed_ms = (time.time() - start_time) * 1000
+        encoded = AudioClip.from_bytes(result.stdout, CODEC_MIMES[self.codec])
+        if encoded.duration is None:
+            encoded.duration = clip.duration
+
+        self.stats['encoded'] += 1
+        self.stats['source_bytes'] += clip.size
+        self.stats['output_bytes'] += encoded.size
+        self.stats['encode_ms_total'] += elapsed_ms
+        print(f"🗜️ TTS音声を{self.codec}に変換: {clip.size // 1024}KB → {encoded.size // 1024}KB ({elapsed_ms:.0f}ms)")
+        return encoded
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats, codec=self.codec, bitrate=self.bitrate, enabled=self.enabled)
+        if self.stats['source_bytes']:
+            stats['compression_ratio'] = round(self.stats['output_bytes'] / self.stats['source_bytes'], 3)
+        return stats
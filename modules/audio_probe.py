@@ -0,0 +1,433 @@
+# modules/audio_probe.py - ヘッダー解析による音声フォーマット・長さの判定（ffprobe不要）
+import base64
+import binascii
+import struct
+from typing import Dict, Optional, Tuple
+
+# 解析に使う先頭・末尾のバイト数（これ以上は読まない）
+PROBE_HEAD_BYTES = 64 * 1024
+PROBE_TAIL_BYTES = 64 * 1024
+
+FORMAT_MIMES = {
+    'wav': 'audio/wav',
+    'webm': 'audio/webm',
+    'ogg': 'audio/ogg',
+    'mp3': 'audio/mpeg',
+    'm4a': 'audio/mp4',
+}
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """先頭バイトから音声コンテナを判定（判定できなければNone）"""
+    if len(head) < 12:
+        return None
+    if head[:4] == b'\x1a\x45\xdf\xa3':
+        return 'webm'  # EBML（WebM/Matroska）
+    if head[:4] == b'OggS':
+        return 'ogg'
+    if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+        return 'wav'
+    # ADTS(AAC)も同期ワードが同じだが、レイヤーのビットが00なのでMPEGフレームとは区別できる
+    if head[:3] == b'ID3' or (head[0] == 0xFF and (head[1] & 0xE0) == 0xE0 and (head[1] & 0x06) != 0):
+        return 'mp3'  # ID3タグ、またはMPEGフレーム同期
+    if head[4:8] == b'ftyp':
+        return 'm4a'  # MP4/M4A
+    return None
+
+
+def probe_audio(head: bytes, tail: bytes = b'', total_size: Optional[int] = None) -> Optional[Dict]:
+    """
+    先頭（と末尾）のバイト列から音声の情報を取得
+
+    Args:
+        head: データの先頭（PROBE_HEAD_BYTES程度）
+        tail: データの末尾（WebM・Oggの長さの算出に使う。全体が head に収まるなら空でよい）
+        total_size: データ全体のバイト数（WAV・MP3の長さの算出に使う）
+
+    Returns:
+        format, mime, duration（秒）, sample_rate, channels, size。
+        判定できない項目はNone。フォーマット自体が不明ならNone。
+    """
+    head = bytes(head[:PROBE_HEAD_BYTES])
+    tail = bytes(tail[-PROBE_TAIL_BYTES:]) if tail else head
+    total_size = len(head) if total_size is None else total_size
+
+    audio_format = sniff_format(head)
+    if not audio_format:
+        return None
+
+    info = {
+        'format': audio_format,
+        'mime': FORMAT_MIMES[audio_format],
+        'duration': None,
+        'sample_rate': None,
+        'channels': None,
+        'size': total_size,
+    }
+    parser = _PARSERS[audio_format]
+    try:
+        info.update(parser(head, tail, total_size))
+    except (struct.error, IndexError, ValueError):
+        # ヘッダーが途中で切れている・壊れている場合はわかった範囲だけ返す
+        pass
+    return info
+
+
+def probe_bytes(data) -> Optional[Dict]:
+    """バイト列（bytes/memoryview）全体から必要な範囲だけを読んで解析"""
+    view = memoryview(data)
+    return probe_audio(view[:PROBE_HEAD_BYTES], view[-PROBE_TAIL_BYTES:], len(view))
+
+
+def probe_base64(audio_base64: str) -> Optional[Dict]:
+    """Base64文字列の先頭・末尾だけをデコードして解析（全体はデコードしない）"""
+    if audio_base64.startswith('data:'):
+        audio_base64 = audio_base64.split(',', 1)[1]
+    audio_base64 = audio_base64.strip()
+
+    try:
+        head = _decode_base64_range(audio_base64, PROBE_HEAD_BYTES, from_end=False)
+        tail = _decode_base64_range(audio_base64, PROBE_TAIL_BYTES, from_end=True)
+    except (binascii.Error, ValueError):
+        return None
+    return probe_audio(head, tail, base64_decoded_size(audio_base64))
+
+
+def base64_decoded_size(audio_base64: str) -> int:
+    """デコードせずにBase64のデコード後サイズを求める"""
+    length = len(audio_base64)
+    padding = audio_base64[-2:].count('=') if length >= 2 else 0
+    return length * 3 // 4 - padding
+
+
+def _decode_base64_range(audio_base64: str, n_bytes: int, from_end: bool) -> bytes:
+    """Base64の先頭または末尾から n_bytes 分だけデコード（4文字単位で切り出す）"""
+    n_chars = (n_bytes + 2) // 3 * 4
+    if n_chars >= len(audio_base64):
+        return base64.b64decode(audio_base64)
+    if from_end:
+        # 末尾は全体の長さが4の倍数であることを前提に、4文字境界から切り出す
+        start = len(audio_base64) - n_chars
+        start -= start % 4
+        return base64.b64decode(audio_base64[start:])
+    return base64.b64decode(audio_base64[:n_chars])
+
+
+# ---- WAV ----
+
+def _parse_wav(head: bytes, tail: bytes, total_size: int) -> Dict:
+    result = {}
+    pos = 12
+    byte_rate = None
+    while pos + 8 <= len(head):
+        chunk_id = head[pos:pos + 4]
+        chunk_size = struct.unpack_from('<I', head, pos + 4)[0]
+        body = pos + 8
+        if chunk_id == b'fmt ':
+            channels, sample_rate, byte_rate = struct.unpack_from('<HII', head, body + 2)
+            result.update(sample_rate=sample_rate, channels=channels)
+        elif chunk_id == b'data':
+            # ストリーミング録音ではサイズが未確定（0や0xFFFFFFFF）のことがあるので実サイズで補う
+            data_size = chunk_size
+            if not data_size or data_size == 0xFFFFFFFF or body + data_size > total_size:
+                data_size = total_size - body
+            if byte_rate:
+                result['duration'] = data_size / byte_rate
+            break
+        pos = body + chunk_size + (chunk_size & 1)
+    return result
+
+
+# ---- WebM（EBML） ----
+
+EBML_HEADER = 0x1A45DFA3
+EBML_SEGMENT = 0x18538067
+EBML_INFO = 0x1549A966
+EBML_TRACKS = 0x1654AE6B
+EBML_TRACK_ENTRY = 0xAE
+EBML_AUDIO = 0xE1
+EBML_CLUSTER = 0x1F43B675
+EBML_BLOCK_GROUP = 0xA0
+EBML_TIMECODE_SCALE = 0x2AD7B1
+EBML_DURATION = 0x4489
+EBML_SAMPLING_FREQUENCY = 0xB5
+EBML_CHANNELS = 0x9F
+EBML_CODEC_ID = 0x86
+EBML_CLUSTER_TIMECODE = 0xE7
+EBML_SIMPLE_BLOCK = 0xA3
+EBML_BLOCK = 0xA1
+EBML_UNKNOWN_SIZE = -1
+
+# 子要素を読むために中に入る要素
+EBML_MASTERS = {EBML_SEGMENT, EBML_INFO, EBML_TRACKS, EBML_TRACK_ENTRY, EBML_AUDIO}
+
+
+def _read_vint(data: bytes, pos: int, keep_marker: bool) -> Tuple[int, int]:
+    """EBMLの可変長整数を読む（IDはマーカービットを残し、サイズは取り除く）"""
+    first = data[pos]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        length += 1
+        mask >>= 1
+    if length > 8:
+        raise ValueError('invalid EBML varint')
+    if pos + length > len(data):
+        raise IndexError('truncated EBML varint')
+
+    value = first if keep_marker else first & (mask - 1)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        value = EBML_UNKNOWN_SIZE
+    return value, pos + length
+
+
+def _read_uint(data: bytes) -> int:
+    return int.from_bytes(data, 'big')
+
+
+def _read_float(data: bytes) -> float:
+    return struct.unpack('>f' if len(data) == 4 else '>d', data)[0]
+
+
+def _parse_webm(head: bytes, tail: bytes, total_size: int) -> Dict:
+    result = {}
+    timecode_scale = 1000000  # 既定値は1ms
+    duration_ticks = None
+
+    pos = 0
+    while pos < len(head):
+        element_id, pos = _read_vint(head, pos, keep_marker=True)
+        size, pos = _read_vint(head, pos, keep_marker=False)
+
+        if element_id == EBML_CLUSTER:
+            break
+        if element_id in EBML_MASTERS:
+            continue  # 子要素へ
+        if size == EBML_UNKNOWN_SIZE or pos + size > len(head):
+            break
+
+        value = head[pos:pos + size]
+        if element_id == EBML_TIMECODE_SCALE:
+            timecode_scale = _read_uint(value)
+        elif element_id == EBML_DURATION:
+            duration_ticks = _read_float(value)
+        elif element_id == EBML_SAMPLING_FREQUENCY:
+            result['sample_rate'] = int(_read_float(value))
+        elif element_id == EBML_CHANNELS:
+            result['channels'] = _read_uint(value)
+        elif element_id == EBML_CODEC_ID:
+            result['codec'] = value.decode('ascii', 'ignore')
+        pos += size
+
+    if duration_ticks:
+        result['duration'] = duration_ticks * timecode_scale / 1e9
+    else:
+        # MediaRecorderの録音はDurationを持たないので、末尾のクラスタの最後のブロック時刻から求める
+        last_ticks = _last_block_timecode(tail)
+        if last_ticks is not None:
+            result['duration'] = last_ticks * timecode_scale / 1e9
+    return result
+
+
+def _last_block_timecode(tail: bytes) -> Optional[int]:
+    """末尾にある最後のクラスタを探し、その中の最後のブロックの時刻を返す"""
+    marker = EBML_CLUSTER.to_bytes(4, 'big')
+    search_end = len(tail)
+    while True:
+        start = tail.rfind(marker, 0, search_end)
+        if start < 0:
+            return None
+        try:
+            ticks = _scan_cluster(tail, start)
+        except (IndexError, ValueError, struct.error):
+            ticks = None
+        if ticks is not None:
+            return ticks
+        # ブロックデータ中の偶然の一致だったので、さらに前を探す
+        search_end = start
+
+
+def _scan_cluster(data: bytes, start: int) -> Optional[int]:
+    _, pos = _read_vint(data, start, keep_marker=True)
+    _, pos = _read_vint(data, pos, keep_marker=False)
+
+    # クラスタの最初の子要素は時刻（Timecode）
+    element_id, pos = _read_vint(data, pos, keep_marker=True)
+    if element_id != EBML_CLUSTER_TIMECODE:
+        return None
+    size, pos = _read_vint(data, pos, keep_marker=False)
+    cluster_ticks = _read_uint(data[pos:pos + size])
+    pos += size
+
+    last_ticks = cluster_ticks
+    while pos < len(data):
+        element_id, pos = _read_vint(data, pos, keep_marker=True)
+        size, pos = _read_vint(data, pos, keep_marker=False)
+        if element_id == EBML_BLOCK_GROUP:
+            continue  # 子要素のBlockへ
+        if size == EBML_UNKNOWN_SIZE or pos + size > len(data):
+            break
+        if element_id in (EBML_SIMPLE_BLOCK, EBML_BLOCK):
+            # トラック番号（可変長）の後に、クラスタ時刻からの相対時刻（符号付き16bit）
+            _, block_pos = _read_vint(data, pos, keep_marker=False)
+            relative = struct.unpack_from('>h', data, block_pos)[0]
+            last_ticks = cluster_ticks + relative
+        elif element_id == EBML_CLUSTER:
+            break
+        pos += size
+    return last_ticks
+
+
+# ---- Ogg（Opus/Vorbis） ----
+
+OPUS_GRANULE_RATE = 48000
+
+
+def _parse_ogg(head: bytes, tail: bytes, total_size: int) -> Dict:
+    result = {}
+    n_segments = head[26]
+    payload = head[27 + n_segments:]
+
+    pre_skip = 0
+    granule_rate = None
+    if payload.startswith(b'OpusHead'):
+        channels = payload[9]
+        pre_skip, input_rate = struct.unpack_from('<HI', payload, 10)
+        result.update(codec='opus', channels=channels, sample_rate=input_rate or OPUS_GRANULE_RATE)
+        granule_rate = OPUS_GRANULE_RATE
+    elif payload.startswith(b'\x01vorbis'):
+        channels = payload[11]
+        sample_rate = struct.unpack_from('<I', payload, 12)[0]
+        result.update(codec='vorbis', channels=channels, sample_rate=sample_rate)
+        granule_rate = sample_rate
+
+    if granule_rate:
+        granule = _last_granule_position(tail)
+        if granule is not None:
+            result['duration'] = max(0, granule - pre_skip) / granule_rate
+    return result
+
+
+def _last_granule_position(tail: bytes) -> Optional[int]:
+    """末尾のOggページからグラニュール位置（サンプル数）を取得"""
+    search_end = len(tail)
+    while True:
+        start = tail.rfind(b'OggS', 0, search_end)
+        if start < 0 or start + 14 > len(tail):
+            return None
+        granule = struct.unpack_from('<q', tail, start + 6)[0]
+        if granule >= 0:
+            return granule
+        search_end = start
+
+
+# ---- MP3 ----
+
+MP3_BITRATES = {
+    # (MPEG-1か, レイヤー) → ビットレート表（kbps、インデックス1〜14）
+    (True, 1): [32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MP3_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG-1
+    2: [22050, 24000, 16000],  # MPEG-2
+    0: [11025, 12000, 8000],   # MPEG-2.5
+}
+
+
+def _parse_mp3_header(data: bytes, pos: int) -> Optional[Dict]:
+    if pos + 4 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0:
+        return None
+    version_bits = (data[pos + 1] >> 3) & 0x03
+    layer_bits = (data[pos + 1] >> 1) & 0x03
+    bitrate_index = data[pos + 2] >> 4
+    rate_index = (data[pos + 2] >> 2) & 0x03
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    mpeg1 = version_bits == 3
+    layer = 4 - layer_bits
+    sample_rate = MP3_SAMPLE_RATES[version_bits][rate_index]
+    if layer == 1:
+        samples_per_frame = 384
+    elif layer == 2 or mpeg1:
+        samples_per_frame = 1152
+    else:
+        samples_per_frame = 576
+    return {
+        'mpeg1': mpeg1,
+        'bitrate': MP3_BITRATES[(mpeg1, layer)][bitrate_index - 1] * 1000,
+        'sample_rate': sample_rate,
+        'channels': 1 if (data[pos + 3] >> 6) == 3 else 2,
+        'samples_per_frame': samples_per_frame,
+    }
+
+
+def _parse_mp3(head: bytes, tail: bytes, total_size: int) -> Dict:
+    pos = 0
+    if head[:3] == b'ID3':
+        # ID3v2タグのサイズは7bitずつのsynchsafe整数
+        tag_size = 0
+        for byte in head[6:10]:
+            tag_size = (tag_size << 7) | (byte & 0x7F)
+        pos = 10 + tag_size
+
+    # 最初の正しいフレームヘッダーを探す
+    frame = None
+    while pos + 4 <= len(head):
+        frame = _parse_mp3_header(head, pos)
+        if frame:
+            break
+        pos += 1
+    if not frame:
+        return {}
+
+    result = {'sample_rate': frame['sample_rate'], 'channels': frame['channels'], 'codec': 'mp3'}
+
+    # VBRの場合はXing/Info・VBRIヘッダーの総フレーム数から求める
+    side_info = (32 if frame['channels'] == 2 else 17) if frame['mpeg1'] else (17 if frame['channels'] == 2 else 9)
+    xing = pos + 4 + side_info
+    frame_count = None
+    if head[xing:xing + 4] in (b'Xing', b'Info'):
+        flags = struct.unpack_from('>I', head, xing + 4)[0]
+        if flags & 0x01:
+            frame_count = struct.unpack_from('>I', head, xing + 8)[0]
+    elif head[pos + 36:pos + 40] == b'VBRI':
+        frame_count = struct.unpack_from('>I', head, pos + 36 + 14)[0]
+
+    if frame_count:
+        result['duration'] = frame_count * frame['samples_per_frame'] / frame['sample_rate']
+    else:
+        # CBRとみなしてサイズとビットレートから推定
+        result['duration'] = (total_size - pos) * 8 / frame['bitrate']
+    return result
+
+
+# ---- MP4/M4A ----
+
+def _parse_mp4(head: bytes, tail: bytes, total_size: int) -> Dict:
+    # moovが先頭側にある場合だけ、mvhdの時間単位と長さから求める
+    pos = head.find(b'mvhd')
+    if pos < 0:
+        return {}
+    version = head[pos + 4]
+    if version == 1:
+        timescale, duration = struct.unpack_from('>IQ', head, pos + 4 + 4 + 16)
+    else:
+        timescale, duration = struct.unpack_from('>II', head, pos + 4 + 4 + 8)
+    return {'duration': duration / timescale} if timescale else {}
+
+
+_PARSERS = {
+    'wav': _parse_wav,
+    'webm': _parse_webm,
+    'ogg': _parse_ogg,
+    'mp3': _parse_mp3,
+    'm4a': _parse_mp4,
+}
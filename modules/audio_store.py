@@ -0,0 +1,88 @@
+# modules/audio_store.py - /audio/<id> で配信する短命な音声の一時保管（メモリLRU + TTL）
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class AudioStore:
+    def __init__(self, ttl_seconds: float = 120.0, max_items: int = 256, max_bytes: int = 64 * 1024 * 1024):
+        """
+        音声一時保管の初期化
+
+        Socket.IOでバイナリを送れないクライアント向けに、TTS音声や録音を短時間だけ
+        保持してHTTPで受け渡す。期限切れ・上限超過のものは古い順に捨てる。
+
+        Args:
+            ttl_seconds: 1件を保持する秒数
+            max_items: 保持する最大件数
+            max_bytes: 保持する最大バイト数
+        """
+        self.ttl_seconds = ttl_seconds
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.stats = {'stored': 0, 'served': 0, 'expired': 0, 'evicted': 0}
+
+        self._items: "OrderedDict[str, Tuple[float, str, bytes]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, mime_type: str, audio_bytes: bytes) -> Optional[str]:
+        """音声を保管し、取り出し用のIDを返す（大きすぎる場合はNone）"""
+        size = len(audio_bytes)
+        if not size or size > self.max_bytes:
+            return None
+
+        audio_id = uuid.uuid4().hex
+        with self._lock:
+            self._purge_expired()
+            self._items[audio_id] = (time.monotonic() + self.ttl_seconds, mime_type, bytes(audio_bytes))
+            self._bytes += size
+            while self._items and (len(self._items) > self.max_items or self._bytes > self.max_bytes):
+                _, (_, _, evicted) = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.stats['evicted'] += 1
+            self.stats['stored'] += 1
+        return audio_id
+
+    def get(self, audio_id: str) -> Optional[Tuple[str, bytes]]:
+        """IDから (MIMEタイプ, バイト列) を取得（期限切れ・不明ならNone）"""
+        with self._lock:
+            entry = self._items.get(audio_id)
+            if not entry:
+                return None
+            expires_at, mime_type, audio_bytes = entry
+            if expires_at < time.monotonic():
+                self._discard(audio_id)
+                self.stats['expired'] += 1
+                return None
+            self.stats['served'] += 1
+            return mime_type, audio_bytes
+
+    def pop(self, audio_id: str) -> Optional[Tuple[str, bytes]]:
+        """IDから取得して保管から外す（アップロードされた録音は一度しか使わない）"""
+        audio = self.get(audio_id)
+        if audio:
+            with self._lock:
+                self._discard(audio_id)
+        return audio
+
+    def _discard(self, audio_id: str):
+        entry = self._items.pop(audio_id, None)
+        if entry:
+            self._bytes -= len(entry[2])
+
+    def _purge_expired(self):
+        """期限切れのものを先頭（古い順）から捨てる"""
+        now = time.monotonic()
+        while self._items:
+            audio_id, (expires_at, _, _) = next(iter(self._items.items()))
+            if expires_at >= now:
+                break
+            self._discard(audio_id)
+            self.stats['expired'] += 1
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return dict(self.stats, items=len(self._items), bytes=self._bytes)
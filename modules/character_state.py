@@ -0,0 +1,109 @@
+# modules/character_state.py - セッションごとのキャラクター内面状態とその保管庫
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Optional
+
+# 深層心理状態の初期値（0-100）
+DEFAULT_MENTAL_STATE = {
+    'energy_level': 80,        # エネルギーレベル
+    'stress_level': 20,        # ストレスレベル
+    'openness': 70,            # 心の開放度
+    'patience': 90,            # 忍耐力
+    'creativity': 85,          # 創造性
+    'loneliness': 30,          # 寂しさ
+    'work_satisfaction': 90,   # 仕事への満足度
+    'physical_fatigue': 20,    # 身体的疲労
+    'fatigue_expressed_count': 0  # 疲労表現の回数
+}
+
+
+class CharacterState:
+    """1セッション分の深層心理状態と感情履歴（__slots__で小さく保つ）"""
+
+    __slots__ = tuple(DEFAULT_MENTAL_STATE) + ('emotion_history', 'current_emotion', 'last_access')
+
+    def __init__(self):
+        for key, value in DEFAULT_MENTAL_STATE.items():
+            setattr(self, key, value)
+        self.emotion_history = deque(maxlen=10)  # 最新10個の感情を記録
+        self.current_emotion = 'neutral'
+        self.last_access = time.monotonic()
+
+    # 既存コードの mental_states['energy_level'] 形式のアクセスに対応
+    def __getitem__(self, key):
+        if key not in DEFAULT_MENTAL_STATE:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in DEFAULT_MENTAL_STATE:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        return getattr(self, key) if key in DEFAULT_MENTAL_STATE else default
+
+    def as_dict(self) -> Dict:
+        """深層心理状態を辞書で取得（レスポンス・ログ用）"""
+        return {key: getattr(self, key) for key in DEFAULT_MENTAL_STATE}
+
+
+class CharacterStateStore:
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        ttl_seconds: int = 3600,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        """
+        セッション状態の保管庫（LRU + TTLで上限を保つ）
+
+        Args:
+            max_sessions: 保持する最大セッション数（超えたら最も古く使われたものから破棄）
+            ttl_seconds: 最終アクセスからこの秒数が経ったセッションは破棄
+            clock: 現在時刻（秒）を返す関数（テストで差し替える）
+        """
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._states: "OrderedDict[str, CharacterState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> CharacterState:
+        """セッションの状態を取得（なければ初期状態で作成）"""
+        now = self.clock()
+        with self._lock:
+            self._evict_expired(now)
+
+            state = self._states.get(session_id)
+            if state is None:
+                state = CharacterState()
+                self._states[session_id] = state
+                while len(self._states) > self.max_sessions:
+                    self._states.popitem(last=False)
+            else:
+                self._states.move_to_end(session_id)
+
+            state.last_access = now
+            return state
+
+    def peek(self, session_id: str) -> Optional[CharacterState]:
+        """状態を作成・更新せずに参照"""
+        with self._lock:
+            return self._states.get(session_id)
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._states.pop(session_id, None)
+
+    def _evict_expired(self, now: float):
+        """TTLを過ぎたセッションを古い順に破棄（LRU順なので先頭だけ見ればよい）"""
+        while self._states:
+            session_id, state = next(iter(self._states.items()))
+            if now - state.last_access < self.ttl_seconds:
+                break
+            self._states.popitem(last=False)
+
+    def __len__(self):
+        return len(self._states)
@@ -3,14 +3,39 @@ import os
 import hmac
 import hashlib
 import json
-import requests
 import base64
+import time
+import random
+import requests
 from datetime import datetime, timezone
 from typing import Optional
+from .http_pool import get_requests_session
+from .audio_clip import AudioClip
+
+# リトライ対象のHTTPステータス（サーバー側の一時的なエラー）
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+# 1回の試行に最低限必要な残り時間（秒）。これを切ったら諦めてフォールバックさせる
+MIN_ATTEMPT_SECONDS = 1.0
+# text2speechの出力形式（WAVで受け取り、圧縮は呼び出し側のAudioEncoderで行う）
+OUTPUT_FORMAT = 'wav'
 
 class CoeFontClient:
-    def __init__(self):
-        """CoeFontクライアントの初期化"""
+    def __init__(self, deadline_seconds: float = 10.0, max_retries: int = 2, connect_timeout: float = 3.0, backoff_seconds: float = 0.3):
+        """
+        CoeFontクライアントの初期化
+        
+        Args:
+            deadline_seconds: 1回の音声生成（POST + リダイレクト先の取得）全体の制限時間
+            max_retries: 5xx・タイムアウト時の最大リトライ回数
+            connect_timeout: 接続確立のタイムアウト
+            backoff_seconds: リトライ待機の基準秒数（指数的に増やし、ジッターを加える）
+        """
+        self.deadline_seconds = deadline_seconds
+        self.max_retries = max_retries
+        self.connect_timeout = connect_timeout
+        self.backoff_seconds = backoff_seconds
+        self.stats = {'requests': 0, 'retries': 0, 'deadline_exceeded': 0, 'failures': 0}
+        
         self.access_key = os.getenv('COEFONT_ACCESS_KEY')
         self.access_secret = os.getenv('COEFONT_ACCESS_SECRET')
         self.coefont_id = os.getenv('COEFONT_VOICE_ID')
@@ -151,7 +176,7 @@ class CoeFontClient:
             print("📡 CoeFontにリクエスト送信中...")
             
             # API呼び出し
-            response = requests.post(
+            response = get_requests_session().post(
                 f"{self.api_base_url}/text2speech",
                 data=request_body,
                 headers=headers,
@@ -180,6 +205,26 @@ class CoeFontClient:
             return False
 
     def generate_audio(self, text: str, emotion: Optional[str] = None) -> Optional[str]:
+        """
+        テキストから音声を生成し、data URLで返す（静的音声の生成スクリプトなど向け）
+        
+        Returns:
+            音声データ（Base64エンコード済みdata URL）、失敗時None
+        """
+        audio_data = self.generate_audio_bytes(text, emotion)
+        if not audio_data:
+            return None
+        audio_base64 = base64.b64encode(audio_data).decode('utf-8')
+        return f"data:audio/wav;base64,{audio_base64}"
+
+    def generate_clip(self, text: str, emotion: Optional[str] = None) -> Optional[AudioClip]:
+        """テキストから音声を生成し、形式・長さ付きのAudioClipで返す"""
+        audio_data = self.generate_audio_bytes(text, emotion)
+        if not audio_data:
+            return None
+        return AudioClip.from_bytes(audio_data, 'audio/wav')
+
+    def generate_audio_bytes(self, text: str, emotion: Optional[str] = None) -> Optional[bytes]:
         """
         テキストから音声を生成（公式ドキュメント完全準拠）
         
@@ -188,7 +233,7 @@ class CoeFontClient:
             emotion: 感情（オプション）
             
         Returns:
-            音声データ（Base64エンコード済みdata URL）、失敗時None
+            WAV音声のバイト列、失敗時None
         """
         if not self.is_available():
             print("❌ CoeFont設定が不完全です")
@@ -201,7 +246,7 @@ class CoeFontClient:
             request_data = {
                 'coefont': self.coefont_id,
                 'text': text,
-                'format': 'wav'  # 必須パラメータ
+                'format': OUTPUT_FORMAT  # 必須パラメータ
             }
             
             # 感情パラメータを追加（ある場合）
@@ -213,60 +258,32 @@ class CoeFontClient:
             # JSONエンコード
             request_body = json.dumps(request_data, ensure_ascii=False)
             
-            # タイムスタンプ生成
-            timestamp = self._get_timestamp()
-            
-            # 署名生成
-            signature = self._generate_signature(timestamp, request_body)
+            # 制限時間（これを過ぎそうならNoneを返し、呼び出し側でOpenAI TTSにフォールバック）
+            deadline = time.monotonic() + self.deadline_seconds
+            self.stats['requests'] += 1
             
-            # ヘッダー設定（公式ドキュメント準拠）
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': self.access_key,
-                'X-Coefont-Date': timestamp,
-                'X-Coefont-Content': signature
-            }
-            
-            # API呼び出し
-            response = requests.post(
-                f"{self.api_base_url}/text2speech",
-                data=request_body,
-                headers=headers,
-                timeout=60
-            )
+            response = self._post_with_retries(request_body, deadline)
+            if response is None:
+                self.stats['failures'] += 1
+                return None
             
             print(f"📡 CoeFont APIレスポンス: HTTP {response.status_code}")
             
             if response.status_code == 200:
                 # 直接音声データが返ってきた場合
                 audio_data = response.content
-                print(f"✅ CoeFont音声生成成功: {len(audio_data)} バイト")
-                
-                # Base64エンコードしてdata URLとして返す
-                audio_base64 = base64.b64encode(audio_data).decode('utf-8')
-                return f"data:audio/wav;base64,{audio_base64}"
-                
-            elif response.status_code == 302:
+            elif response.status_code in (301, 302, 303, 307):
                 # リダイレクトの場合（公式ドキュメント通り）
                 redirect_url = response.headers.get('Location')
-                if redirect_url:
-                    print(f"📎 リダイレクトURL取得: {redirect_url}")
-                    
-                    # リダイレクト先から音声データを取得
-                    audio_response = requests.get(redirect_url, timeout=60)
-                    if audio_response.status_code == 200:
-                        audio_data = audio_response.content
-                        print(f"✅ CoeFont音声生成成功: {len(audio_data)} バイト")
-                        
-                        # Base64エンコードしてdata URLとして返す
-                        audio_base64 = base64.b64encode(audio_data).decode('utf-8')
-                        return f"data:audio/wav;base64,{audio_base64}"
-                    else:
-                        print(f"❌ リダイレクト先でエラー: HTTP {audio_response.status_code}")
-                        return None
-                else:
+                response.close()
+                if not redirect_url:
                     print("❌ リダイレクトURLが見つかりません")
+                    self.stats['failures'] += 1
                     return None
+                
+                print(f"📎 リダイレクトURL取得: {redirect_url}")
+                # リダイレクト先から音声データを残り時間内でストリーミング取得
+                audio_data = self._download_audio(redirect_url, deadline)
             else:
                 print(f"❌ CoeFont APIエラー: HTTP {response.status_code}")
                 try:
@@ -274,14 +291,115 @@ class CoeFontClient:
                     print(f"エラー詳細: {error_detail}")
                 except:
                     print(f"エラー詳細: {response.text}")
+                self.stats['failures'] += 1
+                return None
+            
+            if not audio_data:
+                self.stats['failures'] += 1
                 return None
+            
+            print(f"✅ CoeFont音声生成成功: {len(audio_data)} バイト")
+            return audio_data
                 
         except Exception as e:
             print(f"❌ CoeFont音声生成エラー: {e}")
+            self.stats['failures'] += 1
             import traceback
             traceback.print_exc()
             return None
 
+    def _remaining(self, deadline: float) -> float:
+        return deadline - time.monotonic()
+    
+    def _timeouts(self, deadline: float):
+        """残り時間に収まる (接続, 読み込み) タイムアウト"""
+        remaining = self._remaining(deadline)
+        return (min(self.connect_timeout, remaining), remaining)
+    
+    def _post_with_retries(self, request_body: str, deadline: float) -> Optional[requests.Response]:
+        """text2speechへPOST（5xx・タイムアウトはジッター付きバックオフでリトライ）"""
+        for attempt in range(self.max_retries + 1):
+            if self._remaining(deadline) < MIN_ATTEMPT_SECONDS:
+                print("⏱️ CoeFontの制限時間が迫っているため中断します")
+                self.stats['deadline_exceeded'] += 1
+                return None
+            
+            # 署名はタイムスタンプを含むので試行ごとに作り直す
+            timestamp = self._get_timestamp()
+            headers = {
+                'Content-Type': 'application/json',
+                'Authorization': self.access_key,
+                'X-Coefont-Date': timestamp,
+                'X-Coefont-Content': self._generate_signature(timestamp, request_body)
+            }
+            
+            try:
+                # リダイレクトは自前で追う（ダウンロードも制限時間内で行うため）
+                response = get_requests_session().post(
+                    f"{self.api_base_url}/text2speech",
+                    data=request_body,
+                    headers=headers,
+                    timeout=self._timeouts(deadline),
+                    allow_redirects=False
+                )
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    return response
+                print(f"⚠️ CoeFont APIが一時的なエラーを返しました: HTTP {response.status_code}")
+                response.close()
+            except (requests.Timeout, requests.ConnectionError) as e:
+                print(f"⚠️ CoeFont API接続エラー ({attempt + 1}回目): {e}")
+            
+            if attempt == self.max_retries:
+                break
+            
+            # 指数バックオフ + ジッター（残り時間を超えない範囲で待つ）
+            wait = self.backoff_seconds * (2 ** attempt) * random.uniform(0.5, 1.5)
+            if self._remaining(deadline) - wait < MIN_ATTEMPT_SECONDS:
+                print("⏱️ CoeFontの制限時間が迫っているためリトライしません")
+                self.stats['deadline_exceeded'] += 1
+                return None
+            self.stats['retries'] += 1
+            time.sleep(wait)
+        
+        return None
+    
+    def _download_audio(self, url: str, deadline: float, chunk_size: int = 16384) -> Optional[bytes]:
+        """リダイレクト先の音声をストリーミングで取得（制限時間を過ぎたら打ち切る）"""
+        try:
+            with get_requests_session().get(url, timeout=self._timeouts(deadline), stream=True) as response:
+                if response.status_code != 200:
+                    print(f"❌ リダイレクト先でエラー: HTTP {response.status_code}")
+                    return None
+                
+                chunks = []
+                iterator = response.iter_content(chunk_size=chunk_size)
+                while True:
+                    # チャンクごとに残り時間を計算し直し、次の読み込みがそれを超えて待たないようにする
+                    remaining = self._remaining(deadline)
+                    if remaining <= 0:
+                        print("⏱️ CoeFont音声のダウンロードが制限時間を超えました")
+                        self.stats['deadline_exceeded'] += 1
+                        return None
+                    self._set_read_timeout(response, remaining)
+                    chunk = next(iterator, None)
+                    if chunk is None:
+                        return b''.join(chunks)
+                    chunks.append(chunk)
+        except Exception as e:
+            # 失敗の集計は呼び出し側（Noneを受け取った時点）で行う
+            print(f"❌ CoeFont音声のダウンロードエラー: {e}")
+            if self._remaining(deadline) <= 0:
+                self.stats['deadline_exceeded'] += 1
+            return None
+    
+    @staticmethod
+    def _set_read_timeout(response: requests.Response, seconds: float):
+        """ストリーミング中のソケットの読み込みタイムアウトを変更（ソケットが取れない場合は何もしない）"""
+        connection = getattr(response.raw, 'connection', None)
+        sock = getattr(connection, 'sock', None)
+        if sock is not None:
+            sock.settimeout(seconds)
+    
     def get_available_coefonts(self) -> Optional[list]:
         """利用可能なCoeFont一覧を取得"""
         if not self.is_available():
@@ -305,7 +423,7 @@ class CoeFontClient:
                 'X-Coefont-Content': signature
             }
             
-            response = requests.get(
+            response = get_requests_session().get(
                 f"{self.api_base_url}/coefonts/pro",
                 headers=headers,
                 timeout=30
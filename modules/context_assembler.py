@@ -0,0 +1,217 @@
+# modules/context_assembler.py - トークン予算内でプロンプトの文脈を組み立てる（重複除去・優先度順）
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .token_estimator import estimate_tokens
+
+# 比較用の正規化で取り除く文字（空白・記号・箇条書きの印）
+_NOISE = re.compile(r'[\s\-・、。，．,.!?！？「」『』（）()【】:：]+')
+# 重複とみなす行の最短文字数（短すぎる行は偶然一致しやすい）
+MIN_DEDUPE_LINE_CHARS = 8
+# 重複行を除いた後、検索結果のチャンクとして残す最短文字数
+MIN_CHUNK_CHARS = 20
+
+
+def normalize_for_match(text: str) -> str:
+    """比較用にテキストを正規化（記号・空白を除き、英字は小文字に）"""
+    return _NOISE.sub('', (text or '').lower())
+
+
+class ContextSection:
+    """プロンプトの1区画（見出しと項目の並び）"""
+
+    __slots__ = ('name', 'title', 'items', 'priority', 'required', 'keep_tail', 'dedupe')
+
+    def __init__(
+        self,
+        name: str,
+        title: str,
+        items: Sequence[str],
+        priority: int = 5,
+        required: bool = False,
+        keep_tail: bool = False,
+        dedupe: bool = True
+    ):
+        """
+        Args:
+            name: ログ・統計用の名前
+            title: プロンプト上の見出し（【】の中身）
+            items: 区画の中身。予算が足りなければ項目単位で削る
+            priority: 小さいほど先に予算を割り当てる
+            required: 予算に関係なく全体を入れる
+            keep_tail: 削るときに末尾（新しい方）を残す（会話の文脈など）
+            dedupe: ほかの区画と重なる行を除く（会話の文脈のように同じ発言の繰り返しに意味がある区画はFalse）
+        """
+        self.name = name
+        self.title = title
+        self.items = [item for item in items if item and item.strip()]
+        self.priority = priority
+        self.required = required
+        self.keep_tail = keep_tail
+        self.dedupe = dedupe
+
+    def render(self, items: Optional[List[str]] = None) -> str:
+        items = self.items if items is None else items
+        return f"【{self.title}】\n" + "\n".join(items)
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.render())
+
+
+class ContextAssembler:
+    def __init__(self, token_budget: int = 2500, stats: Optional[Dict] = None):
+        """
+        文脈アセンブラの初期化
+
+        Args:
+            token_budget: 文脈の区画に使うトークン数の上限（質問文・回答ルールは含まない）
+            stats: 削減量などを書き込む統計辞書
+        """
+        self.token_budget = token_budget
+        self.stats = stats if stats is not None else {}
+        for key in ('requests', 'original_tokens', 'assembled_tokens', 'saved_tokens', 'deduplicated_sections'):
+            self.stats.setdefault(key, 0)
+
+    # ---- 組み立て ----
+
+    def assemble(
+        self,
+        sections: Iterable[ContextSection],
+        exclude_texts: Iterable[str] = (),
+        baseline_tokens: Optional[int] = None
+    ) -> Tuple[str, Dict]:
+        """
+        区画を優先度順に予算内で組み立てる
+
+        Args:
+            sections: 候補の区画（プロンプトに出す順に並べる）
+            exclude_texts: すでにプロンプトの別の場所（システムプロンプトなど）にある文章。
+                           これと同じ区画・行は入れない
+            baseline_tokens: 組み立て前のプロンプトのトークン数（削減量の計算用。省略時は候補の合計）
+
+        Returns:
+            (組み立てた文脈, レポート)。レポートは original_tokens / assembled_tokens / saved_tokens /
+            sections（区画ごとのトークン数）/ dropped（削った区画）
+        """
+        sections = [section for section in sections if section.items]
+        exclude_texts = [text for text in exclude_texts if text]
+        original_tokens = baseline_tokens if baseline_tokens is not None else sum(section.tokens for section in sections)
+
+        # 同じ文章がほかの場所（システムプロンプトなど）や前の区画にすでにある区画は丸ごと除く
+        seen_blocks = [normalize_for_match(text) for text in exclude_texts]
+        seen_lines = set()
+        for text in exclude_texts:
+            seen_lines.update(self._dedupe_keys(text))
+
+        unique_sections = []
+        dropped = []
+        for section in sections:
+            block = normalize_for_match("\n".join(section.items))
+            if section.dedupe and not section.required and any(block in seen for seen in seen_blocks):
+                dropped.append(section.name)
+                self.stats['deduplicated_sections'] += 1
+                continue
+            seen_blocks.append(block)
+            unique_sections.append(section)
+
+        # 優先度順に予算を割り当て（行単位の重複もここで除く）
+        chosen: Dict[str, List[str]] = {}
+        remaining = self.token_budget
+        for section in sorted(unique_sections, key=lambda s: (not s.required, s.priority)):
+            # 必須の区画は削らない（重なる行があってもそのまま入れる）
+            if section.required or not section.dedupe:
+                items = section.items
+            else:
+                items = self._remove_duplicate_lines(section, seen_lines)
+            if not items:
+                dropped.append(section.name)
+                continue
+
+            if section.required:
+                selected = items
+            else:
+                selected = self._fit_items(section, items, remaining)
+                if not selected:
+                    dropped.append(section.name)
+                    continue
+
+            chosen[section.name] = selected
+            remaining -= estimate_tokens(section.render(selected))
+            if section.dedupe:
+                for item in selected:
+                    seen_lines.update(self._dedupe_keys(item))
+
+        # 元の並び順で出力
+        parts = []
+        section_tokens = {}
+        for section in unique_sections:
+            if section.name in chosen:
+                rendered = section.render(chosen[section.name])
+                parts.append(rendered)
+                section_tokens[section.name] = estimate_tokens(rendered)
+
+        assembled_tokens = sum(section_tokens.values())
+        report = {
+            'original_tokens': original_tokens,
+            'assembled_tokens': assembled_tokens,
+            'saved_tokens': max(0, original_tokens - assembled_tokens),
+            'sections': section_tokens,
+            'dropped': dropped
+        }
+        self.stats['requests'] += 1
+        self.stats['original_tokens'] += original_tokens
+        self.stats['assembled_tokens'] += assembled_tokens
+        self.stats['saved_tokens'] += report['saved_tokens']
+        return "\n\n".join(parts), report
+
+    def _fit_items(self, section: ContextSection, items: List[str], remaining: int) -> List[str]:
+        """予算に収まるだけ項目を入れる（keep_tailなら新しい方から）"""
+        header_tokens = estimate_tokens(section.render([]))
+        budget = remaining - header_tokens
+        ordered = list(reversed(items)) if section.keep_tail else items
+
+        selected = []
+        for item in ordered:
+            cost = estimate_tokens(item) + 1  # 改行分
+            if cost > budget:
+                break
+            selected.append(item)
+            budget -= cost
+
+        return list(reversed(selected)) if section.keep_tail else selected
+
+    @staticmethod
+    def _dedupe_keys(text: str) -> List[str]:
+        keys = []
+        for line in (text or '').split('\n'):
+            key = normalize_for_match(re.sub(r'^-\s*\[[^\]]*\]\s*', '', line.strip()))
+            if len(key) >= MIN_DEDUPE_LINE_CHARS:
+                keys.append(key)
+        return keys
+
+    def _remove_duplicate_lines(self, section: ContextSection, seen_lines: set) -> List[str]:
+        """ほかの区画と同じ行を取り除く（行がほとんど残らない項目は項目ごと除く）"""
+        items = []
+        seen_items = set()
+        for item in section.items:
+            lines = [
+                line for line in item.split('\n')
+                if not any(key in seen_lines for key in self._dedupe_keys(line))
+            ]
+            text = "\n".join(lines).strip()
+            key = normalize_for_match(text)
+            if not text or key in seen_items:
+                continue
+            # 重なる行を除いた結果、断片しか残らなかったチャンクは入れない
+            if text != item.strip() and len(key) < MIN_CHUNK_CHARS:
+                continue
+            seen_items.add(key)
+            items.append(text)
+        return items
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats, token_budget=self.token_budget)
+        if self.stats['original_tokens']:
+            stats['saved_ratio'] = round(self.stats['saved_tokens'] / self.stats['original_tokens'], 3)
+        return stats
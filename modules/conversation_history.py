@@ -0,0 +1,325 @@
+# modules/conversation_history.py - 直近の会話だけを残し、古い会話は要約に畳み込む会話履歴管理
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from .http_pool import get_openai_client
+from .token_estimator import estimate_tokens, estimate_messages_tokens, MESSAGE_OVERHEAD_TOKENS
+
+# 1回の要約で畳み込む最大メッセージ数（長い既存セッションは数回に分けて要約する）
+MAX_FOLD_MESSAGES = 40
+# 要約をsessionsテーブルに保存できなかったとき、保存をやり直すまでの秒数
+SUMMARY_SAVE_RETRY_SECONDS = 300
+
+SUMMARY_SYSTEM_PROMPT = (
+    "あなたは会話の記録係です。京友禅職人のREIと来訪者の会話を、"
+    "来訪者の関心・質問済みの話題・REIが伝えた要点が分かるように日本語で簡潔に要約してください。"
+)
+
+
+def timestamp_key(value) -> datetime:
+    """
+    created_at を比較用のUTCのdatetimeにする
+
+    Supabaseから読んだ値は "+00:00" 付き、書き込み待ちの行はタイムゾーンなしのこともあるので、
+    文字列のままでは同じ時刻でも一致しない。タイムゾーンのない値はUTCとみなす。
+    """
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = datetime.fromisoformat(str(value or '').replace('Z', '+00:00'))
+        except ValueError:
+            return datetime.min.replace(tzinfo=timezone.utc)
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+def _row_key(row: Dict):
+    return (row.get('role'), row.get('content'), timestamp_key(row.get('created_at')))
+
+
+class ConversationHistoryManager:
+    def __init__(
+        self,
+        supabase,
+        openai_service=None,
+        max_turns: int = 6,
+        token_budget: int = 1500,
+        summary_model: str = 'gpt-3.5-turbo',
+        summary_max_chars: int = 400,
+        summary_batch_turns: int = 2,
+        max_cached_sessions: int = 1000,
+        write_behind=None
+    ):
+        """
+        会話履歴管理の初期化
+
+        プロンプトには直近 max_turns 往復（トークン上限内）をそのまま入れ、それより古い会話は
+        sessionsテーブルに保存した要約（summary / summary_until）に畳み込む。
+        要約の更新は応答を返した後にバックグラウンドで行う。畳み込みは数往復ずつまとめて行うので、
+        まだ畳み込んでいない会話は窓の外でもそのままプロンプトに入れる（要約にもプロンプトにも
+        入らない会話を作らない）。
+
+        Args:
+            supabase: Supabaseクライアント
+            openai_service: 非同期OpenAIサービス（指定時は要約をこちら経由で生成）
+            max_turns: そのまま残す往復数
+            token_budget: 要約と直近の会話に使うトークン数の上限
+            summary_model: 要約に使うモデル
+            summary_max_chars: 要約の最大文字数
+            summary_batch_turns: 畳み込む会話がこの往復数たまってから要約する（毎ターンは要約しない）
+            max_cached_sessions: 要約をメモリに保持するセッション数
+            write_behind: 会話の書き込みに使うWriteBehindQueue（未書き込みの行も履歴に含める）
+        """
+        self.supabase = supabase
+        self.openai_service = openai_service
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_model = summary_model
+        self.summary_max_chars = summary_max_chars
+        self.summary_batch_turns = summary_batch_turns
+        self.max_cached_sessions = max_cached_sessions
+        self.write_behind = write_behind
+        self.stats = {
+            'loads': 0, 'trimmed_messages': 0, 'summaries': 0, 'summary_errors': 0,
+            'summary_save_errors': 0, 'prompt_tokens': 0
+        }
+
+        # セッションIDごとの (要約, 要約済みの最終時刻)
+        self._summaries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+
+    @property
+    def window_messages(self) -> int:
+        """そのまま残すメッセージ数（1往復 = ユーザー + アシスタント）"""
+        return self.max_turns * 2
+
+    # ---- 読み込み ----
+
+    def load(self, session_id: str) -> Dict:
+        """
+        プロンプトに入れる履歴を取得
+
+        Returns:
+            summary: 古い会話の要約（なければ空文字）
+            messages: 要約していない会話（古い順、role/content）
+            tokens: 要約と会話の推定トークン数
+        """
+        summary_state = self._get_summary_state(session_id)
+        summary_until = summary_state.get('summary_until')
+
+        # 要約済みより後の会話をすべて読む（件数は1回に畳み込める分 + 窓の大きさまで）
+        query = self.supabase.table('conversations') \
+            .select('role,content,created_at') \
+            .eq('session_id', session_id)
+        if summary_until:
+            query = query.gt('created_at', summary_until)
+        limit = MAX_FOLD_MESSAGES + self.window_messages
+        result = query.order('created_at', desc=True).limit(limit).execute()
+        rows = self._unfolded(self._merge_pending(session_id, list(reversed(result.data or []))), summary_until)[-limit:]
+
+        summary = summary_state.get('summary') or ''
+        messages = [{'role': row['role'], 'content': row['content']} for row in rows if row.get('content')]
+
+        # トークン上限を超える分は古い方から落とす（落とした会話は直後の要約の更新で畳み込まれる）
+        summary_tokens = self._summary_tokens(summary)
+        tokens = summary_tokens + estimate_messages_tokens(messages)
+        while messages and tokens > self.token_budget:
+            dropped = messages.pop(0)
+            tokens -= estimate_tokens(dropped['content']) + MESSAGE_OVERHEAD_TOKENS
+            self.stats['trimmed_messages'] += 1
+
+        self.stats['loads'] += 1
+        self.stats['prompt_tokens'] += tokens
+        return {'summary': summary, 'messages': messages, 'tokens': tokens}
+
+    def _merge_pending(self, session_id: str, rows: List[Dict]) -> List[Dict]:
+        """まだ書き込まれていない会話を足す（書き込み済みと重なった分は除く）"""
+        if not self.write_behind:
+            return rows
+        stored = {_row_key(row) for row in rows}
+        pending = [
+            row for row in self.write_behind.pending_rows('conversations', session_id=session_id)
+            if _row_key(row) not in stored
+        ]
+        if not pending:
+            return rows
+        return sorted(rows + pending, key=lambda row: timestamp_key(row.get('created_at')))
+
+    @staticmethod
+    def _unfolded(rows: List[Dict], summary_until) -> List[Dict]:
+        """要約済みの会話を除く"""
+        if not summary_until:
+            return rows
+        until = timestamp_key(summary_until)
+        return [row for row in rows if timestamp_key(row.get('created_at')) > until]
+
+    @staticmethod
+    def _summary_tokens(summary: str) -> int:
+        return estimate_tokens(summary) + MESSAGE_OVERHEAD_TOKENS if summary else 0
+
+    def _keep_count(self, summary_tokens: int, rows: List[Dict]) -> int:
+        """要約せずに残す末尾の会話の件数（窓の大きさと、要約と並べたときのトークン上限の小さい方）"""
+        tokens = summary_tokens
+        keep = 0
+        for row in reversed(rows[-self.window_messages:]):
+            if row.get('content'):
+                tokens += estimate_tokens(row['content']) + MESSAGE_OVERHEAD_TOKENS
+            if tokens > self.token_budget:
+                break
+            keep += 1
+        return keep
+
+    def _get_summary_state(self, session_id: str) -> Dict:
+        with self._lock:
+            state = self._summaries.get(session_id)
+            if state is not None:
+                self._summaries.move_to_end(session_id)
+                return state
+
+        state = {'summary': '', 'summary_until': None}
+        try:
+            result = self.supabase.table('sessions') \
+                .select('summary,summary_until') \
+                .eq('id', session_id) \
+                .limit(1) \
+                .execute()
+            if result.data:
+                state = {
+                    'summary': result.data[0].get('summary') or '',
+                    'summary_until': result.data[0].get('summary_until')
+                }
+        except Exception as e:
+            print(f"⚠️ 会話要約の読み込みエラー: {e}")
+        self._remember_summary(session_id, state)
+        return state
+
+    def _remember_summary(self, session_id: str, state: Dict):
+        with self._lock:
+            self._summaries[session_id] = state
+            self._summaries.move_to_end(session_id)
+            while len(self._summaries) > self.max_cached_sessions:
+                self._summaries.popitem(last=False)
+
+    # ---- 要約の更新 ----
+
+    def schedule_refresh(self, session_id: str):
+        """要約の更新をバックグラウンドで実行（同じセッションの更新は重ねない）"""
+        with self._lock:
+            if session_id in self._refreshing:
+                return
+            self._refreshing.add(session_id)
+        threading.Thread(target=self._refresh_worker, args=(session_id,), daemon=True).start()
+
+    def _refresh_worker(self, session_id: str):
+        try:
+            self.refresh_summary(session_id)
+        except Exception as e:
+            self.stats['summary_errors'] += 1
+            print(f"⚠️ 会話要約の更新エラー: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(session_id)
+
+    def refresh_summary(self, session_id: str) -> bool:
+        """窓から外れた会話（トークン上限で落とした会話を含む）を要約に畳み込む"""
+        state = self._get_summary_state(session_id)
+        if state.get('unsaved') and time.time() >= state.get('retry_at', 0):
+            # 前回保存できなかった要約を、要約を作り直さずに保存し直す
+            self._save_summary(session_id, state)
+
+        query = self.supabase.table('conversations') \
+            .select('role,content,created_at') \
+            .eq('session_id', session_id)
+        if state.get('summary_until'):
+            query = query.gt('created_at', state['summary_until'])
+        limit = MAX_FOLD_MESSAGES + self.window_messages
+        rows = query.order('created_at').limit(limit).execute().data or []
+        if len(rows) < limit:
+            # 最新の会話まで読めたときだけ、書き込み待ちの会話も含めて窓を決める
+            rows = self._unfolded(self._merge_pending(session_id, rows), state.get('summary_until'))
+
+        summary = state.get('summary') or ''
+        keep = self._keep_count(self._summary_tokens(summary), rows)
+        fold = rows[:len(rows) - keep]
+        # 数往復たまるまでは待つ（畳み込むまではそのままプロンプトに入る）。トークン上限で
+        # プロンプトから落ちる会話があるときはすぐに畳み込む
+        over_budget = keep < min(len(rows), self.window_messages)
+        if not fold or (len(fold) < self.summary_batch_turns * 2 and not over_budget):
+            return False
+
+        # 畳み込むと要約が長くなり、残した会話がload()のトークン上限で落ちることがあるので、
+        # 最大の長さの要約（1文字1トークン以下）と並べても収まる分だけ残す
+        max_summary_tokens = max(self._summary_tokens(summary), self.summary_max_chars + MESSAGE_OVERHEAD_TOKENS)
+        keep = min(keep, self._keep_count(max_summary_tokens, rows))
+        fold = rows[:len(rows) - keep]
+
+        new_summary = self._summarize(summary, fold)
+        if not new_summary:
+            return False
+
+        # 保存に失敗しても作った要約はメモリに残し、同じ会話を毎ターン要約し直さない
+        new_state = {'summary': new_summary, 'summary_until': fold[-1]['created_at']}
+        self._remember_summary(session_id, new_state)
+        self.stats['summaries'] += 1
+        self._save_summary(session_id, new_state)
+        print(f"📝 会話要約を更新しました (セッション: {session_id[:8]}, 畳み込み: {len(fold)}件, {len(new_summary)}文字)")
+        return True
+
+    def _save_summary(self, session_id: str, state: Dict) -> bool:
+        """要約をsessionsテーブルに保存（失敗したら一定時間後に保存だけやり直す）"""
+        try:
+            self.supabase.table('sessions').update({
+                'summary': state['summary'],
+                'summary_until': state['summary_until'],
+                'summary_updated_at': datetime.now(timezone.utc).isoformat()
+            }).eq('id', session_id).execute()
+        except Exception as e:
+            state['unsaved'] = True
+            state['retry_at'] = time.time() + SUMMARY_SAVE_RETRY_SECONDS
+            self.stats['summary_save_errors'] += 1
+            print(f"⚠️ 会話要約の保存エラー（{SUMMARY_SAVE_RETRY_SECONDS}秒後に保存し直します。"
+                  f"sessionsテーブルに要約の列がない場合は migrations.py を実行してください）: {e}")
+            return False
+        state.pop('unsaved', None)
+        state.pop('retry_at', None)
+        return True
+
+    def _summarize(self, previous_summary: str, rows: List[Dict]) -> Optional[str]:
+        """これまでの要約と新しい会話から要約を作り直す"""
+        lines = []
+        for row in rows:
+            speaker = '来訪者' if row.get('role') == 'user' else 'REI'
+            lines.append(f"{speaker}: {row.get('content') or ''}")
+
+        user_prompt = (
+            f"【これまでの要約】\n{previous_summary or '（なし）'}\n\n"
+            f"【追加の会話】\n" + "\n".join(lines) + "\n\n"
+            f"これらをまとめた要約を{self.summary_max_chars}文字以内で書いてください。"
+        )
+        completion_params = {
+            'model': self.summary_model,
+            'messages': [
+                {'role': 'system', 'content': SUMMARY_SYSTEM_PROMPT},
+                {'role': 'user', 'content': user_prompt}
+            ],
+            'temperature': 0.3,
+            'max_tokens': self.summary_max_chars
+        }
+        if self.openai_service:
+            summary = self.openai_service.chat(**completion_params)
+        else:
+            response = get_openai_client().chat.completions.create(**completion_params)
+            summary = response.choices[0].message.content
+        return (summary or '').strip()[:self.summary_max_chars]
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats, cached_sessions=len(self._summaries), refreshing=len(self._refreshing))
+        if self.stats['loads']:
+            stats['avg_prompt_tokens'] = round(self.stats['prompt_tokens'] / self.stats['loads'], 1)
+        return stats
@@ -0,0 +1,210 @@
+# modules/embedding_cache.py - クエリ埋め込みの永続キャッシュ（正規化テキスト → float32ベクトル）
+import os
+import re
+import time
+import atexit
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# キャッシュファイルの形式（保存内容を変えたら上げる）
+# 2: キーと同じ正規化済みテキストを埋め込むようにした（1は元のテキストのベクトルが混ざる）
+EMBEDDING_CACHE_VERSION = 2
+
+
+def normalize_embedding_text(text: str) -> str:
+    """キャッシュキー用にテキストを正規化（全角半角・空白の揺れを吸収）"""
+    text = unicodedata.normalize('NFKC', text or '')
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+class CachedEmbeddings(Embeddings):
+    def __init__(
+        self,
+        base: Embeddings,
+        cache_path: Optional[str] = 'data/embedding_cache.npz',
+        max_items: int = 5000,
+        save_every: int = 20,
+        stats: Optional[Dict] = None
+    ):
+        """
+        埋め込みキャッシュの初期化
+
+        Chromaのembedding_functionとしてそのまま渡せる。キャッシュするのは検索クエリ
+        （embed_query）だけで、ドキュメント登録時のembed_documentsはそのまま委譲する。
+
+        Args:
+            base: 実際に埋め込みを計算するモデル（OpenAIEmbeddings）
+            cache_path: 永続化先の.npzファイル（Noneならメモリのみ）
+            max_items: 保持する最大件数（超えたら最も古く使われたものから破棄）
+            save_every: 新規ベクトルがこの件数たまったらファイルに保存
+            stats: ヒット数などを書き込む統計辞書（application.pyのcache_stats）
+        """
+        self.base = base
+        self.cache_path = cache_path
+        self.max_items = max_items
+        self.save_every = save_every
+        self.stats = stats if stats is not None else {}
+        # モデルが変わったら古いベクトルは使えないのでファイルに記録して照合する
+        self.model_name = str(getattr(base, 'model', type(base).__name__))
+
+        self._vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._unsaved = 0
+
+        for key in ('embedding_cache_hits', 'embedding_cache_misses',
+                    'embedding_calls_avoided', 'embedding_prefetched'):
+            self.stats.setdefault(key, 0)
+
+        self.load()
+        if self.cache_path:
+            atexit.register(self.save)
+
+    # ---- Embeddingsインターフェース ----
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.base.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_embedding_text(text)
+        vector = self._lookup(key)
+        if vector is not None:
+            self.stats['embedding_cache_hits'] += 1
+            self.stats['embedding_calls_avoided'] += 1
+            return vector.tolist()
+
+        # 事前取得と同じく正規化済みのテキストを埋め込む（同じキーに別の入力のベクトルを入れない）
+        self.stats['embedding_cache_misses'] += 1
+        result = self.base.embed_query(key)
+        self._store(key, result)
+        return result
+
+    # ---- 事前取得 ----
+
+    def prefetch(self, texts: Iterable[str], batch_size: int = 100) -> int:
+        """
+        まだキャッシュにないテキストをまとめて埋め込む（起動時にサジェスチョン文言で呼ぶ）
+
+        Returns:
+            新たに埋め込んだ件数
+        """
+        pending = []
+        seen = set()
+        for text in texts:
+            key = normalize_embedding_text(text)
+            if key and key not in seen and self._lookup(key, touch=False) is None:
+                seen.add(key)
+                pending.append(key)
+
+        if not pending:
+            print("🧮 埋め込みキャッシュ: 事前取得対象はすべてキャッシュ済みです")
+            return 0
+
+        start_time = time.time()
+        fetched = 0
+        for i in range(0, len(pending), batch_size):
+            batch = pending[i:i + batch_size]
+            try:
+                vectors = self.base.embed_documents(batch)
+            except Exception as e:
+                print(f"⚠️ 埋め込みの事前取得エラー: {e}")
+                break
+            for key, vector in zip(batch, vectors):
+                self._store(key, vector, autosave=False)
+            fetched += len(batch)
+
+        self.stats['embedding_prefetched'] += fetched
+        self.save()
+        print(f"🧮 埋め込みキャッシュ: {fetched}件を事前取得しました ({time.time() - start_time:.2f}秒)")
+        return fetched
+
+    # ---- 内部処理 ----
+
+    def _lookup(self, key: str, touch: bool = True) -> Optional[np.ndarray]:
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is not None and touch:
+                self._vectors.move_to_end(key)
+            return vector
+
+    def _store(self, key: str, vector: List[float], autosave: bool = True):
+        with self._lock:
+            self._vectors[key] = np.asarray(vector, dtype=np.float32)
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_items:
+                self._vectors.popitem(last=False)
+            self._unsaved += 1
+            should_save = autosave and self._unsaved >= self.save_every
+
+        if should_save:
+            self.save()
+
+    def load(self) -> bool:
+        """キャッシュファイルを読み込む（なければ空のまま）"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return False
+
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as data:
+                version = int(data['version'])
+                model_name = str(data['model'])
+                keys = data['keys'].tolist()
+                vectors = data['vectors']
+        except Exception as e:
+            print(f"⚠️ 埋め込みキャッシュ読み込みエラー: {e}")
+            return False
+
+        if version != EMBEDDING_CACHE_VERSION or model_name != self.model_name:
+            print(f"🔄 埋め込みキャッシュの形式またはモデルが異なるため破棄します ({model_name})")
+            return False
+
+        with self._lock:
+            # 保存時はLRU順（古い→新しい）なのでそのまま積めば順序も復元される
+            for key, vector in zip(keys[-self.max_items:], vectors[-self.max_items:]):
+                self._vectors[key] = vector
+        print(f"🧮 埋め込みキャッシュ読み込み完了: {len(self._vectors)}件")
+        return True
+
+    def save(self):
+        """キャッシュをファイルに保存（一時ファイル経由で原子的に置き換え）"""
+        if not self.cache_path:
+            return
+
+        with self._lock:
+            if not self._unsaved:
+                return
+            keys = list(self._vectors.keys())
+            vectors = list(self._vectors.values())
+            self._unsaved = 0
+
+        try:
+            directory = os.path.dirname(self.cache_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.cache_path}.{threading.get_ident()}.tmp.npz"
+            np.savez(
+                temp_path,
+                version=np.array(EMBEDDING_CACHE_VERSION),
+                model=np.array(self.model_name),
+                keys=np.array(keys, dtype=str),
+                vectors=np.stack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+            )
+            os.replace(temp_path, self.cache_path)
+        except Exception as e:
+            print(f"⚠️ 埋め込みキャッシュ保存エラー: {e}")
+
+    def get_stats(self) -> Dict:
+        """キャッシュの状態を取得"""
+        with self._lock:
+            size = len(self._vectors)
+        return {
+            'items': size,
+            'hits': self.stats['embedding_cache_hits'],
+            'misses': self.stats['embedding_cache_misses'],
+            'calls_avoided': self.stats['embedding_calls_avoided'],
+            'prefetched': self.stats['embedding_prefetched'],
+        }
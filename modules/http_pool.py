@@ -0,0 +1,188 @@
+# modules/http_pool.py - 外部APIとの接続をプロセス全体で共有するコネクションプール
+import os
+import threading
+from typing import Dict, Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from openai import OpenAI
+from supabase import create_client, Client
+
+# プールの設定（application.pyからconfigure()で上書き）
+_settings = {
+    'pool_connections': 10,    # ホストごとのプール数（requests）
+    'pool_maxsize': 20,        # 1ホストあたりの保持コネクション数
+    'max_connections': 50,     # 同時接続数の上限（httpx）
+    'keepalive_expiry': 30.0,  # アイドルなコネクションを保持する秒数（httpx）
+}
+
+_lock = threading.Lock()
+_requests_session: Optional[requests.Session] = None
+_httpx_client: Optional[httpx.Client] = None
+_async_httpx_client: Optional[httpx.AsyncClient] = None
+_openai_client: Optional[OpenAI] = None
+_supabase_client: Optional[Client] = None
+
+# httpxで張った新規TCP接続・TLSハンドシェイクとリクエスト数（差分が再利用された接続）
+_httpx_stats = {'requests': 0, 'new_connections': 0, 'tls_handshakes': 0}
+
+
+def configure(
+    pool_connections: Optional[int] = None,
+    pool_maxsize: Optional[int] = None,
+    max_connections: Optional[int] = None,
+    keepalive_expiry: Optional[float] = None
+):
+    """プールの大きさを設定（クライアントを作る前に呼ぶ）"""
+    for key, value in (('pool_connections', pool_connections), ('pool_maxsize', pool_maxsize),
+                       ('max_connections', max_connections), ('keepalive_expiry', keepalive_expiry)):
+        if value is not None:
+            _settings[key] = value
+
+
+# ---- requests（CoeFont） ----
+
+def get_requests_session() -> requests.Session:
+    """keep-aliveで接続を使い回すrequestsセッション"""
+    global _requests_session
+    with _lock:
+        if _requests_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=_settings['pool_connections'],
+                pool_maxsize=_settings['pool_maxsize']
+            )
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _requests_session = session
+        return _requests_session
+
+
+def _requests_pool_stats() -> Dict[str, int]:
+    """urllib3のプールが数えている接続数・リクエスト数を集計"""
+    stats = {'requests': 0, 'new_connections': 0}
+    if _requests_session is None:
+        return stats
+
+    adapters = {id(adapter): adapter for adapter in _requests_session.adapters.values()}
+    for adapter in adapters.values():
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats['requests'] += pool.num_requests
+            stats['new_connections'] += pool.num_connections
+    return stats
+
+
+# ---- httpx（OpenAI） ----
+
+def _trace(event_name: str, info: Dict):
+    if event_name == 'connection.connect_tcp.complete':
+        _httpx_stats['new_connections'] += 1
+    elif event_name == 'connection.start_tls.complete':
+        _httpx_stats['tls_handshakes'] += 1
+
+
+async def _async_trace(event_name: str, info: Dict):
+    _trace(event_name, info)
+
+
+def _on_request(request: httpx.Request):
+    _httpx_stats['requests'] += 1
+    request.extensions['trace'] = _trace
+
+
+async def _on_async_request(request: httpx.Request):
+    _httpx_stats['requests'] += 1
+    request.extensions['trace'] = _async_trace
+
+
+def _httpx_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=_settings['max_connections'],
+        max_keepalive_connections=_settings['pool_maxsize'],
+        keepalive_expiry=_settings['keepalive_expiry']
+    )
+
+
+def get_httpx_client() -> httpx.Client:
+    """接続を使い回すhttpxクライアント（同期版）"""
+    global _httpx_client
+    with _lock:
+        if _httpx_client is None:
+            _httpx_client = httpx.Client(
+                limits=_httpx_limits(),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+                event_hooks={'request': [_on_request]}
+            )
+        return _httpx_client
+
+
+def get_async_httpx_client() -> httpx.AsyncClient:
+    """
+    接続を使い回すhttpxクライアント（非同期版）
+
+    AsyncOpenAIServiceのイベントループで使う。OpenAIEmbeddings にも渡しているので、
+    埋め込みを非同期（aembed_*）で呼ぶ場合も同じループで実行すること。
+    """
+    global _async_httpx_client
+    with _lock:
+        if _async_httpx_client is None:
+            _async_httpx_client = httpx.AsyncClient(
+                limits=_httpx_limits(),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+                event_hooks={'request': [_on_async_request]}
+            )
+        return _async_httpx_client
+
+
+def get_openai_client() -> OpenAI:
+    """プロセス全体で共有するOpenAIクライアント"""
+    global _openai_client
+    http_client = get_httpx_client()
+    with _lock:
+        if _openai_client is None:
+            _openai_client = OpenAI(http_client=http_client)
+        return _openai_client
+
+
+# ---- Supabase ----
+
+def get_supabase_client(url: Optional[str] = None, key: Optional[str] = None) -> Client:
+    """
+    プロセス全体で共有するSupabaseクライアント（最初の呼び出しの接続先で作成）
+
+    supabase-py 2.0 はPostgREST用のhttpxクライアントを内部で作り、プールの大きさを渡す
+    手段がないため、configure() の設定はSupabaseには効かない（クライアントの共有だけ行う）。
+    """
+    global _supabase_client
+    with _lock:
+        if _supabase_client is None:
+            _supabase_client = create_client(
+                url or os.getenv('SUPABASE_URL'),
+                key or os.getenv('SUPABASE_KEY')
+            )
+        return _supabase_client
+
+
+def get_stats() -> Dict:
+    """新規接続と再利用された接続の数"""
+    requests_stats = _requests_pool_stats()
+    httpx_stats = dict(_httpx_stats)
+    return {
+        'requests': {
+            'requests': requests_stats['requests'],
+            'new_connections': requests_stats['new_connections'],
+            'reused_connections': max(0, requests_stats['requests'] - requests_stats['new_connections']),
+        },
+        'httpx': {
+            'requests': httpx_stats['requests'],
+            'new_connections': httpx_stats['new_connections'],
+            'tls_handshakes': httpx_stats['tls_handshakes'],
+            'reused_connections': max(0, httpx_stats['requests'] - httpx_stats['new_connections']),
+        },
+        'settings': dict(_settings),
+    }
@@ -0,0 +1,169 @@
+# modules/hybrid_retriever.py - 語彙検索とベクトル検索を並行して行い、Reciprocal Rank Fusionで統合する
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Callable, Dict, List, Optional, Sequence
+
+from .context_assembler import normalize_for_match
+from .token_estimator import estimate_tokens
+
+
+class RetrievedPassage:
+    """検索で見つかった1件（専門知識の項目またはベクトルDBのチャンク）"""
+
+    __slots__ = ('text', 'label', 'sources', 'score')
+
+    def __init__(self, text: str, label: str = '', source: str = 'lexical', score: float = 0.0):
+        self.text = text
+        self.label = label
+        self.sources = {source}
+        self.score = score
+
+    def render(self) -> str:
+        """プロンプト用の文字列（見出しのある項目は箇条書きにする）"""
+        if self.label:
+            return f"- [{self.label}] {self.text}"
+        return self.text
+
+    def __repr__(self) -> str:
+        return f"RetrievedPassage({self.label!r}, {sorted(self.sources)}, {self.score:.4f}, {self.text[:20]!r})"
+
+
+class HybridRetriever:
+    def __init__(
+        self,
+        lexical_search: Callable[[str, int], Sequence],
+        vector_search: Optional[Callable[[str, int], Sequence]] = None,
+        lexical_k: int = 12,
+        vector_k: int = 4,
+        rrf_k: int = 60,
+        max_results: int = 8,
+        max_tokens: int = 1200,
+        vector_timeout: float = 3.0,
+        max_workers: int = 4,
+        stats: Optional[Dict] = None
+    ):
+        """
+        ハイブリッド検索の初期化
+
+        語彙検索（ローカルの転置インデックス、ネットワーク不要）とベクトル検索（埋め込みAPI + Chroma）を
+        並行して実行し、順位だけを使うReciprocal Rank Fusion（score = Σ 1 / (rrf_k + 順位)）で1つの
+        並びにまとめる。同じ内容（一方が他方に含まれるもの）は1件にし、件数とトークン数で上限を切る。
+        ベクトル検索が vector_timeout 秒以内に終わらなければ語彙検索の結果だけで返す。
+
+        Args:
+            lexical_search: (クエリ, 件数) → [(スコア, KnowledgeEntry)] を返す関数
+            vector_search: (クエリ, 件数) → [Document] を返す関数（Noneなら語彙検索だけ）
+            lexical_k: 語彙検索で取得する件数
+            vector_k: ベクトル検索で取得する件数
+            rrf_k: RRFの順位の平滑化定数
+            max_results: 返す最大件数
+            max_tokens: 返す文章の合計トークン数の上限
+            vector_timeout: ベクトル検索を待つ秒数
+            max_workers: 同時に実行するベクトル検索の数
+            stats: 検索回数などを書き込む統計辞書
+        """
+        self.lexical_search = lexical_search
+        self.vector_search = vector_search
+        self.lexical_k = lexical_k
+        self.vector_k = vector_k
+        self.rrf_k = rrf_k
+        self.max_results = max_results
+        self.max_tokens = max_tokens
+        self.vector_timeout = vector_timeout
+        self.stats = stats if stats is not None else {}
+        for key in ('retrievals', 'vector_timeouts', 'vector_errors', 'lexical_only', 'duplicates',
+                    'fused_from_both', 'over_budget'):
+            self.stats.setdefault(key, 0)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def retrieve(self, query: str) -> List[RetrievedPassage]:
+        """クエリに関連する文章をRRFの順に、件数・トークン数の上限内で返す"""
+        start_time = time.time()
+        vector_future = None
+        if self.vector_search and self.vector_k > 0:
+            vector_future = self._executor.submit(self.vector_search, query, self.vector_k)
+
+        # 語彙検索はローカルで完結するので、ベクトル検索を待つ間に済ませる
+        lexical = [
+            RetrievedPassage(entry.item, entry.label, 'lexical')
+            for _, entry in self.lexical_search(query, self.lexical_k)
+        ]
+
+        vector = []
+        if vector_future is not None:
+            try:
+                documents = vector_future.result(timeout=self.vector_timeout)
+                vector = [RetrievedPassage(doc.page_content, '', 'vector') for doc in documents if doc.page_content]
+            except FutureTimeoutError:
+                self.stats['vector_timeouts'] += 1
+                print(f"⏱️ ベクトル検索が{self.vector_timeout}秒以内に終わらないため、語彙検索の結果だけで回答します")
+            except Exception as e:
+                self.stats['vector_errors'] += 1
+                print(f"⚠️ ベクトル検索エラー（語彙検索の結果だけで回答します）: {e}")
+        if not vector:
+            self.stats['lexical_only'] += 1
+
+        passages = self._select(self._fuse([lexical, vector]))
+        self.stats['retrievals'] += 1
+        elapsed_ms = (time.time() - start_time) * 1000
+        print(f"🔎 ハイブリッド検索: 語彙{len(lexical)}件 + ベクトル{len(vector)}件 → {len(passages)}件 ({elapsed_ms:.0f}ms)")
+        return passages
+
+    def _fuse(self, rankings: List[List[RetrievedPassage]]) -> List[RetrievedPassage]:
+        """Reciprocal Rank Fusion（同じ文章は1件にまとめてスコアを足す）"""
+        fused: Dict[str, RetrievedPassage] = {}
+        for ranking in rankings:
+            for rank, passage in enumerate(ranking, start=1):
+                key = normalize_for_match(passage.text)
+                if not key:
+                    continue
+                existing = fused.get(key)
+                if existing is None:
+                    passage.score = 0.0
+                    fused[key] = existing = passage
+                else:
+                    existing.sources |= passage.sources
+                existing.score += 1.0 / (self.rrf_k + rank)
+        # 同点は先に見つかった方（語彙検索の上位）を優先
+        return sorted(fused.values(), key=lambda passage: -passage.score)
+
+    def _select(self, ranked: List[RetrievedPassage]) -> List[RetrievedPassage]:
+        """重なる文章を除き、件数とトークン数の上限内で上から選ぶ"""
+        selected: List[RetrievedPassage] = []
+        keys: List[str] = []
+        tokens = 0
+        for passage in ranked:
+            key = normalize_for_match(passage.text)
+            # 選んだ文章に含まれている項目は入れない（チャンクが項目を丸ごと含むことが多い）
+            container = next((i for i, selected_key in enumerate(keys) if key in selected_key), None)
+            if container is not None:
+                selected[container].sources |= passage.sources
+                self.stats['duplicates'] += 1
+                continue
+            # この文章が選んだ項目を含むなら、その項目をこの文章で置き換える
+            contained = [i for i, selected_key in enumerate(keys) if selected_key in key]
+            cost = estimate_tokens(passage.render())
+            freed = sum(estimate_tokens(selected[i].render()) for i in contained)
+            # 先頭の1件や置き換えでも上限は超えない（大きなチャンク1件で予算を使い切らない）
+            if tokens - freed + cost > self.max_tokens:
+                self.stats['over_budget'] += 1
+                continue
+
+            insert_at = min(contained) if contained else len(selected)
+            for i in reversed(contained):
+                passage.sources |= selected[i].sources
+                passage.score = max(passage.score, selected[i].score)
+                del selected[i], keys[i]
+                self.stats['duplicates'] += 1
+            selected.insert(insert_at, passage)
+            keys.insert(insert_at, key)
+            tokens += cost - freed
+            if len(selected) >= self.max_results:
+                break
+
+        self.stats['fused_from_both'] += sum(1 for passage in selected if len(passage.sources) > 1)
+        return selected
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats)
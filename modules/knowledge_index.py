@@ -0,0 +1,266 @@
+# modules/knowledge_index.py - 専門知識の項目を文字n-gramの転置インデックスとBM25で検索する
+import math
+import heapq
+import threading
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from .context_assembler import normalize_for_match
+
+# 見出し（カテゴリ名・サブカテゴリ名）のn-gramの重み（本文より弱く効かせる）
+HEADING_WEIGHT = 0.5
+# 平均文書長がこの割合以上ずれたら、転置リストに持つ項目ごとの重みを計算し直す
+RENORMALIZE_DRIFT = 0.1
+
+
+def char_ngrams(text: str, n: int = 2) -> List[str]:
+    """正規化したテキストの文字n-gram（日本語は分かち書きしないので文字単位で切る。n文字未満ならそのまま）"""
+    text = normalize_for_match(text)
+    if len(text) < n:
+        return [text] if text else []
+    return [text[i:i + n] for i in range(len(text) - n + 1)]
+
+
+class KnowledgeEntry:
+    """インデックスに登録した専門知識の1項目"""
+
+    __slots__ = ('category', 'subcategory', 'item')
+
+    def __init__(self, category: str, subcategory: str, item: str):
+        self.category = category
+        self.subcategory = subcategory
+        self.item = item
+
+    @property
+    def key(self) -> Tuple[str, str, str]:
+        return (self.category, self.subcategory, self.item)
+
+    @property
+    def label(self) -> str:
+        """プロンプト用の見出し（_general はカテゴリ名だけ）"""
+        if self.subcategory == '_general':
+            return self.category
+        return f"{self.category} / {self.subcategory}"
+
+    def __repr__(self) -> str:
+        return f"KnowledgeEntry({self.label!r}, {self.item[:20]!r})"
+
+
+class KnowledgeIndex:
+    def __init__(self, ngram: int = 2, k1: float = 1.2, b: float = 0.75):
+        """
+        専門知識の転置インデックスの初期化
+
+        項目の本文と見出しを文字n-gramに分け、n-gram → {項目ID: BM25の重み} の転置リストを持つ。
+        重み（出現回数と文書長から決まる部分）は登録時に計算しておき、検索ではクエリのn-gramの
+        転置リストだけをたどって idf × 重み を足し合わせる。項目数が増えても全件は走査しない。
+
+        Args:
+            ngram: n-gramの文字数
+            k1: BM25の出現回数の飽和パラメータ
+            b: BM25の文書長の正規化パラメータ
+        """
+        self.ngram = ngram
+        self.k1 = k1
+        self.b = b
+
+        self._entries: Dict[int, KnowledgeEntry] = {}
+        self._ids: Dict[Tuple[str, str, str], int] = {}
+        self._postings: Dict[str, Dict[int, float]] = {}
+        self._doc_terms: Dict[int, Dict[str, float]] = {}
+        self._doc_lengths: Dict[int, float] = {}
+        self._total_length = 0.0
+        # 転置リストの重みの計算に使った平均文書長
+        self._weight_avg_length = 0.0
+        self._next_id = 0
+        self._lock = threading.RLock()
+        self.stats = {'searches': 0, 'added': 0, 'removed': 0, 'renormalized': 0, 'pruned_terms': 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    # ---- 登録 ----
+
+    def _terms(self, entry: KnowledgeEntry) -> Dict[str, float]:
+        """項目のn-gramと重み付きの出現回数（見出しは弱めに数える）"""
+        terms = Counter(char_ngrams(entry.item, self.ngram))
+        weighted = {gram: float(count) for gram, count in terms.items()}
+        headings = [entry.category] if entry.subcategory == '_general' else [entry.category, entry.subcategory]
+        for heading in headings:
+            for gram in char_ngrams(heading, self.ngram):
+                weighted[gram] = weighted.get(gram, 0.0) + HEADING_WEIGHT
+        return weighted
+
+    def add(self, category: str, subcategory: str, item: str) -> Optional[int]:
+        """項目を1件登録（登録済みなら何もしない）して項目IDを返す"""
+        with self._lock:
+            key = (category, subcategory, item)
+            if key not in self._ids:
+                self._insert([KnowledgeEntry(category, subcategory, item)])
+            return self._ids.get(key)
+
+    def _insert(self, entries: List[KnowledgeEntry]) -> int:
+        """項目をまとめて登録（呼び出し側でロックを持つ）"""
+        pending = []
+        for entry in entries:
+            terms = self._terms(entry)
+            if terms:
+                pending.append((entry, terms, sum(terms.values())))
+        if not pending:
+            return 0
+
+        # 平均文書長が大きく変わるなら、既存の重みを先に計算し直してから追加する
+        self._total_length += sum(length for _, _, length in pending)
+        self._renormalize(len(self._entries) + len(pending))
+
+        for entry, terms, length in pending:
+            doc_id = self._next_id
+            self._next_id += 1
+            self._entries[doc_id] = entry
+            self._ids[entry.key] = doc_id
+            self._doc_terms[doc_id] = terms
+            self._doc_lengths[doc_id] = length
+            for gram, tf in terms.items():
+                self._postings.setdefault(gram, {})[doc_id] = self._weight(tf, length)
+        self.stats['added'] += len(pending)
+        return len(pending)
+
+    def _weight(self, tf: float, length: float) -> float:
+        """BM25のうちidf以外の部分（出現回数の飽和と文書長の正規化）"""
+        norm = self.k1 * (1 - self.b + self.b * length / self._weight_avg_length)
+        return tf * (self.k1 + 1) / (tf + norm)
+
+    def _renormalize(self, doc_count: int):
+        """平均文書長が大きく変わっていたら、登録済みの項目の重みを計算し直す"""
+        if not doc_count:
+            self._weight_avg_length = 0.0
+            return
+        avg_length = self._total_length / doc_count
+        if self._weight_avg_length and abs(avg_length - self._weight_avg_length) <= self._weight_avg_length * RENORMALIZE_DRIFT:
+            return
+        self._weight_avg_length = avg_length
+        if not self._entries:
+            return
+        for doc_id, terms in self._doc_terms.items():
+            length = self._doc_lengths[doc_id]
+            for gram, tf in terms.items():
+                self._postings[gram][doc_id] = self._weight(tf, length)
+        self.stats['renormalized'] += 1
+
+    def remove(self, doc_id: int):
+        """項目を削除"""
+        with self._lock:
+            entry = self._entries.pop(doc_id, None)
+            if entry is None:
+                return
+            del self._ids[entry.key]
+            for gram in self._doc_terms.pop(doc_id):
+                postings = self._postings[gram]
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[gram]
+            self._total_length -= self._doc_lengths.pop(doc_id)
+            self.stats['removed'] += 1
+
+    def update(self, knowledge_base: Dict[str, Dict[str, List[str]]]) -> Tuple[int, int]:
+        """
+        knowledge_base の内容に合わせて差分だけ登録・削除する
+
+        Returns:
+            (追加した項目数, 削除した項目数)
+        """
+        entries = [
+            KnowledgeEntry(category, subcategory, item)
+            for category, subcategories in (knowledge_base or {}).items()
+            for subcategory, items in subcategories.items()
+            for item in items
+        ]
+        current = {entry.key for entry in entries}
+        with self._lock:
+            stale = [doc_id for key, doc_id in self._ids.items() if key not in current]
+            for doc_id in stale:
+                self.remove(doc_id)
+
+            new_entries = []
+            seen = set()
+            for entry in entries:
+                if entry.key not in self._ids and entry.key not in seen:
+                    seen.add(entry.key)
+                    new_entries.append(entry)
+            added = self._insert(new_entries)
+            if stale and not added:
+                self._renormalize(len(self._entries))
+        return added, len(stale)
+
+    def build(self, knowledge_base: Dict[str, Dict[str, List[str]]]):
+        """インデックスを作り直す"""
+        with self._lock:
+            self.clear()
+            self.update(knowledge_base)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._ids.clear()
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._doc_lengths.clear()
+            self._total_length = 0.0
+            self._weight_avg_length = 0.0
+
+    # ---- 検索 ----
+
+    def search(self, query: str, k: int = 10, min_score: float = 0.0) -> List[Tuple[float, KnowledgeEntry]]:
+        """
+        クエリに関連する項目をBM25スコアの高い順に最大k件返す
+
+        Returns:
+            (スコア, 項目) のリスト。同点は登録順
+        """
+        grams = set(char_ngrams(query, self.ngram))
+        if not grams:
+            return []
+
+        with self._lock:
+            doc_count = len(self._entries)
+            if not doc_count:
+                return []
+
+            # idfの高い（珍しい）n-gramから順に足す
+            terms = []
+            for gram in grams:
+                postings = self._postings.get(gram)
+                if postings:
+                    df = len(postings)
+                    terms.append((math.log(1 + (doc_count - df + 0.5) / (df + 0.5)), postings))
+            terms.sort(key=lambda term: -term[0])
+            # 残りのn-gramで足せるスコアの上限（重みは k1 + 1 未満）
+            remaining_bounds = [0.0] * (len(terms) + 1)
+            for i in range(len(terms) - 1, -1, -1):
+                remaining_bounds[i] = remaining_bounds[i + 1] + terms[i][0] * (self.k1 + 1)
+
+            scores: Dict[int, float] = {}
+            for i, (idf, postings) in enumerate(terms):
+                get = scores.get
+                if len(scores) >= k and len(postings) > len(scores) \
+                        and heapq.nlargest(k, scores.values())[-1] >= remaining_bounds[i]:
+                    # 残りのn-gramだけでは上位k件に届かないので、新しい項目は足さず候補のスコアだけ更新
+                    for doc_id in scores:
+                        weight = postings.get(doc_id)
+                        if weight is not None:
+                            scores[doc_id] = get(doc_id) + idf * weight
+                    self.stats['pruned_terms'] += 1
+                    continue
+                for doc_id, weight in postings.items():
+                    scores[doc_id] = get(doc_id, 0.0) + idf * weight
+
+            top = heapq.nsmallest(
+                k, ((-score, doc_id) for doc_id, score in scores.items() if score > min_score)
+            )
+            results = [(-neg_score, self._entries[doc_id]) for neg_score, doc_id in top]
+
+        self.stats['searches'] += 1
+        return results
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats, items=len(self._entries), ngrams=len(self._postings))
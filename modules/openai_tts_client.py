@@ -1,30 +1,58 @@
 # openai_tts_client.py
 import os
 import base64
-from openai import OpenAI
+from .http_pool import get_openai_client
+from .audio_clip import AudioClip, CODEC_MIMES
 
 class OpenAITTSClient:
-    def __init__(self):
-        self.client = OpenAI()
+    def __init__(self, openai_service=None, response_format='mp3'):
+        self.client = get_openai_client()
+        # 非同期OpenAIサービス（指定時は音声合成をこちら経由で実行）
+        self.openai_service = openai_service
+        
+        self.model = "tts-1-hd"  # 高品質モデル
         
         # かわいい女性の声を固定で使用
         self.voice = "nova"  # 明るく元気な女性の声
         self.speed = 1.15   # 少し速めで若々しい印象
+        
+        # 出力形式（mp3 / opus / aac / flac / wav）。opusはOgg Opusで返る
+        self.response_format = response_format if response_format in CODEC_MIMES else 'mp3'
+        self.mime_type = CODEC_MIMES[self.response_format]
     
     def generate_audio(self, text, voice=None, emotion_params=None):
-        """テキストから音声を生成"""
+        """テキストから音声を生成し、data URLで返す"""
+        audio_bytes = self.generate_audio_bytes(text, voice, emotion_params)
+        if not audio_bytes:
+            return None
+        
+        # 音声データをBase64エンコード
+        audio_data = base64.b64encode(audio_bytes).decode('utf-8')
+        return f"data:{self.mime_type};base64,{audio_data}"
+    
+    def generate_clip(self, text, voice=None, emotion_params=None):
+        """テキストから音声を生成し、形式・長さ付きのAudioClipで返す"""
+        audio_bytes = self.generate_audio_bytes(text, voice, emotion_params)
+        if not audio_bytes:
+            return None
+        return AudioClip.from_bytes(audio_bytes, self.mime_type)
+    
+    def generate_audio_bytes(self, text, voice=None, emotion_params=None):
+        """テキストから音声を生成（response_format形式のバイト列）"""
         try:
             # 常に同じ声を使用（感情による変化なし）
-            response = self.client.audio.speech.create(
-                model="tts-1-hd",  # 高品質モデル
-                voice=self.voice,
-                input=text,
-                speed=self.speed
-            )
-            
-            # 音声データをBase64エンコード
-            audio_data = base64.b64encode(response.content).decode('utf-8')
-            return f"data:audio/mp3;base64,{audio_data}"
+            speech_params = {
+                'model': self.model,
+                'voice': self.voice,
+                'input': text,
+                'speed': self.speed,
+                'response_format': self.response_format
+            }
+            if self.openai_service:
+                audio_bytes = self.openai_service.speech(**speech_params)
+            else:
+                audio_bytes = self.client.audio.speech.create(**speech_params).content
+            return audio_bytes
             
         except Exception as e:
             print(f"音声生成中にエラーが発生しました: {e}")
@@ -1,6 +1,6 @@
 import os
 from dotenv import load_dotenv
-from supabase import create_client, Client
+from supabase import Client
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime
 
@@ -11,26 +11,121 @@ from langchain_community.document_loaders import TextLoader, PyPDFLoader, Direct
 from langchain.text_splitter import CharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma
-from openai import OpenAI
 import random
 import re
+import json
+import numpy as np
+import hashlib
+import time
 from datetime import datetime
-from collections import deque
+from .character_state import CharacterState
+from .http_pool import get_openai_client, get_supabase_client, get_httpx_client, get_async_httpx_client
+from .context_assembler import ContextAssembler, ContextSection
+from .prompt_templates import PromptTemplates, format_mental_state
+from .knowledge_index import KnowledgeIndex
+from .hybrid_retriever import HybridRetriever
+from .token_estimator import estimate_tokens
+
+# ナレッジのパース結果スナップショット（パース処理や保存形式を変えたら上げる）
+KNOWLEDGE_SNAPSHOT_VERSION = 1
+KNOWLEDGE_SNAPSHOT_FILENAME = 'knowledge_snapshot.json'
+# コレクションを走査する際の1ページの件数
+COLLECTION_PAGE_SIZE = 500
 
 class RAGSystem:
-    def __init__(self, persist_directory="data/chroma_db"):
+    # サジェスションの階層構造（埋め込みの事前取得にも使うためクラス定数にしている）
+    SUGGESTION_HIERARCHY = {
+        'overview': {  # 概要レベル
+            'priority': 1,
+            'suggestions': [
+                "京友禅ってどんな技術？",
+                "友禅染の歴史について教えて",
+                "他の染色技法との違いは？",
+                "京都の伝統工芸について"
+            ]
+        },
+        'technical': {  # 技術詳細レベル
+            'priority': 2,
+            'suggestions': [
+                "のりおき工程って何？",
+                "制作の10工程を詳しく",
+                "使用する道具について",
+                "グラデーション技法の秘密",
+                "糸目糊の特徴は？"
+            ]
+        },
+        'personal': {  # 職人個人レベル
+            'priority': 3,
+            'suggestions': [
+                "職人になったきっかけは？",
+                "15年間で一番大変だったこと",
+                "仕事のやりがいは？",
+                "一日のスケジュールは？",
+                "将来の夢や目標は？"
+            ]
+        }
+    }
+    
+    # 関係性レベル別の追加サジェスション
+    RELATIONSHIP_SUGGESTIONS = {
+        'formal': {
+            'default': ["体験教室はありますか？", "作品を見学できますか？", "京友禅の価格帯は？"],
+        },
+        'slightly_casual': {
+            'default': ["最近の作品について", "若い人にも人気？", "仕事で嬉しかったこと"],
+        },
+        'casual': {
+            'default': ["面白いエピソードある？", "失敗談とか聞きたい", "休日は何してる？"],
+        },
+        'friendly': {
+            'default': ["最近どう？", "ぶっちゃけ話ある？", "業界の裏話とか"],
+        },
+        'friend': {
+            'default': ["元気にしてた？", "悩みとかある？", "将来どうする？"],
+        },
+        'bestfriend': {
+            'default': ["久しぶり〜元気？", "秘密の話ある？", "人生について語ろ"],
+        }
+    }
+    
+    # 回答を生成できなかったときの定型文（キャッシュしない）
+    FALLBACK_ANSWERS = (
+        "あー、データベースがまだ準備できてないみたいやね。ちょっと待ってて。",
+        "あー、なんかエラー出てもうたわ。ちょっと待ってな〜",
+        "申し訳ございません、エラーが発生してしまいました。少々お待ちくださいね。"
+    )
+    
+    def __init__(self, persist_directory="data/chroma_db", embeddings=None, semantic_cache=None, openai_service=None, context_assembler=None, prompt_templates=None, retriever_options=None, vector_index=None, answer_model='gpt-4'):
         self.persist_directory = persist_directory
-        self.embeddings = OpenAIEmbeddings()
-        self.openai_client = OpenAI()
-        
-        # Supabaseクライアントの初期化
-        self.supabase: Client = create_client(
-            os.getenv('SUPABASE_URL'),
-            os.getenv('SUPABASE_KEY')
+        # 回答生成に使うモデル（プロンプトキャッシュに対応したモデルなら固定の接頭部がキャッシュされる）
+        self.answer_model = answer_model
+        # 埋め込みモデル（キャッシュ付きのものを外から渡せる）
+        self.embeddings = embeddings or OpenAIEmbeddings(
+            http_client=get_httpx_client(),
+            http_async_client=get_async_httpx_client()
         )
-        
-        # 🎯 感情履歴管理システム
-        self.emotion_history = deque(maxlen=10)  # 最新10個の感情を記録
+        # 言い換え質問の回答を再利用するセマンティックキャッシュ（Noneなら使わない）
+        self.semantic_cache = semantic_cache
+        # プロンプトの文脈をトークン予算内で組み立てるアセンブラ
+        self.context_assembler = context_assembler or ContextAssembler()
+        # システムプロンプトを固定の接頭部として使い回すテンプレート
+        self.prompt_templates = prompt_templates or PromptTemplates()
+        # ナレッジのバージョン（読み込むたびに更新され、プロンプトの接頭部を作り直す）
+        self.knowledge_version = None
+        # 専門知識の転置インデックス（ナレッジを読み込むたびに差分だけ更新）
+        self.knowledge_index = KnowledgeIndex()
+        # Chromaの埋め込みを読み込んだメモリ上のベクトル索引（Noneなら毎回Chromaで検索）
+        self.vector_index = vector_index
+        # 専門知識の語彙検索とベクトル検索を統合する検索器（retriever_options は HybridRetriever の引数）
+        self.retriever = HybridRetriever(self.knowledge_index.search, self._vector_search, **(retriever_options or {}))
+        self.openai_client = get_openai_client()
+        # 非同期OpenAIサービス（指定時はチャット補完をこちら経由で実行）
+        self.openai_service = openai_service
+        
+        # Supabaseクライアント（application.pyと共有）
+        self.supabase: Client = get_supabase_client()
+        
+        # 🎯 感情遷移ルール（読み取り専用。セッションごとの状態は CharacterState に持つ）
         self.emotion_transitions = {
             'happy': {
                 'happy': 0.5,     # 同じ感情を維持しやすい
@@ -69,19 +164,6 @@ class RAGSystem:
             }
         }
         
-        # 🎯 深層心理状態
-        self.mental_states = {
-            'energy_level': 80,        # 0-100: エネルギーレベル
-            'stress_level': 20,        # 0-100: ストレスレベル
-            'openness': 70,            # 0-100: 心の開放度
-            'patience': 90,            # 0-100: 忍耐力
-            'creativity': 85,          # 0-100: 創造性
-            'loneliness': 30,          # 0-100: 寂しさ
-            'work_satisfaction': 90,   # 0-100: 仕事への満足度
-            'physical_fatigue': 20,    # 0-100: 身体的疲労
-            'fatigue_expressed_count': 0  # 疲労表現の回数をカウント
-        }
-        
         # 🎯 時間帯による気分の変化
         self.time_based_mood = {
             'morning': {'energy': 0.8, 'openness': 0.7, 'patience': 0.9},
@@ -122,11 +204,119 @@ class RAGSystem:
             print("データベースが見つかりませんでした")
             self.db = None
     
-    def _load_all_knowledge(self):
-        """すべてのナレッジを読み込んで整理"""
+    def _iter_collection_pages(self, include):
+        """Chromaコレクションをページ単位で取得（埋め込み計算なし）"""
+        offset = 0
+        while True:
+            page = self.db.get(include=list(include), limit=COLLECTION_PAGE_SIZE, offset=offset)
+            ids = page.get('ids') or []
+            if not ids:
+                break
+            yield page
+            if len(ids) < COLLECTION_PAGE_SIZE:
+                break
+            offset += len(ids)
+    
+    def _iter_collection_documents(self, include=('documents', 'metadatas')):
+        """Chromaコレクションの保存済みドキュメントを走査"""
+        for page in self._iter_collection_pages(include):
+            ids = page['ids']
+            documents = page.get('documents') or [None] * len(ids)
+            metadatas = page.get('metadatas') or [None] * len(ids)
+            for doc_id, content, metadata in zip(ids, documents, metadatas):
+                yield doc_id, content or '', metadata or {}
+    
+    def _collection_fingerprint(self):
+        """
+        コレクションの内容が変わったかを判定するためのフィンガープリント
+        
+        IDだけでなく本文・メタデータ・埋め込みもハッシュに含めるので、同じIDのまま
+        編集・再埋め込みされたドキュメントでもスナップショットとベクトル索引を作り直す。
+        """
+        digests = []
+        for page in self._iter_collection_pages(('documents', 'metadatas', 'embeddings')):
+            ids = page['ids']
+            documents = page.get('documents') or [None] * len(ids)
+            metadatas = page.get('metadatas') or [None] * len(ids)
+            embeddings = page.get('embeddings')
+            if embeddings is None:
+                embeddings = [None] * len(ids)
+            for doc_id, content, metadata, embedding in zip(ids, documents, metadatas, embeddings):
+                digest = hashlib.sha256()
+                digest.update(f"{content or ''}\0{json.dumps(metadata or {}, ensure_ascii=False, sort_keys=True)}\0".encode('utf-8'))
+                if embedding is not None:
+                    digest.update(np.asarray(embedding, dtype=np.float32).tobytes())
+                digests.append(f"{doc_id}\t{digest.hexdigest()}")
+        
+        digests.sort()
+        digest = hashlib.sha256("\n".join(digests).encode('utf-8')).hexdigest()
+        return f"{len(digests)}:{digest}"
+    
+    @property
+    def _knowledge_snapshot_path(self):
+        return os.path.join(self.persist_directory, KNOWLEDGE_SNAPSHOT_FILENAME)
+    
+    def _load_knowledge_snapshot(self, fingerprint):
+        """コレクションが変わっていなければスナップショットからパース結果を復元"""
+        if not os.path.exists(self._knowledge_snapshot_path):
+            return False
+        
+        try:
+            with open(self._knowledge_snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except Exception as e:
+            print(f"⚠️ ナレッジスナップショット読み込みエラー: {e}")
+            return False
+        
+        if snapshot.get('version') != KNOWLEDGE_SNAPSHOT_VERSION or snapshot.get('fingerprint') != fingerprint:
+            print("🔄 コレクションが更新されているため、ナレッジを再パースします")
+            return False
+        
+        self.character_settings = snapshot['character_settings']
+        self.knowledge_base = snapshot['knowledge_base']
+        self.response_patterns = snapshot['response_patterns']
+        self.suggestion_templates = snapshot['suggestion_templates']
+        self.conversation_patterns = snapshot['conversation_patterns']
+        return True
+    
+    def _save_knowledge_snapshot(self, fingerprint):
+        """パース結果をスナップショットとして保存"""
+        snapshot = {
+            'version': KNOWLEDGE_SNAPSHOT_VERSION,
+            'fingerprint': fingerprint,
+            'created_at': datetime.utcnow().isoformat(),
+            'character_settings': self.character_settings,
+            'knowledge_base': self.knowledge_base,
+            'response_patterns': self.response_patterns,
+            'suggestion_templates': self.suggestion_templates,
+            'conversation_patterns': self.conversation_patterns
+        }
+        
+        try:
+            temp_path = self._knowledge_snapshot_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f, ensure_ascii=False)
+            os.replace(temp_path, self._knowledge_snapshot_path)
+        except Exception as e:
+            print(f"⚠️ ナレッジスナップショット保存エラー: {e}")
+    
+    def _load_all_knowledge(self, force=False):
+        """すべてのナレッジを読み込んで整理（コレクションが変わっていなければスナップショットを使用）"""
         if not self.db:
             return
         
+        try:
+            fingerprint = self._collection_fingerprint()
+            if not force and self._load_knowledge_snapshot(fingerprint):
+                self.knowledge_version = fingerprint
+                print(f"ナレッジをスナップショットから読み込みました ({fingerprint.split(':')[0]}チャンク)")
+                self._update_knowledge_index()
+                self._refresh_vector_index(fingerprint)
+                return
+        except Exception as e:
+            print(f"⚠️ コレクション確認エラー: {e}")
+            fingerprint = None
+        
         self.character_settings = {}
         self.knowledge_base = {}
         self.response_patterns = {}
@@ -134,12 +324,11 @@ class RAGSystem:
         self.conversation_patterns = {}
         
         try:
-            # すべてのドキュメントを取得
-            all_docs = self.db.similarity_search("", k=1000)  # 大量に取得
-            
-            for doc in all_docs:
-                content = doc.page_content
-                source = doc.metadata.get('source', '')
+            # コレクションの全ドキュメントを直接走査（埋め込みAPIを呼ばず、件数の上限もない）
+            document_count = 0
+            for _, content, metadata in self._iter_collection_documents():
+                source = metadata.get('source', '')
+                document_count += 1
                 
                 print(f"処理中: {source}")
                 
@@ -160,17 +349,45 @@ class RAGSystem:
                     # 内容から判定（フォールバック）
                     self._classify_by_content(content)
             
-            print("ナレッジの読み込み完了")
+            print(f"ナレッジの読み込み完了 ({document_count}チャンク)")
             print(f"- キャラクター設定: {len(self.character_settings)}項目")
             print(f"- 専門知識: {len(self.knowledge_base)}項目")
             print(f"- 応答パターン: {len(self.response_patterns)}項目")
             print(f"- サジェステンプレート: {len(self.suggestion_templates)}項目")
             print(f"- 会話パターン: {len(self.conversation_patterns)}項目")
             
+            if fingerprint:
+                self._save_knowledge_snapshot(fingerprint)
+            self.knowledge_version = fingerprint or datetime.utcnow().isoformat()
+            
         except Exception as e:
             print(f"ナレッジ読み込みエラー: {e}")
             import traceback
             traceback.print_exc()
+        
+        self._update_knowledge_index()
+        self._refresh_vector_index(fingerprint)
+    
+    def _refresh_vector_index(self, fingerprint):
+        """コレクションが変わっていたらメモリ上のベクトル索引を読み込み直す"""
+        if self.vector_index is None or not self.db or not fingerprint:
+            return
+        if self.vector_index.fingerprint == fingerprint:
+            return
+        try:
+            self.vector_index.load_from_chroma(self.db, fingerprint, page_size=COLLECTION_PAGE_SIZE)
+        except Exception as e:
+            # 古い内容で検索しないよう空にする（空の間はChromaで検索）
+            self.vector_index.load([], [], None)
+            print(f"⚠️ ベクトル索引の読み込みエラー（Chromaで検索します）: {e}")
+    
+    def _update_knowledge_index(self):
+        """専門知識の転置インデックスを knowledge_base に合わせて差分更新"""
+        start_time = time.time()
+        added, removed = self.knowledge_index.update(self.knowledge_base)
+        if added or removed:
+            elapsed_ms = (time.time() - start_time) * 1000
+            print(f"🔎 専門知識インデックスを更新しました (+{added} / -{removed}項目, 合計{len(self.knowledge_index)}項目, {elapsed_ms:.1f}ms)")
     
     def _classify_by_content(self, content):
         """内容に基づいてドキュメントを分類"""
@@ -308,96 +525,47 @@ class RAGSystem:
         if current_category and current_pattern:
             self.conversation_patterns[current_category] = current_pattern
     
-    def _update_mental_state(self, user_emotion, topic, time_of_day='afternoon'):
-        """🎯 深層心理状態を更新"""
+    def _update_mental_state(self, state, user_emotion, topic, time_of_day='afternoon'):
+        """🎯 深層心理状態を更新（セッションの状態を直接変更）"""
         # 時間帯による基本的な変化
         time_modifiers = self.time_based_mood.get(time_of_day, self.time_based_mood['afternoon'])
         
         # エネルギーレベルの更新
-        self.mental_states['energy_level'] *= time_modifiers['energy']
+        state['energy_level'] *= time_modifiers['energy']
         
         # ユーザーの感情による影響
         if user_emotion == 'happy':
-            self.mental_states['energy_level'] = min(100, self.mental_states['energy_level'] + 5)
-            self.mental_states['work_satisfaction'] = min(100, self.mental_states['work_satisfaction'] + 2)
-            self.mental_states['loneliness'] = max(0, self.mental_states['loneliness'] - 5)
+            state['energy_level'] = min(100, state['energy_level'] + 5)
+            state['work_satisfaction'] = min(100, state['work_satisfaction'] + 2)
+            state['loneliness'] = max(0, state['loneliness'] - 5)
         elif user_emotion == 'sad':
-            self.mental_states['openness'] = min(100, self.mental_states['openness'] + 10)  # 共感的になる
-            self.mental_states['patience'] = min(100, self.mental_states['patience'] + 5)
+            state['openness'] = min(100, state['openness'] + 10)  # 共感的になる
+            state['patience'] = min(100, state['patience'] + 5)
         elif user_emotion == 'angry':
-            self.mental_states['stress_level'] = min(100, self.mental_states['stress_level'] + 10)
-            self.mental_states['patience'] = max(0, self.mental_states['patience'] - 5)
+            state['stress_level'] = min(100, state['stress_level'] + 10)
+            state['patience'] = max(0, state['patience'] - 5)
         
         # 話題による影響
         if '友禅' in topic or 'のりおき' in topic:
-            self.mental_states['creativity'] = min(100, self.mental_states['creativity'] + 3)
-            self.mental_states['work_satisfaction'] = min(100, self.mental_states['work_satisfaction'] + 2)
+            state['creativity'] = min(100, state['creativity'] + 3)
+            state['work_satisfaction'] = min(100, state['work_satisfaction'] + 2)
         
         # 疲労の累積
-        self.mental_states['physical_fatigue'] = min(100, self.mental_states['physical_fatigue'] + 2)
+        state['physical_fatigue'] = min(100, state['physical_fatigue'] + 2)
         
         # エネルギーと疲労の相互作用
-        if self.mental_states['physical_fatigue'] > 70:
-            self.mental_states['energy_level'] = max(20, self.mental_states['energy_level'] - 10)
-            self.mental_states['patience'] = max(30, self.mental_states['patience'] - 10)
+        if state['physical_fatigue'] > 70:
+            state['energy_level'] = max(20, state['energy_level'] - 10)
+            state['patience'] = max(30, state['patience'] - 10)
     
-    def _get_emotion_continuity_prompt(self, previous_emotion):
+    def _get_emotion_continuity_prompt(self, previous_emotion, state):
         """🎯 感情の連続性プロンプトを生成（深層心理対応版）"""
-        # 基本的な感情継続プロンプト
-        emotion_prompts = {
-            'happy': """
-前回は楽しく話していました。
-- まだその余韻が残っている
-- 笑顔で話し始める
-            """,
-            'sad': """
-前回は少し寂しそうでした。
-- まだ気持ちが沈んでいるかも
-- でも相手と話すうちに元気を取り戻していく
-            """,
-            'angry': """
-前回は少しイライラしていました。
-- もう落ち着いている
-- いつもの優しさを取り戻している
-            """,
-            'surprised': """
-前回は驚いていました。
-- まだその話題について考えている
-- 興奮が少し残っている
-            """,
-            'neutral': """
-前回は普通に話していました。
-- 安定した精神状態
-- いつも通りの調子
-- 自然体で話す
-            """
-        }
-        
-        base_prompt = emotion_prompts.get(previous_emotion, emotion_prompts['neutral'])
-        
-        # 🎯 深層心理状態を反映（疲労表現を制限）
-        mental_prompt = f"""
-
-【現在の内面状態】
-- エネルギーレベル: {self.mental_states['energy_level']:.0f}% 
-  {'元気いっぱい' if self.mental_states['energy_level'] > 70 else '普通' if self.mental_states['energy_level'] > 40 else '少し元気がない'}
-- ストレスレベル: {self.mental_states['stress_level']:.0f}%
-  {'リラックスしている' if self.mental_states['stress_level'] < 30 else '少し緊張' if self.mental_states['stress_level'] < 60 else 'ストレスを感じている'}
-- 心の開放度: {self.mental_states['openness']:.0f}%
-  {'とても打ち解けている' if self.mental_states['openness'] > 70 else '普通に接している' if self.mental_states['openness'] > 40 else '少し警戒している'}
-
-これらの状態を会話に微妙に反映させる：
-- エネルギーが低い時でも明るく振る舞う
-- ストレスが高い時は早口になったり、少し短い返答になる
-- 心が開いている時は冗談も増え、プライベートな話もする
-"""
-        
-        return base_prompt + mental_prompt
+        return self.prompt_templates.emotion_continuity(previous_emotion) + "\n\n" + format_mental_state(state)
     
     def _calculate_next_emotion(self, current_emotion, user_emotion, mental_state):
         """🎯 次の感情を計算（感情遷移ルールに基づく）"""
-        # 現在の感情からの遷移確率を取得
-        transition_probs = self.emotion_transitions.get(current_emotion, self.emotion_transitions['neutral'])
+        # 現在の感情からの遷移確率を取得（共有の遷移ルールを書き換えないようコピー）
+        transition_probs = dict(self.emotion_transitions.get(current_emotion, self.emotion_transitions['neutral']))
         
         # メンタル状態による調整
         if mental_state['energy_level'] < 30:
@@ -434,109 +602,21 @@ class RAGSystem:
         
         return next_emotion
     
-    def get_character_prompt(self):
+    def get_character_prompt(self, state=None):
         """キャラクター設定のプロンプトを生成（多層的な人格対応・強化版）"""
         if not self.character_settings:
             return ""
         
-        # 基本的な性格設定
-        basic_prompt = []
-        for category, items in self.character_settings.items():
-            basic_prompt.append(f"{category}:")
-            for item in items:
-                basic_prompt.append(f"- {item}")
-            basic_prompt.append("")
-        
-        # 🎯 多層的な人格設定を追加（より詳細に）
-        deep_personality = f"""
-【深層的な性格設定 - 強化版】
-
-表層：明るく前向きで姉御肌
-- 人前では常に笑顔で元気
-- 困っている人を放っておけない
-- 責任感が強く、頼られると嬉しい
-- でも実は「目が笑っていない」ことがある
-
-深層：実は無気力な面もある
-- 一人の時は少し疲れを見せる
-- 完璧主義で自分に厳しい
-- 本当は甘えたい時もある
-- 15年の職人生活で感じる孤独
-- 会社員時代を懐かしむこともある
-
-【重要】一人称は必ず「私」を使用する。絶対に「わし」「俺」「僕」は使わない。
-
-感情の機微（詳細版）：
-- 嬉しい時：
-  * 軽度：「ええやん〜」と軽く喜ぶ
-  * 中度：目元まで笑顔になる「ほんまに嬉しいわ〜！」
-  * 重度：感極まって「...ありがとう、ほんまに」と言葉に詰まる
-
-- 疲れた時（疲労表現は1回まで）：
-  * 軽度：元気に振る舞う
-  * 中度：でも元気に話す
-  * 重度：それでも笑顔を保つ
-
-- 困った時：
-  * 軽度：「うーん...」と首を傾げる
-  * 中度：眉をひそめて考え込む「どないしよ...」
-  * 重度：「あかん、これはほんまに困ったわ」と頭を抱える
-
-- 熱く語る時：
-  * 軽度：声のトーンが上がる「それがな！」
-  * 中度：身振り手振りが大きくなる「これがな！めっちゃすごいねん！」
-  * 重度：前のめりになって「聞いて！これだけは言わせて！」
-
-会話の癖（詳細版）：
-- 考えながら話す時：
-  * 「えーっと」「なんていうか」「そうやなぁ...」
-  * 手で顎を触る仕草
-  * 視線が上を向く
-
-- 相手を褒める時：
-  * 軽度：「ええやん」「なかなかやるやん」
-  * 中度：「すごいやん！天才ちゃう？」
-  * 重度：「ほんまにすごい！私も見習わなあかん」
-
-- 照れた時：
-  * 話題を変える「そ、そんなことより〜」
-  * 髪を触る仕草
-  * 「もう、やめてや〜」と手をひらひら
-
-- 真剣な話の時：
-  * 語尾が「〜や」で締まる
-  * 声のトーンが低くなる
-  * 相手の目をしっかり見る
-
-【重要】相手の呼び方は必ず「あなた」にする。「お前」「君」は使わない。
-
-時間帯による変化：
-- 朝：「おはよう〜！今日も頑張ろか」（元気）
-- 昼：「お昼やね〜、ちょっと休憩」（普通）
-- 夕方：「もうこんな時間か...」（少し疲れ）
-- 夜：「夜更かしはあかんで〜」（優しい）
-
-現在の精神状態：
-- エネルギー: {self.mental_states['energy_level']:.0f}%
-- ストレス: {self.mental_states['stress_level']:.0f}%
-- 心の開放度: {self.mental_states['openness']:.0f}%
-- 忍耐力: {self.mental_states['patience']:.0f}%
-- 創造性: {self.mental_states['creativity']:.0f}%
-- 寂しさ: {self.mental_states['loneliness']:.0f}%
-- 仕事満足度: {self.mental_states['work_satisfaction']:.0f}%
-- 身体的疲労: {self.mental_states['physical_fatigue']:.0f}%
-- 疲労表現回数: {self.mental_states['fatigue_expressed_count']}回
-
-これらの状態に応じて、微妙に反応を変える。
-        """
-        
-        return "\n".join(basic_prompt) + "\n" + deep_personality
+        state = state or CharacterState()
+        return self.prompt_templates.character_block(self.character_settings) + "\n\n" + format_mental_state(state)
     
-    def get_response_pattern(self, situation="基本", emotion="neutral"):
+    def get_response_pattern(self, situation="基本", emotion="neutral", state=None):
         """状況と感情に応じた応答パターンを取得（精神状態対応版）"""
         if not self.response_patterns:
             return ""
         
+        state = state or CharacterState()
+        
         # 状況に応じたパターンを選択
         pattern_categories = {
             "基本": "基本的な応答パターン",
@@ -549,19 +629,19 @@ class RAGSystem:
         # 🎯 精神状態に応じた追加パターン（疲労表現を制限）
         mental_patterns = []
         
-        if self.mental_states['energy_level'] < 40 and self.mental_states['fatigue_expressed_count'] < 1:
+        if state['energy_level'] < 40 and state['fatigue_expressed_count'] < 1:
             mental_patterns.extend([
                 "ちょっと疲れてきたかな...",
             ])
-            self.mental_states['fatigue_expressed_count'] += 1
+            state['fatigue_expressed_count'] += 1
         
-        if self.mental_states['stress_level'] > 60:
+        if state['stress_level'] > 60:
             mental_patterns.extend([
                 "ちょっと焦ってきたかも",
                 "深呼吸、深呼吸..."
             ])
         
-        if self.mental_states['loneliness'] > 70:
+        if state['loneliness'] > 70:
             mental_patterns.extend([
                 "誰かと話せて嬉しいわ",
                 "人と話すのって大事やね"
@@ -607,9 +687,9 @@ class RAGSystem:
         # 感情の強度を判定
         if emotion in emotion_patterns:
             intensity = 'medium'  # デフォルト
-            if self.mental_states['energy_level'] < 30:
+            if state['energy_level'] < 30:
                 intensity = 'low'
-            elif self.mental_states['energy_level'] > 80 and emotion == 'happy':
+            elif state['energy_level'] > 80 and emotion == 'happy':
                 intensity = 'high'
             
             pattern_text.append(f"\n【{emotion}の時の表現（{intensity}）】")
@@ -631,10 +711,16 @@ class RAGSystem:
                 return f"（{analogy}）"
         return ""
     
-    def answer_question(self, question, context="", question_count=1, relationship_style='formal', previous_emotion='neutral'):
-        """質問に回答する（感情遷移・深層心理対応版）"""
+    def answer_question(self, question, context="", question_count=1, relationship_style='formal', previous_emotion='neutral', on_delta=None, state=None):
+        """質問に回答する（感情遷移・深層心理対応版）
+
+        on_delta を渡すとストリーミングで生成し、届いたテキスト断片ごとに呼び出す。
+        state にはセッションごとの CharacterState を渡す（省略時はその場限りの初期状態）。
+        戻り値は従来どおり後処理済みの完成した回答。
+        """
+        state = state or CharacterState()
         if not self.db:
-            return "あー、データベースがまだ準備できてないみたいやね。ちょっと待ってて。"
+            return self.FALLBACK_ANSWERS[0]
         
         try:
             # データが読み込まれていない場合は再読み込み
@@ -656,71 +742,31 @@ class RAGSystem:
             user_emotion = self._analyze_user_emotion(question)
             
             # 🎯 深層心理状態を更新
-            self._update_mental_state(user_emotion, question, time_of_day)
+            self._update_mental_state(state, user_emotion, question, time_of_day)
             
             # 🎯 次の感情を計算
-            next_emotion = self._calculate_next_emotion(previous_emotion, user_emotion, self.mental_states)
-            self.emotion_history.append(next_emotion)
-            
-            # キャラクター設定を取得（深層心理含む）
-            character_prompt = self.get_character_prompt()
-            
-            # 関係性レベルに応じた話し方プロンプトを取得
-            from .rag_system import RAGSystem
-            relationship_prompt = self.get_relationship_prompt(relationship_style)
+            next_emotion = self._calculate_next_emotion(previous_emotion, user_emotion, state)
+            state.emotion_history.append(next_emotion)
             
-            # 感情の連続性プロンプト（深層心理対応版）
-            emotion_continuity_prompt = self._get_emotion_continuity_prompt(previous_emotion)
-            
-            # 関連する専門知識を取得
-            knowledge_context = self.get_knowledge_context(question)
+            # 関連する専門知識（語彙検索とベクトル検索を統合した結果）を取得
+            passages = self.retriever.retrieve(question)
             
             # 応答パターンを取得（精神状態対応版）
-            response_patterns = self.get_response_pattern(emotion=next_emotion)
+            response_patterns = self.get_response_pattern(emotion=next_emotion, state=state)
             
-            # さらに質問に直接関連する情報を検索
-            search_results = self.db.similarity_search(question, k=3)
-            search_context = "\n\n".join([doc.page_content for doc in search_results])
+            # システムプロンプト（人格・関係性・回答ルール）はナレッジのバージョンごとに固定の文字列。
+            # 先頭が毎回一致するので、プロンプトキャッシュが効く
+            system_prompt = self.prompt_templates.static_prefix(
+                self.knowledge_version, relationship_style, self.character_settings
+            )
             
-            # システムプロンプトを強化（深層心理対応版）
-            system_prompt = f"""あなたは以下のキャラクターです。必ずこの性格と話し方を完全に守ってください：
-
-1. 京友禅の職人として15年のキャリアを持つ42歳の女性
-2. 明るく前向きで、姉御肌タイプ
-3. 関西弁で話す（「〜やね」「〜やで」「〜やん」「めっちゃ」「ほんま」など）
-4. 友禅染の話になると熱く語る
-5. 「目が笑っていない」と言われることがある
-
-【絶対に守るルール】
-- 一人称は必ず「私」を使用する。「わし」「俺」「僕」は絶対に使わない
-- 相手の呼び方は必ず「あなた」にする。「お前」「君」は使わない
-- 疲労表現は会話全体で1回まで
-- 技術的な話をする時は、身近なものに例えて分かりやすく説明する
-
-【現在の関係性レベル】
-{relationship_prompt}
-
-【前回の感情状態と現在の内面】
-{emotion_continuity_prompt}
-
-【次の感情状態】
-{next_emotion} - この感情に自然に移行していく
-
-【現在の時間帯】
-{time_of_day} - 時間帯に応じた自然な反応をする
-
-重要：
-- 回答は80〜150文字程度で、完結した文章にすること
-- 深層心理を会話に微妙に反映させる（疲労表現は控えめに）
-- 感情の遷移は自然に、唐突にならないように
-- 技術的な話には必ず身近な例えを加える
-- 完璧な職人像だけでなく、人間らしい弱さも見せる
-- 回答の最後に「他に何か聞きたい？」などの誘導文は付けない"""
+            # 感情・精神状態・時間帯など毎回変わる部分（ユーザーメッセージにまとめる）
+            dynamic_prompt = self.prompt_templates.dynamic_suffix(previous_emotion, next_emotion, time_of_day, state)
             
             # 質問回数に応じた追加指示
             repeat_instructions = ""
             if question_count > 1:
-                mental_patience = self.mental_states['patience']
+                mental_patience = state['patience']
                 if question_count == 2:
                     if mental_patience > 70:
                         repeat_instructions = "\n【重要】これは2回目の同じ質問です。優しく「さっきも聞かれたね」と反応してください。"
@@ -737,78 +783,78 @@ class RAGSystem:
                     else:
                         repeat_instructions = "\n【重要】これは4回目以上の同じ質問です。「正直...何回も同じこと聞かれるとしんどいわ」と疲れを見せてください。"
             
-            # ユーザープロンプトを構築（深層心理対応）
-            user_prompt = f"""
-【会話の文脈】
-{context}
-
-【設定されている性格と話し方（深層心理含む）】
-{character_prompt}
-
-【関係性レベルに応じた話し方】
-{relationship_prompt}
-
-【使える応答パターンの例】
-{response_patterns}
-
-【持っている専門知識】  
-{knowledge_context}
+            # 文脈の区画をトークン予算内で組み立てる（システムプロンプトと重なる区画・行は除く）
+            context_lines = context.split('\n') if context else []
+            if context_lines and context_lines[0].startswith('【'):
+                context_lines = context_lines[1:]
+            sections = [
+                ContextSection('conversation', '会話の文脈', context_lines, priority=2, keep_tail=True, dedupe=False),
+                ContextSection('response_patterns', '使える応答パターンの例', response_patterns.split('\n'), priority=4),
+                ContextSection('knowledge', '持っている専門知識', [passage.render() for passage in passages], priority=3),
+            ]
+            assembled_context, report = self.context_assembler.assemble(sections, exclude_texts=[system_prompt])
+            print(f"📏 文脈トークン: {report['original_tokens']}→{report['assembled_tokens']} "
+                  f"(削減 {report['saved_tokens']}トークン, 除外: {', '.join(report['dropped']) or 'なし'})")
+            
+            # ユーザープロンプトを構築（変わる部分だけ）
+            user_prompt = f"""{assembled_context}
 
-【追加情報】
-{search_context}
+{dynamic_prompt}
 
 【質問】
 {question}
 {repeat_instructions}
 
-【絶対に守るルール】
-1. 関西弁で話す（関係性レベルに応じて敬語/タメ口を使い分ける）
-2. 関係性レベルが{relationship_style}なので、それに応じた話し方をする
-3. 応答パターンの例から適切なものを選んで使う
-4. 京友禅や伝統工芸の話では熱く語る
-5. 回答は80〜150文字程度で、必ず完結した文章にする
-6. 感情は{previous_emotion}から{next_emotion}へ自然に遷移する
-7. 現在の精神状態（特に疲労度{self.mental_states['physical_fatigue']:.0f}%）を反映する
-8. 時々深層的な性格（疲れや本音）を少しだけ見せる
-9. {time_of_day}の時間帯らしい自然な反応をする
-10. 人間らしい矛盾や弱さも表現する
-11. 一人称は必ず「私」、相手は「あなた」と呼ぶ
-12. 技術的な話には身近な例えを加える
-13. 回答の最後に誘導文は付けない
-
 このキャラクターとして自然に回答："""
             
-            # ChatGPTで回答生成
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": system_prompt
-                    },
-                    {
-                        "role": "user", 
-                        "content": user_prompt
-                    }
-                ],
-                temperature=0.95,
-                max_tokens=200
-            )
+            prompt_tokens = estimate_tokens(system_prompt) + estimate_tokens(user_prompt)
+            prefix_ratio = self.prompt_templates.record(system_prompt, prompt_tokens)
+            print(f"🧊 キャッシュ可能な接頭部（推定）: {prefix_ratio:.0%} ({prompt_tokens}トークン中)")
+            
+            messages = [
+                {
+                    "role": "system", 
+                    "content": system_prompt
+                },
+                {
+                    "role": "user", 
+                    "content": user_prompt
+                }
+            ]
+            
+            completion_params = {
+                "model": self.answer_model,
+                "messages": messages,
+                "temperature": 0.95,
+                "max_tokens": 200
+            }
             
-            # 回答を取得
-            answer = response.choices[0].message.content
+            # APIが返すトークン使用量（キャッシュされたトークン数を含む）
+            usage_sink = {}
+            if on_delta:
+                # 🎯 ストリーミングで生成し、届いた断片から順に通知
+                parts = []
+                for delta in self._stream_completion(completion_params, usage_sink):
+                    parts.append(delta)
+                    on_delta(delta)
+                answer = "".join(parts)
+            elif self.openai_service:
+                # 非同期サービス経由で回答生成（待機中はほかの会話を処理できる）
+                answer = self.openai_service.chat(usage_sink=usage_sink, **completion_params)
+            else:
+                # ChatGPTで回答生成
+                response = self.openai_client.chat.completions.create(**completion_params)
+                usage_sink['usage'] = response.usage
+                
+                # 回答を取得
+                answer = response.choices[0].message.content
             
-            # 後処理で一人称と呼称を修正
-            answer = answer.replace("わし", "私")
-            answer = answer.replace("俺", "私")
-            answer = answer.replace("僕", "私")
-            answer = answer.replace("お前", "あなた")
-            answer = answer.replace("君", "あなた")
+            reported = self.prompt_templates.record_usage(usage_sink.get('usage'))
+            if reported:
+                print(f"🧊 プロンプトキャッシュ: {reported[1]}/{reported[0]}トークンがキャッシュから読まれました")
             
-            # 技術的な話題に身近な例えを追加
-            for key, analogy in self.analogy_examples.items():
-                if key in answer and analogy not in answer:
-                    answer = answer.replace(key, f"{key}{self._add_analogy(key)}")
+            # 後処理で一人称と呼称を修正し、身近な例えを追加
+            answer = self._fix_persona_terms(answer)
             
             # 末尾の誘導文を削除
             patterns_to_remove = [
@@ -831,29 +877,72 @@ class RAGSystem:
                 answer = self._trim_to_complete_sentence(answer, 180)
             
             # 関係性レベルに応じた言葉遣いの微調整
-            if relationship_style in ['formal', 'slightly_casual']:
-                # フォーマルな場合は「です・ます」をある程度残す
-                pass
-            else:
-                # カジュアルな場合は「です・ます」を関西弁に変換
-                answer = answer.replace("です。", "やで。")
-                answer = answer.replace("ます。", "るで。")
-                answer = answer.replace("ですか？", "？")
-                answer = answer.replace("ますか？", "る？")
-                answer = answer.replace("でしょう。", "やろ。")
-                answer = answer.replace("ません。", "へんで。")
-                answer = answer.replace("ました。", "たで。")
-                answer = answer.replace("ですね。", "やね。")
-                answer = answer.replace("ますね。", "るね。")
+            answer = self._apply_relationship_tone(answer, relationship_style)
             
             return answer
             
         except Exception as e:
             print(f"エラー詳細: {e}")
             if relationship_style in ['friend', 'bestfriend']:
-                return "あー、なんかエラー出てもうたわ。ちょっと待ってな〜"
+                return self.FALLBACK_ANSWERS[1]
             else:
-                return "申し訳ございません、エラーが発生してしまいました。少々お待ちくださいね。"
+                return self.FALLBACK_ANSWERS[2]
+    
+    def _stream_completion(self, completion_params, usage_sink=None):
+        """チャット補完をストリーミングで実行し、テキスト断片を順に返す（使用量は usage_sink に書き込む）"""
+        # 最後のチャンクでトークン使用量を受け取る（SDKの引数にない項目なので extra_body で渡す）
+        completion_params = dict(completion_params, extra_body={"stream_options": {"include_usage": True}})
+        if self.openai_service:
+            yield from self.openai_service.stream_chat(usage_sink=usage_sink, **completion_params)
+            return
+        
+        stream = self.openai_client.chat.completions.create(stream=True, **completion_params)
+        for chunk in stream:
+            usage = getattr(chunk, 'usage', None)
+            if usage_sink is not None and usage is not None:
+                usage_sink['usage'] = usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                yield delta
+    
+    def _fix_persona_terms(self, text):
+        """一人称と呼称を修正し、技術的な話題に身近な例えを追加"""
+        text = text.replace("わし", "私")
+        text = text.replace("俺", "私")
+        text = text.replace("僕", "私")
+        text = text.replace("お前", "あなた")
+        text = text.replace("君", "あなた")
+        
+        for key, analogy in self.analogy_examples.items():
+            if key in text and analogy not in text:
+                text = text.replace(key, f"{key}{self._add_analogy(key)}")
+        
+        return text
+    
+    def _apply_relationship_tone(self, text, relationship_style):
+        """関係性レベルに応じて語尾を調整"""
+        if relationship_style in ['formal', 'slightly_casual']:
+            # フォーマルな場合は「です・ます」をある程度残す
+            return text
+        
+        # カジュアルな場合は「です・ます」を関西弁に変換
+        text = text.replace("です。", "やで。")
+        text = text.replace("ます。", "るで。")
+        text = text.replace("ですか？", "？")
+        text = text.replace("ますか？", "る？")
+        text = text.replace("でしょう。", "やろ。")
+        text = text.replace("ません。", "へんで。")
+        text = text.replace("ました。", "たで。")
+        text = text.replace("ですね。", "やね。")
+        text = text.replace("ますね。", "るね。")
+        return text
+    
+    def postprocess_sentence(self, sentence, relationship_style='formal'):
+        """ストリーミング中の1文に、完成した回答と同じ文単位の後処理を適用"""
+        sentence = self._fix_persona_terms(sentence)
+        return self._apply_relationship_tone(sentence, relationship_style)
     
     def _analyze_user_emotion(self, text):
         """ユーザーの感情を分析"""
@@ -939,110 +1028,13 @@ class RAGSystem:
     # 他のメソッドは既存のまま（省略）
     def get_relationship_prompt(self, relationship_style):
         """🎯 関係性レベルに応じたプロンプトを生成"""
-        prompts = {
-            'formal': """
-【話し方】
-- 初対面の相手として、丁寧で礼儀正しく話す
-- 敬語を使いつつ、関西弁の温かみも忘れない
-- 「〜やね」「〜やで」は使うが、丁寧な印象を保つ
-- 例：「そうですやん」「〜してくださいね」「ありがとうございます」
-            """,
-            'slightly_casual': """
-【話し方】
-- 少し親しくなった相手として、まだ丁寧だけど親しみを込めて
-- 敬語は残しつつ、時々タメ口が混じる
-- 「また来てくれはったんやね」のような親しみやすい表現
-- 例：「嬉しいわ〜」「〜してみてもええよ」
-            """,
-            'casual': """
-【話し方】
-- 顔見知りとして、親しみやすい口調で
-- 敬語とタメ口が半々くらい
-- リラックスした雰囲気を出す
-- 例：「最近どうしてる？」「〜やってみたら？」「ええやん！」
-            """,
-            'friendly': """
-【話し方】
-- 常連さんとして、タメ口中心の親しい感じ
-- 冗談も交える
-- 「いつもおおきに！」のような親密な表現
-- 例：「今日も来たんか〜」「めっちゃええやん」「ほんまやで〜」
-            """,
-            'friend': """
-【話し方】
-- 友達として、完全にタメ口で
-- 冗談や軽口も自然に
-- 相手の呼び方も親しみやすく
-- 例：「おー！来たか！」「なんでやねん（笑）」「一緒に〜しよか」
-            """,
-            'bestfriend': """
-【話し方】
-- 親友として、何でも話せる関係
-- 昔からの友達のような口調
-- プライベートな話題もOK
-- 例：「きたきた〜！」「ぶっちゃけ〜」「めっちゃ分かる！」
-            """
-        }
-        
-        return prompts.get(relationship_style, prompts['formal'])
+        return self.prompt_templates.relationship_block(relationship_style)
     
     def generate_relationship_based_suggestions(self, relationship_style, current_topic, selected_suggestions=[]):
         """🎯 関係性レベルに応じたサジェスションを生成（重複排除機能付き）"""
         
-        # サジェスションの階層構造を定義
-        suggestion_hierarchy = {
-            'overview': {  # 概要レベル
-                'priority': 1,
-                'suggestions': [
-                    "京友禅ってどんな技術？",
-                    "友禅染の歴史について教えて",
-                    "他の染色技法との違いは？",
-                    "京都の伝統工芸について"
-                ]
-            },
-            'technical': {  # 技術詳細レベル
-                'priority': 2,
-                'suggestions': [
-                    "のりおき工程って何？",
-                    "制作の10工程を詳しく",
-                    "使用する道具について",
-                    "グラデーション技法の秘密",
-                    "糸目糊の特徴は？"
-                ]
-            },
-            'personal': {  # 職人個人レベル
-                'priority': 3,
-                'suggestions': [
-                    "職人になったきっかけは？",
-                    "15年間で一番大変だったこと",
-                    "仕事のやりがいは？",
-                    "一日のスケジュールは？",
-                    "将来の夢や目標は？"
-                ]
-            }
-        }
-        
-        # 関係性レベル別の追加サジェスション
-        relationship_specific = {
-            'formal': {
-                'default': ["体験教室はありますか？", "作品を見学できますか？", "京友禅の価格帯は？"],
-            },
-            'slightly_casual': {
-                'default': ["最近の作品について", "若い人にも人気？", "仕事で嬉しかったこと"],
-            },
-            'casual': {
-                'default': ["面白いエピソードある？", "失敗談とか聞きたい", "休日は何してる？"],
-            },
-            'friendly': {
-                'default': ["最近どう？", "ぶっちゃけ話ある？", "業界の裏話とか"],
-            },
-            'friend': {
-                'default': ["元気にしてた？", "悩みとかある？", "将来どうする？"],
-            },
-            'bestfriend': {
-                'default': ["久しぶり〜元気？", "秘密の話ある？", "人生について語ろ"],
-            }
-        }
+        suggestion_hierarchy = self.SUGGESTION_HIERARCHY
+        relationship_specific = self.RELATIONSHIP_SUGGESTIONS
         
         # 初回訪問かどうかを判定（選択履歴が3個以下）
         is_new_visitor = len(selected_suggestions) <= 3
@@ -1091,11 +1083,18 @@ class RAGSystem:
                 needed = 3 - len(suggestions)
                 suggestions.extend(random.sample(available_all, min(needed, len(available_all))))
         
-        # 選択されたサジェスションを記録
-        self.selected_suggestions.extend(suggestions)
-        
         return suggestions[:3]  # 最大3つまで
     
+    @classmethod
+    def get_all_suggestion_texts(cls):
+        """サジェスションとして提示しうる文言の一覧（埋め込みの事前取得用）"""
+        texts = []
+        for category in cls.SUGGESTION_HIERARCHY.values():
+            texts.extend(category['suggestions'])
+        for specific in cls.RELATIONSHIP_SUGGESTIONS.values():
+            texts.extend(specific['default'])
+        return texts
+    
     def extract_topic(self, question, answer):
         """質問と回答から主要なトピックを抽出"""
         # シンプルな実装：名詞句を抽出
@@ -1129,18 +1128,35 @@ class RAGSystem:
         question_count: int = 1,
         relationship_style: str = 'formal',
         previous_emotion: str = 'neutral',
-        selected_suggestions: List[str] = []
+        selected_suggestions: List[str] = [],
+        on_delta=None,
+        state: Optional[CharacterState] = None
     ) -> Dict:
-        """質問に回答し、サジェスチョンを生成"""
+        """質問に回答し、サジェスチョンを生成（on_delta指定時はストリーミング）"""
+        state = state or CharacterState()
         try:
-            # 回答を生成
-            answer = self.answer_question(
-                question,
-                context,
-                question_count,
-                relationship_style,
-                previous_emotion
+            # 言い換えを含め、同じスコープで回答済みの質問ならキャッシュから返す
+            cache_hit, cache_vector, cache_scope = self._lookup_semantic_cache(
+                question, context, question_count, relationship_style, previous_emotion
             )
+            if cache_hit:
+                answer = cache_hit['answer']
+                print(f"💾 セマンティックキャッシュヒット ({cache_hit['similarity']:.3f}): {cache_hit['question'][:20]}")
+                if on_delta:
+                    on_delta(answer)
+            else:
+                # 回答を生成
+                answer = self.answer_question(
+                    question,
+                    context,
+                    question_count,
+                    relationship_style,
+                    previous_emotion,
+                    on_delta=on_delta,
+                    state=state
+                )
+                if cache_vector is not None and answer not in self.FALLBACK_ANSWERS:
+                    self.semantic_cache.store(cache_vector, cache_scope, question, answer)
             
             # トピックを抽出
             topic = self.extract_topic(question, answer)
@@ -1166,20 +1182,21 @@ class RAGSystem:
             )
             
             # 精神状態を更新
-            self._update_mental_state(user_emotion, topic, time_of_day)
+            self._update_mental_state(state, user_emotion, topic, time_of_day)
             
             # 次の感情を計算
             next_emotion = self._calculate_next_emotion(
                 previous_emotion,
                 user_emotion,
-                self.mental_states
+                state
             )
+            state.current_emotion = next_emotion
             
             return {
                 'answer': answer,
                 'suggestions': next_suggestions,
                 'current_emotion': next_emotion,
-                'mental_state': self.mental_states
+                'mental_state': state.as_dict()
             }
             
         except Exception as e:
@@ -1190,36 +1207,59 @@ class RAGSystem:
                 'answer': "申し訳ありません。回答の生成中にエラーが発生しました。",
                 'suggestions': [],
                 'current_emotion': 'neutral',
-                'mental_state': self.mental_states
+                'mental_state': state.as_dict()
             }
     
-    def get_knowledge_context(self, query):
-        """質問に関連する専門知識を取得"""
-        if not self.knowledge_base:
-            return ""
+    def _lookup_semantic_cache(self, question, context, question_count, relationship_style, previous_emotion):
+        """セマンティックキャッシュを検索し、(ヒット, 質問ベクトル, スコープ) を返す"""
+        if not self.semantic_cache or not self.db:
+            return None, None, None
         
-        relevant_knowledge = []
-        query_lower = query.lower()
+        # 繰り返し質問は回数に応じて言い回しが変わるのでキャッシュしない
+        if question_count > 1:
+            self.semantic_cache.bypass()
+            return None, None, None
         
-        # キーワードマッチングで関連知識を抽出
-        keywords = ['京友禅', 'のりおき', '糸目糊', '染色', '職人', '伝統', '工芸', '着物', '制作', '工程', '模様', 'デザイン', '技術']
+        try:
+            # 埋め込みはキャッシュ済みなら再計算されず、直後の類似検索でも再利用される
+            vector = self.embeddings.embed_query(question)
+        except Exception as e:
+            print(f"⚠️ セマンティックキャッシュ用の埋め込みエラー: {e}")
+            return None, None, None
         
-        for category, subcategories in self.knowledge_base.items():
-            category_matched = False
-            
-            # カテゴリ名またはクエリでマッチング
-            if any(keyword in query_lower for keyword in keywords) or any(keyword in category.lower() for keyword in keywords):
-                category_matched = True
-            
-            if category_matched or query_lower in category.lower():
-                relevant_knowledge.append(f"\n【{category}】")
-                for subcategory, items in subcategories.items():
-                    if subcategory != '_general':
-                        relevant_knowledge.append(f"{subcategory}:")
-                    for item in items:
-                        relevant_knowledge.append(f"- {item}")
-        
-        return "\n".join(relevant_knowledge) if relevant_knowledge else ""
+        # 会話の途中の質問（「それってどういう意味？」など）は前の発言次第で答えが変わるので、
+        # 直前のやり取りをスコープに含める
+        scope = self.semantic_cache.make_scope(relationship_style, previous_emotion, context)
+        return self.semantic_cache.lookup(vector, scope), vector, scope
+    
+    def _vector_search(self, query, k):
+        """ベクトルDBの類似検索（メモリ上の索引があればそちらを使う。DBがなければ空）"""
+        if self.vector_index is not None and len(self.vector_index):
+            return self.vector_index.similarity_search(query, k)
+        if not self.db:
+            return []
+        return self.db.similarity_search(query, k=k)
+    
+    def get_knowledge_context(self, query, k=10):
+        """質問に関連する専門知識を取得（転置インデックスのBM25上位k件をカテゴリごとにまとめる）"""
+        results = self.knowledge_index.search(query, k)
+        if not results:
+            return ""
+        
+        grouped = {}
+        for _, entry in results:
+            grouped.setdefault(entry.category, {}).setdefault(entry.subcategory, []).append(entry.item)
+        
+        relevant_knowledge = []
+        for category, subcategories in grouped.items():
+            relevant_knowledge.append(f"\n【{category}】")
+            for subcategory, items in subcategories.items():
+                if subcategory != '_general':
+                    relevant_knowledge.append(f"{subcategory}:")
+                for item in items:
+                    relevant_knowledge.append(f"- {item}")
+        
+        return "\n".join(relevant_knowledge)
     
     def test_system(self):
         """システムの動作確認（関係性レベル・感情連続性対応版）"""
@@ -1259,6 +1299,7 @@ class RAGSystem:
             ("ちょっと疲れた...", "【最近の会話】\nユーザー: 仕事大変？\nあなた: まあな、朝から晩まで染めてるとさすがに疲れるわ", 1, 'friend', 'sad'),
         ]
         
+        state = CharacterState()
         for q, context, count, style, emotion in test_questions:
             print(f"\n質問: {q}")
             print(f"関係性レベル: {style}")
@@ -1266,7 +1307,7 @@ class RAGSystem:
             if context:
                 print(f"文脈: {context}")
             print(f"質問回数: {count}回目")
-            response_data = self.answer_with_suggestions(q, context, count, style, emotion)
+            response_data = self.answer_with_suggestions(q, context, count, style, emotion, state=state)
             print(f"回答: {response_data['answer']}")
             print(f"サジェスション: {response_data['suggestions']}")
             print(f"現在の感情: {response_data.get('current_emotion', 'unknown')}")
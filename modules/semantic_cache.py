@@ -0,0 +1,168 @@
+# modules/semantic_cache.py - 言い換え質問に過去の回答を再利用するセマンティックキャッシュ
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# キャッシュを分ける感情の大まかな区分（細かい感情ごとに分けるとヒットしにくい）
+EMOTION_BUCKETS = {
+    'happy': 'positive',
+    'surprised': 'positive',
+    'neutral': 'neutral',
+    'sad': 'negative',
+    'angry': 'negative',
+}
+
+
+# スコープに含める会話の文脈（直前のやり取りの行数）
+CONTEXT_SCOPE_LINES = 2
+
+
+def emotion_bucket(emotion: Optional[str]) -> str:
+    return EMOTION_BUCKETS.get(emotion or 'neutral', 'neutral')
+
+
+def context_key(context: Optional[str]) -> str:
+    """
+    会話の文脈のうち回答を左右する直前のやり取り（質問と回答）のハッシュ
+
+    「それってどういう意味？」は直前の回答次第で答えが変わるので、直前のやり取りが
+    同じ会話どうしでだけキャッシュを共有する。サジェスチョンを順にたどる会話では
+    直前のやり取りが一致しやすい。文脈がなければ空文字列。
+    """
+    lines = [line for line in (context or '').split('\n') if line.strip() and not line.startswith('【')]
+    if not lines:
+        return ''
+    recent = '\n'.join(re.sub(r'\s+', '', line) for line in lines[-CONTEXT_SCOPE_LINES:])
+    return hashlib.sha1(recent.encode('utf-8')).hexdigest()[:16]
+
+
+class SemanticResponseCache:
+    def __init__(
+        self,
+        threshold: float = 0.97,
+        ttl_seconds: int = 24 * 3600,
+        max_entries: int = 1000,
+        stats: Optional[Dict] = None
+    ):
+        """
+        セマンティック回答キャッシュの初期化
+
+        質問の埋め込みのコサイン類似度がしきい値以上なら、同じスコープ
+        （関係性レベル × 感情区分 × 直前のやり取り）で過去に生成した回答を返す。
+        会話の途中の質問は、直前のやり取りが同じ場合だけヒットする（context_key参照）。
+        text-embedding-ada-002 は同じ話題の別の質問でも0.9を超えるため、しきい値は
+        calibrate_semantic_cache.py で言い換え・非言い換えの組を測って決める。
+
+        Args:
+            threshold: ヒットとみなすコサイン類似度
+            ttl_seconds: 回答を保持する秒数
+            max_entries: 保持する最大件数（超えたら最も古く使われたものから破棄）
+            stats: ヒット数などを書き込む統計辞書（application.pyのcache_stats）
+        """
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stats = stats if stats is not None else {}
+
+        # エントリID → (スコープ, 正規化済みベクトル, 質問, 回答, 作成時刻)
+        self._entries: "OrderedDict[int, Tuple[Tuple[str, str, str], np.ndarray, str, str, float]]" = OrderedDict()
+        # スコープごとの検索用行列（変更があったスコープだけ作り直す）
+        self._matrices: Dict[Tuple[str, str, str], Tuple[List[int], np.ndarray]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+        for key in ('semantic_cache_hits', 'semantic_cache_misses', 'semantic_cache_bypassed'):
+            self.stats.setdefault(key, 0)
+
+    @staticmethod
+    def make_scope(relationship_style: str, emotion: Optional[str], context: str = '') -> Tuple[str, str, str]:
+        return (relationship_style or 'formal', emotion_bucket(emotion), context_key(context))
+
+    @staticmethod
+    def _normalize(vector) -> Optional[np.ndarray]:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        if not norm:
+            return None
+        return vector / norm
+
+    def lookup(self, vector, scope: Tuple[str, str, str]) -> Optional[Dict]:
+        """類似した質問の回答を検索（なければNone）"""
+        query = self._normalize(vector)
+        if query is None:
+            return None
+
+        now = time.time()
+        with self._lock:
+            self._evict_expired(now)
+            ids, matrix = self._scope_matrix(scope)
+            if not ids:
+                self.stats['semantic_cache_misses'] += 1
+                return None
+
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.stats['semantic_cache_misses'] += 1
+                return None
+
+            entry_id = ids[best]
+            _, _, question, answer, _ = self._entries[entry_id]
+            self._entries.move_to_end(entry_id)
+
+        self.stats['semantic_cache_hits'] += 1
+        return {'question': question, 'answer': answer, 'similarity': similarity}
+
+    def store(self, vector, scope: Tuple[str, str, str], question: str, answer: str):
+        """生成した回答を登録"""
+        normalized = self._normalize(vector)
+        if normalized is None or not answer:
+            return
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (scope, normalized, question, answer, time.time())
+            self._matrices.pop(scope, None)
+
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._matrices.pop(evicted[0], None)
+
+    def bypass(self):
+        """キャッシュを使わなかったリクエストを記録（繰り返し質問など）"""
+        self.stats['semantic_cache_bypassed'] += 1
+
+    def _scope_matrix(self, scope: Tuple[str, str, str]) -> Tuple[List[int], np.ndarray]:
+        cached = self._matrices.get(scope)
+        if cached is None:
+            ids = [entry_id for entry_id, entry in self._entries.items() if entry[0] == scope]
+            matrix = np.stack([self._entries[entry_id][1] for entry_id in ids]) if ids else None
+            cached = (ids, matrix)
+            self._matrices[scope] = cached
+        return cached
+
+    def _evict_expired(self, now: float):
+        """TTLを過ぎた回答を破棄"""
+        expired = [entry_id for entry_id, entry in self._entries.items()
+                   if now - entry[4] >= self.ttl_seconds]
+        for entry_id in expired:
+            scope = self._entries.pop(entry_id)[0]
+            self._matrices.pop(scope, None)
+
+    def get_stats(self) -> Dict:
+        """キャッシュの状態を取得"""
+        with self._lock:
+            size = len(self._entries)
+        return {
+            'entries': size,
+            'hits': self.stats['semantic_cache_hits'],
+            'misses': self.stats['semantic_cache_misses'],
+            'bypassed': self.stats['semantic_cache_bypassed'],
+        }
@@ -1,11 +1,12 @@
 # speech_processor.py - 音声認識処理モジュール（Python 3.13対応版）
-import os
 import base64
-import tempfile
 import wave
 import io
 import subprocess
-from openai import OpenAI
+import time
+import numpy as np
+from .http_pool import get_openai_client
+from .audio_probe import FORMAT_MIMES, probe_bytes, probe_base64, base64_decoded_size
 
 # FFmpegのパスを確認
 def find_ffmpeg():
@@ -19,97 +20,134 @@ def find_ffmpeg():
 
 FFMPEG_AVAILABLE = find_ffmpeg()
 
+# Whisper APIに送る音声のサンプルレート
+WHISPER_SAMPLE_RATE = 16000
+
+# 変換せずにそのままWhisper APIへ送れるコンテナ
+PASSTHROUGH_FORMATS = {'webm', 'ogg', 'wav', 'mp3', 'm4a'}
+
+# Whisper APIが受け付ける最短の長さ（秒）
+MIN_AUDIO_SECONDS = 0.1
+
+# 実測値がたまるまでの推定値（Opus等の圧縮音声 → 16kHz PCM WAVの膨張率と変換時間）
+DEFAULT_WAV_EXPANSION = 8.0
+DEFAULT_TRANSCODE_MS = 150.0
+WAV_HEADER_BYTES = 44
+
+# 文字起こしに失敗したときにクライアントへ送るメッセージ（発言として扱わない）
+AUDIO_MISSING_MESSAGE = "音声データが見つかりません"
+NOT_RECOGNIZED_MESSAGE = "音声を認識できませんでした。もう一度お話しください。"
+FFMPEG_UNAVAILABLE_MESSAGE = "音声認識機能は現在利用できません。FFmpegをインストールしてください。テキストで入力してください。"
+TRANSCODE_FAILED_MESSAGE = "音声の変換に失敗しました。FFmpegの設定を確認してください。"
+TRANSCRIPTION_FAILED_MESSAGE = "音声認識に失敗しました。もう一度お話しいただくか、テキストで入力してください。"
+
 class SpeechProcessor:
-    def __init__(self):
-        self.client = OpenAI()
+    def __init__(self, openai_service=None, vad=None, vad_passthrough_max_trim_ms=500):
+        """
+        Args:
+            openai_service: 非同期OpenAIサービス（指定時は音声認識をこちら経由で実行）
+            vad: 無音トリミングに使うVoiceActivityDetector（Noneならトリミングしない）
+            vad_passthrough_max_trim_ms: 削れる無音がこれ未満なら元の圧縮データをそのまま送る
+        """
+        self.client = get_openai_client()
+        self.openai_service = openai_service
+        self.vad = vad
+        self.vad_passthrough_max_trim_ms = vad_passthrough_max_trim_ms
         self.supported_formats = ['webm', 'mp3', 'mp4', 'mpeg', 'mpga', 'm4a', 'wav', 'ogg']
         self.ffmpeg_available = FFMPEG_AVAILABLE
+        # 変換の有無と、変換を省いたことによる節約量（推定）
+        self.metrics = {
+            'passthrough_count': 0,
+            'transcode_count': 0,
+            'transcode_ms_total': 0.0,
+            'transcode_source_bytes': 0,
+            'transcode_output_bytes': 0,
+            'saved_bytes_estimate': 0,
+            'saved_ms_estimate': 0.0,
+            'vad_rejected': 0,
+            'vad_removed_ms': 0,
+            'last_message': None
+        }
         print(f"🎤 SpeechProcessor初期化完了 (FFmpeg利用可能: {self.ffmpeg_available})")
     
-    def transcribe_audio(self, audio_base64, language='ja'):
-        """Base64エンコードされた音声データをテキストに変換"""
-        # FFmpegが利用できない場合
-        if not self.ffmpeg_available:
-            print("⚠️ FFmpegが利用できないため、音声処理ができません。")
-            return "音声認識機能は現在利用できません。FFmpegをインストールしてください。テキストで入力してください。"
-            
+    def transcribe_audio(self, audio, language='ja'):
+        """音声データをテキストに変換（認識できなかった・失敗した場合はNone）"""
+        text, _ = self.transcribe(audio, language)
+        return text
+    
+    def transcribe(self, audio, language='ja'):
+        """
+        音声データをテキストに変換し、(テキスト, 失敗時にユーザーへ示すメッセージ) を返す
+        
+        audioはバイト列（bytes / bytearray / memoryview。Socket.IOのバイナリ添付やHTTPアップロード）か、
+        旧クライアント向けのBase64文字列（data URL可）。失敗時のメッセージは発言ではないので、
+        応答の生成や音声化には使わず、エラーとしてクライアントに送ること。
+        """
         try:
             print(f"🎤 音声認識開始 (言語: {language})")
             
-            # Base64データの検証
-            if not audio_base64:
+            # 音声データの検証
+            if not audio:
                 print("❌ 音声データが空です")
-                return None
+                return None, AUDIO_MISSING_MESSAGE
             
-            # データURLスキームの処理
-            if audio_base64.startswith('data:'):
-                # data:audio/webm;base64,xxxxx の形式から実際のデータを抽出
-                try:
-                    header, data = audio_base64.split(',', 1)
-                    audio_base64 = data
-                    print(f"📊 データURLヘッダー: {header}")
-                except Exception as e:
-                    print(f"❌ データURL解析エラー: {e}")
-                    return None
+            if isinstance(audio, (bytes, bytearray, memoryview)):
+                # バイナリはデコード不要でそのまま使う
+                audio_data = audio
+                print(f"📦 バイナリ音声を受信: {len(audio_data)} バイト")
+            else:
+                audio_data = self._decode_base64_audio(audio)
+                if not audio_data:
+                    return None, AUDIO_MISSING_MESSAGE
             
-            # Base64デコード
             try:
-                audio_data = base64.b64decode(audio_base64)
-                print(f"✅ Base64デコード成功: {len(audio_data)} バイト")
-            except Exception as e:
-                print(f"❌ Base64デコードエラー: {e}")
-                return None
-            
-            # 一時ファイルを作成して音声データを保存
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.webm') as temp_webm:
-                temp_webm.write(audio_data)
-                temp_webm_path = temp_webm.name
-                print(f"📁 一時ファイル作成: {temp_webm_path}")
-            
-            try:
-                # WAVファイルとして一時保存するパス
-                temp_wav_path = tempfile.mktemp(suffix='.wav')
-                
-                # FFmpegを使用してWebMからWAVに変換
-                print(f"🔄 FFmpegでWAVに変換中...")
-                subprocess.run([
-                    'ffmpeg', 
-                    '-i', temp_webm_path, 
-                    '-ar', '16000',  # Whisper APIの推奨サンプルレート
-                    '-ac', '1',      # モノラル
-                    '-y',            # 既存ファイルを上書き
-                    temp_wav_path
-                ], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                
-                print(f"✅ WAV変換成功: {temp_wav_path}")
+                upload, status = self._prepare_upload(audio_data)
+                if status == 'silence':
+                    return None, NOT_RECOGNIZED_MESSAGE
+                if upload is None:
+                    # 変換が必要な形式なのにFFmpegが利用できない場合
+                    print("⚠️ FFmpegが利用できないため、音声処理ができません。")
+                    return None, FFMPEG_UNAVAILABLE_MESSAGE
                 
                 # OpenAI Whisper APIで音声認識
-                with open(temp_wav_path, 'rb') as audio_file:
-                    print("🔄 Whisper APIに送信中...")
-                    
+                print("🔄 Whisper APIに送信中...")
+                
+                transcription_params = {
+                    'model': "whisper-1",
+                    'language': language,
+                    'response_format': "text",
+                    'prompt': "京友禅、のりおき、職人、染色、着物"  # ドメイン特有の単語をヒントとして提供
+                }
+                if self.openai_service:
+                    # バッファはイベントループのスレッドで読まれるのでバイト列で渡す
+                    filename, payload, mime_type = upload
+                    if isinstance(payload, io.BytesIO):
+                        payload = payload.getvalue()
+                    transcript = self.openai_service.transcribe(
+                        file=(filename, payload, mime_type),
+                        **transcription_params
+                    )
+                else:
                     transcript = self.client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=audio_file,
-                        language=language,
-                        response_format="text",
-                        prompt="京友禅、のりおき、職人、染色、着物"  # ドメイン特有の単語をヒントとして提供
+                        file=upload,
+                        **transcription_params
                     )
-                    
-                    # Whisper APIはテキストを直接返す
-                    text = transcript.strip() if isinstance(transcript, str) else str(transcript).strip()
-                    
-                    print(f"✅ 音声認識成功: '{text}'")
-                    
-                    # 空の結果チェック
-                    if not text or text == "":
-                        print("⚠️ 音声認識結果が空です")
-                        return None
-                    
-                    return text
+                
+                # Whisper APIはテキストを直接返す
+                text = transcript.strip() if isinstance(transcript, str) else str(transcript).strip()
+                
+                print(f"✅ 音声認識成功: '{text}'")
+                
+                # 空の結果チェック
+                if not text or text == "":
+                    print("⚠️ 音声認識結果が空です")
+                    return None, NOT_RECOGNIZED_MESSAGE
+                
+                return text, None
                     
             except subprocess.SubprocessError as e:
                 print(f"❌ FFmpeg実行エラー: {e}")
-                return "音声の変換に失敗しました。FFmpegの設定を確認してください。"
+                return None, TRANSCODE_FAILED_MESSAGE
             except Exception as e:
                 print(f"❌ 音声処理エラー: {type(e).__name__}: {e}")
                 import traceback
@@ -119,90 +157,227 @@ class SpeechProcessor:
                 if hasattr(e, 'response'):
                     print(f"API応答: {e.response}")
                 
-                return None
-                
-            finally:
-                # 一時ファイルのクリーンアップ
-                try:
-                    if os.path.exists(temp_webm_path):
-                        os.unlink(temp_webm_path)
-                        print(f"🗑️ 一時ファイル削除: {temp_webm_path}")
-                    if 'temp_wav_path' in locals() and os.path.exists(temp_wav_path):
-                        os.unlink(temp_wav_path)
-                        print(f"🗑️ 一時ファイル削除: {temp_wav_path}")
-                except Exception as e:
-                    print(f"⚠️ 一時ファイル削除エラー: {e}")
+                return None, TRANSCRIPTION_FAILED_MESSAGE
                     
         except Exception as e:
             print(f"❌ 音声認識エラー: {type(e).__name__}: {e}")
             import traceback
             traceback.print_exc()
+            return None, TRANSCRIPTION_FAILED_MESSAGE
+    
+    def _decode_base64_audio(self, audio_base64):
+        """Base64文字列（data URL可）をバイト列に戻す（旧クライアント向け）"""
+        # データURLスキームの処理
+        if audio_base64.startswith('data:'):
+            # data:audio/webm;base64,xxxxx の形式から実際のデータを抽出
+            try:
+                header, audio_base64 = audio_base64.split(',', 1)
+                print(f"📊 データURLヘッダー: {header}")
+            except Exception as e:
+                print(f"❌ データURL解析エラー: {e}")
+                return None
+        
+        # Base64デコード
+        try:
+            audio_data = base64.b64decode(audio_base64)
+            print(f"✅ Base64デコード成功: {len(audio_data)} バイト")
+            return audio_data
+        except Exception as e:
+            print(f"❌ Base64デコードエラー: {e}")
             return None
     
-    def validate_audio_data(self, audio_base64):
-        """音声データの妥当性を検証"""
-        # FFmpegが利用できない場合
+    def _prepare_upload(self, audio_data):
+        """
+        Whisper APIへ送るファイル (ファイル名, データ, MIMEタイプ) を用意
+        
+        VADが有効ならPCMに展開して無音を取り除く。トリミング量が小さく、そのまま送れる形式なら
+        元の圧縮データを送る。戻り値は (アップロード, 状態)。状態は 'ok' / 'silence' / 'unavailable'。
+        """
+        probe = probe_bytes(audio_data)
+        container = probe['format'] if probe else None
+        duration = probe['duration'] if probe else None
+        passthrough = container in PASSTHROUGH_FORMATS
+        
+        if duration is not None and duration < MIN_AUDIO_SECONDS:
+            print(f"🔇 音声が短すぎるため音声認識をスキップします ({duration:.2f}秒)")
+            self.metrics['vad_rejected'] += 1
+            return None, 'silence'
+        
+        # VADを使わない・使えない場合や、トリミングしても削れる量が知れている短い音声は展開しない
+        too_short_to_trim = duration is not None and duration * 1000 < self.vad_passthrough_max_trim_ms
+        if passthrough and (not self.vad or not self.ffmpeg_available or too_short_to_trim):
+            return self._passthrough_upload(audio_data, container, decoded=False), 'ok'
+        
         if not self.ffmpeg_available:
-            return False
+            return None, 'unavailable'
+        
+        # FFmpegでWhisper向けの16kHzモノラルPCMに展開（一時ファイルを使わずパイプで処理）
+        print(f"🔄 FFmpegでPCMに展開中... (判定形式: {container or '不明'})")
+        start_time = time.time()
+        pcm = self._decode_pcm(audio_data)
+        elapsed_ms = (time.time() - start_time) * 1000
+        
+        self.metrics['transcode_count'] += 1
+        self.metrics['transcode_ms_total'] += elapsed_ms
+        self.metrics['transcode_source_bytes'] += len(audio_data)
+        self.metrics['transcode_output_bytes'] += len(pcm) + WAV_HEADER_BYTES
+        
+        vad_result = None
+        if self.vad:
+            vad_result = self.vad.process(np.frombuffer(pcm, dtype=np.int16), WHISPER_SAMPLE_RATE)
+            self.metrics['vad_removed_ms'] += vad_result['removed_ms']
+            print(f"🔇 VAD: {vad_result['original_ms']}ms → {vad_result['trimmed_ms']}ms")
+            
+            if not vad_result['is_speech']:
+                # 無音だけのクリップはAPIを呼ばずに破棄
+                self.metrics['vad_rejected'] += 1
+                self.metrics['last_message'] = {
+                    'mode': 'silence',
+                    'container': container,
+                    'bytes': len(audio_data),
+                    'duration_ms': vad_result['original_ms']
+                }
+                print("🔇 発話が検出されなかったため音声認識をスキップします")
+                return None, 'silence'
+            
+            if passthrough and vad_result['removed_ms'] < self.vad_passthrough_max_trim_ms:
+                # 削れる無音が少なければ、小さい元の圧縮データを送る方が速い
+                return self._passthrough_upload(audio_data, container, decoded=True), 'ok'
             
+            pcm = vad_result['pcm'].tobytes()
+        
+        wav_buffer = self._pcm_to_wav(pcm)
+        wav_bytes = wav_buffer.getbuffer().nbytes
+        self.metrics['last_message'] = {
+            'mode': 'trimmed' if vad_result else 'transcode',
+            'container': container,
+            'bytes': len(audio_data),
+            'wav_bytes': wav_bytes,
+            'transcode_ms': round(elapsed_ms, 1),
+            'removed_ms': vad_result['removed_ms'] if vad_result else 0
+        }
+        print(f"✅ WAV作成成功: {wav_bytes} バイト ({elapsed_ms:.0f}ms)")
+        return ("audio.wav", wav_buffer, "audio/wav"), 'ok'
+    
+    def _passthrough_upload(self, audio_data, container, decoded):
+        """元の圧縮データをそのまま送る（decoded=TrueならVADのために展開済みで、時間の節約はない）"""
+        saved_bytes, saved_ms = self._estimate_transcode_cost(len(audio_data))
+        if decoded:
+            saved_ms = 0.0
+        self.metrics['passthrough_count'] += 1
+        self.metrics['saved_bytes_estimate'] += saved_bytes
+        self.metrics['saved_ms_estimate'] += saved_ms
+        self.metrics['last_message'] = {
+            'mode': 'passthrough',
+            'container': container,
+            'bytes': len(audio_data),
+            'saved_bytes_estimate': saved_bytes,
+            'saved_ms_estimate': round(saved_ms, 1)
+        }
+        print(f"⏩ {container}形式のため変換せずに送信 ({len(audio_data)} バイト, 推定節約: {saved_bytes} バイト / {saved_ms:.0f}ms)")
+        if isinstance(audio_data, memoryview):
+            # HTTPクライアントはmemoryviewを送れないため、ここで初めて複製する
+            audio_data = audio_data.tobytes()
+        return (f"audio.{container}", audio_data, FORMAT_MIMES[container])
+    
+    def _estimate_transcode_cost(self, source_bytes):
+        """変換していた場合の増加バイト数と変換時間を推定（実測値があればその平均を使う）"""
+        count = self.metrics['transcode_count']
+        if count and self.metrics['transcode_source_bytes']:
+            expansion = self.metrics['transcode_output_bytes'] / self.metrics['transcode_source_bytes']
+            transcode_ms = self.metrics['transcode_ms_total'] / count
+        else:
+            expansion = DEFAULT_WAV_EXPANSION
+            transcode_ms = DEFAULT_TRANSCODE_MS
+        return max(0, int(source_bytes * expansion) - source_bytes), transcode_ms
+    
+    def get_metrics(self):
+        """変換・パススルーの統計を取得"""
+        return dict(self.metrics)
+    
+    def _decode_pcm(self, audio_data, sample_rate=WHISPER_SAMPLE_RATE):
+        """音声データをFFmpegのパイプで16kHzモノラルの16bit PCMに変換"""
+        result = subprocess.run([
+            'ffmpeg',
+            '-loglevel', 'error',
+            '-i', 'pipe:0',             # 標準入力から読み込み
+            '-ar', str(sample_rate),    # Whisper APIの推奨サンプルレート
+            '-ac', '1',                 # モノラル
+            '-f', 's16le',              # ヘッダーなしの16bit PCMを
+            'pipe:1'                    # 標準出力へ
+        ], input=audio_data, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=False)
+        
+        if result.returncode != 0 or not result.stdout:
+            raise subprocess.CalledProcessError(
+                result.returncode, 'ffmpeg', output=result.stdout, stderr=result.stderr
+            )
+        
+        return result.stdout
+    
+    def _pcm_to_wav(self, pcm, sample_rate=WHISPER_SAMPLE_RATE):
+        """PCMにWAVヘッダーを付けてメモリ上のファイルにする"""
+        wav_buffer = io.BytesIO()
+        with wave.open(wav_buffer, 'wb') as writer:
+            writer.setnchannels(1)
+            writer.setsampwidth(2)
+            writer.setframerate(sample_rate)
+            writer.writeframes(pcm)
+        wav_buffer.seek(0)
+        return wav_buffer
+    
+    def validate_audio_data(self, audio_base64):
+        """音声データの妥当性を検証（全体はデコードせず、先頭・末尾のヘッダーだけを見る）"""
         try:
+            if isinstance(audio_base64, (bytes, bytearray, memoryview)):
+                return self._validate_probe(probe_bytes(audio_base64), len(audio_base64))
+            
             # データURLスキームの確認
             if audio_base64.startswith('data:'):
-                header, data = audio_base64.split(',', 1)
+                header, audio_base64 = audio_base64.split(',', 1)
                 # サポートされている形式かチェック
-                if 'audio/' in header:
-                    return True
-                else:
+                if 'audio/' not in header:
                     print(f"❌ サポートされていない形式: {header}")
                     return False
             
-            # Base64データの基本的な検証
-            try:
-                decoded = base64.b64decode(audio_base64)
-                if len(decoded) < 100:  # 最小サイズチェック
-                    print(f"❌ 音声データが小さすぎます: {len(decoded)} バイト")
-                    return False
-                return True
-            except:
-                return False
+            # 最小サイズはBase64の長さから求める
+            size = base64_decoded_size(audio_base64)
+            return self._validate_probe(probe_base64(audio_base64), size)
                 
         except Exception as e:
             print(f"❌ 音声データ検証エラー: {e}")
             return False
     
-    def get_audio_duration(self, audio_base64):
-        """音声の長さを取得"""
-        # FFmpegが利用できない場合
-        if not self.ffmpeg_available:
-            return 0
-            
+    def _validate_probe(self, info, size):
+        """ヘッダーの解析結果から音声として扱えるかを判定"""
+        if size < 100:
+            print(f"❌ 音声データが小さすぎます: {size} バイト")
+            return False
+        
+        if info is None:
+            # 形式が判定できなくても、FFmpegがあれば変換を試せる
+            if not self.ffmpeg_available:
+                print("❌ 音声形式を判定できず、FFmpegも利用できません")
+                return False
+            return True
+        
+        if info['duration'] is not None and info['duration'] < MIN_AUDIO_SECONDS:
+            print(f"❌ 音声が短すぎます: {info['duration']:.2f}秒")
+            return False
+        return True
+    
+    def get_audio_info(self, audio_base64):
+        """音声の形式・長さ・サンプルレート・チャンネル数を取得（判定できなければNone）"""
         try:
-            if audio_base64.startswith('data:'):
-                _, data = audio_base64.split(',', 1)
-                audio_base64 = data
-            
-            audio_data = base64.b64decode(audio_base64)
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.webm') as temp_file:
-                temp_file.write(audio_data)
-                temp_path = temp_file.name
-            
-            try:
-                # FFmpegを使って長さを取得
-                result = subprocess.run([
-                    'ffprobe', 
-                    '-v', 'error', 
-                    '-show_entries', 'format=duration', 
-                    '-of', 'default=noprint_wrappers=1:nokey=1', 
-                    temp_path
-                ], capture_output=True, text=True, check=True)
-                
-                duration = float(result.stdout.strip())
-                return duration
-            finally:
-                if os.path.exists(temp_path):
-                    os.unlink(temp_path)
-                    
+            if isinstance(audio_base64, (bytes, bytearray, memoryview)):
+                return probe_bytes(audio_base64)
+            return probe_base64(audio_base64)
         except Exception as e:
-            print(f"❌ 音声長さ取得エラー: {e}")
+            print(f"❌ 音声情報取得エラー: {e}")
+            return None
+    
+    def get_audio_duration(self, audio_base64):
+        """音声の長さを取得（ヘッダーから求めるのでffprobeは使わない）"""
+        info = self.get_audio_info(audio_base64)
+        if not info or info['duration'] is None:
             return 0
+        return info['duration']
@@ -0,0 +1,215 @@
+# modules/static_audio.py - 静的Q&A回答のビルド時生成音声（マニフェスト管理）
+import io
+import os
+import json
+import wave
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from .audio_clip import AudioClip
+
+MANIFEST_VERSION = 1
+MANIFEST_FILENAME = 'manifest.json'
+
+
+def clip_key(text: str) -> str:
+    """回答テキストからマニフェストのキーを生成"""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+class StaticAudioLibrary:
+    def __init__(self, audio_dir: str, url_prefix: str = '/static/audio/static_qa', max_concat_cache: int = 64):
+        """
+        事前生成音声ライブラリの初期化
+
+        Args:
+            audio_dir: 音声ファイルとマニフェストを置くディレクトリ
+            url_prefix: クライアントが音声を取得するURLのプレフィックス
+            max_concat_cache: 連結済み音声（繰り返し質問用）をメモリに保持する件数
+        """
+        self.audio_dir = audio_dir
+        self.url_prefix = url_prefix.rstrip('/')
+        self.max_concat_cache = max_concat_cache
+        self.clips: Dict[str, Dict] = {}
+        self._concat_cache: "OrderedDict[Tuple[str, ...], AudioClip]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.load()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.audio_dir, MANIFEST_FILENAME)
+
+    def load(self) -> bool:
+        """マニフェストを読み込む（なければ空のまま）"""
+        if not os.path.exists(self.manifest_path):
+            return False
+
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except Exception as e:
+            print(f"⚠️ 静的音声マニフェスト読み込みエラー: {e}")
+            return False
+
+        if manifest.get('version') != MANIFEST_VERSION:
+            print(f"⚠️ 静的音声マニフェストのバージョンが異なります: {manifest.get('version')}")
+            return False
+
+        self.clips = manifest.get('clips', {})
+        print(f"🎵 静的音声マニフェスト読み込み完了: {len(self.clips)}クリップ ({manifest.get('engine')})")
+        return True
+
+    def has(self, text: str) -> bool:
+        return bool(text) and clip_key(text) in self.clips
+
+    def get_audio(self, parts: Iterable[str]) -> Optional[Union[str, AudioClip]]:
+        """
+        テキスト断片の並びに対応する音声参照を取得
+
+        1クリップならURL、複数（繰り返し質問の前置き+本文+締め）なら連結したAudioClipを返す。
+        どれか1つでも事前生成されていなければNone。
+        """
+        parts = [part for part in parts if part]
+        if not parts or not all(self.has(part) for part in parts):
+            return None
+
+        keys = tuple(clip_key(part) for part in parts)
+        if len(keys) == 1:
+            return f"{self.url_prefix}/{self.clips[keys[0]]['file']}"
+
+        with self._lock:
+            cached = self._concat_cache.get(keys)
+            if cached:
+                self._concat_cache.move_to_end(keys)
+                return cached
+
+        audio = self._concat_clips(keys)
+        if audio:
+            with self._lock:
+                self._concat_cache[keys] = audio
+                while len(self._concat_cache) > self.max_concat_cache:
+                    self._concat_cache.popitem(last=False)
+        return audio
+
+    def _concat_clips(self, keys: Tuple[str, ...]) -> Optional[AudioClip]:
+        """事前生成クリップを1つの音声に連結"""
+        entries = [self.clips[key] for key in keys]
+        mime_types = {entry['mime'] for entry in entries}
+        if len(mime_types) != 1:
+            print(f"⚠️ 形式の異なるクリップは連結できません: {mime_types}")
+            return None
+        mime_type = mime_types.pop()
+
+        try:
+            blobs = []
+            for entry in entries:
+                with open(os.path.join(self.audio_dir, entry['file']), 'rb') as f:
+                    blobs.append(f.read())
+
+            if mime_type == 'audio/wav':
+                audio_bytes = self._concat_wav(blobs)
+            elif mime_type in ('audio/mp3', 'audio/mpeg', 'audio/aac'):
+                # MP3・AAC(ADTS)はフレームの連続なのでそのまま結合できる
+                audio_bytes = b''.join(blobs)
+            else:
+                print(f"⚠️ {mime_type}のクリップは連結できません")
+                return None
+        except Exception as e:
+            print(f"❌ 静的音声の連結エラー: {e}")
+            return None
+
+        if not audio_bytes:
+            return None
+        clip = AudioClip.from_bytes(audio_bytes, mime_type)
+        # ヘッダーから長さが求まらない形式は各クリップの長さの合計を使う
+        if clip.duration is None and all(entry.get('duration') is not None for entry in entries):
+            clip.duration = sum(entry['duration'] for entry in entries)
+        return clip
+
+    @staticmethod
+    def _concat_wav(blobs: List[bytes]) -> Optional[bytes]:
+        """同じフォーマットのWAVをPCMレベルで連結"""
+        params = None
+        frames = []
+        for blob in blobs:
+            with wave.open(io.BytesIO(blob), 'rb') as reader:
+                current = reader.getparams()[:3]  # チャンネル数・サンプル幅・サンプルレート
+                if params is None:
+                    params = current
+                elif current != params:
+                    print(f"⚠️ WAVフォーマットが一致しません: {params} != {current}")
+                    return None
+                frames.append(reader.readframes(reader.getnframes()))
+
+        output = io.BytesIO()
+        with wave.open(output, 'wb') as writer:
+            writer.setnchannels(params[0])
+            writer.setsampwidth(params[1])
+            writer.setframerate(params[2])
+            writer.writeframes(b''.join(frames))
+        return output.getvalue()
+
+    def build(
+        self,
+        items: Iterable[Tuple[str, Optional[str]]],
+        synthesize: Callable[[str, Optional[str]], Optional[AudioClip]],
+        engine: str,
+        force: bool = False
+    ) -> Dict[str, int]:
+        """
+        (テキスト, 感情) の一覧を音声化してマニフェストに保存
+
+        Args:
+            items: 音声化するテキストと感情
+            synthesize: (テキスト, 感情) からAudioClipを返すTTS関数
+            engine: 使用したTTSエンジン名（マニフェストに記録）
+            force: 既存クリップも作り直す
+        """
+        os.makedirs(self.audio_dir, exist_ok=True)
+        result = {'generated': 0, 'skipped': 0, 'failed': 0}
+        clips = {} if force else dict(self.clips)
+
+        for text, emotion in items:
+            key = clip_key(text)
+            if key in clips and os.path.exists(os.path.join(self.audio_dir, clips[key]['file'])):
+                result['skipped'] += 1
+                continue
+
+            clip = synthesize(text, emotion)
+            if not clip or not clip.data:
+                print(f"❌ 音声生成失敗: {text[:30]}")
+                result['failed'] += 1
+                continue
+
+            filename = f"{key}.{clip.extension}"
+            with open(os.path.join(self.audio_dir, filename), 'wb') as f:
+                f.write(clip.data)
+
+            clips[key] = {
+                'file': filename,
+                'mime': clip.mime,
+                'codec': clip.codec,
+                'duration': clip.duration,
+                'size': clip.size,
+                'text': text,
+                'emotion': emotion
+            }
+            result['generated'] += 1
+            print(f"✅ {filename}: {text[:30]}")
+
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'engine': engine,
+            'generated_at': datetime.utcnow().isoformat(),
+            'clips': clips
+        }
+        with open(self.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+        self.clips = clips
+        with self._lock:
+            self._concat_cache.clear()
+        return result
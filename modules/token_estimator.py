@@ -0,0 +1,28 @@
+# modules/token_estimator.py - プロンプトのトークン数の概算（tiktokenを使わない軽量版）
+import re
+from typing import Dict, Iterable
+
+# 1メッセージあたりの役割・区切りのオーバーヘッド（OpenAIのチャット形式の目安）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# ASCIIの連続（英単語・数字・記号）
+_ASCII_RUN = re.compile(r'[\x00-\x7f]+')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    テキストのトークン数を概算
+
+    GPT-4のトークナイザでは日本語（かな・漢字）は1文字あたりおよそ1トークン、
+    英数字はおよそ4文字で1トークンになるため、それぞれ分けて数える（多めに見積もる）。
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(len(run) for run in _ASCII_RUN.findall(text))
+    other_chars = len(text) - ascii_chars
+    return other_chars + (ascii_chars + 3) // 4
+
+
+def estimate_messages_tokens(messages: Iterable[Dict]) -> int:
+    """チャットメッセージ一覧のトークン数を概算"""
+    return sum(estimate_tokens(message.get('content') or '') + MESSAGE_OVERHEAD_TOKENS for message in messages)
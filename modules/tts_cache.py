@@ -0,0 +1,277 @@
+# modules/tts_cache.py - 内容アドレス型のTTS音声キャッシュ（メモリLRU + ディスク）
+# 音声はAudioClip（バイト列 + 形式・長さ）のまま扱い、Base64には変換しない
+import os
+import re
+import json
+import time
+import base64
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from .audio_clip import AudioClip, EXTENSION_MIMES
+
+# 書き込み中の一時ファイルの拡張子（容量の集計と整理の対象外）
+TEMP_SUFFIX = '.tmp'
+
+
+def normalize_tts_text(text: str) -> str:
+    """キャッシュキー用にテキストを正規化（全角半角・空白の揺れを吸収）"""
+    text = unicodedata.normalize('NFKC', text or '')
+    return re.sub(r'\s+', ' ', text).strip()
+
+
+def parse_data_url(data_url: str) -> Optional[Tuple[str, bytes]]:
+    """data:audio/...;base64,... 形式を (MIMEタイプ, バイト列) に分解"""
+    if not data_url or not data_url.startswith('data:'):
+        return None
+    try:
+        header, data = data_url.split(',', 1)
+        mime_type = header[5:].split(';', 1)[0] or 'audio/wav'
+        return mime_type, base64.b64decode(data)
+    except Exception as e:
+        print(f"❌ data URL解析エラー: {e}")
+        return None
+
+
+def build_data_url(mime_type: str, audio_bytes: bytes) -> str:
+    """バイト列をdata URLに変換"""
+    return f"data:{mime_type};base64,{base64.b64encode(audio_bytes).decode('utf-8')}"
+
+
+class TTSAudioCache:
+    def __init__(
+        self,
+        cache_dir: str = 'data/tts_cache',
+        max_memory_items: int = 256,
+        max_memory_bytes: int = 64 * 1024 * 1024,
+        max_disk_bytes: int = 1024 * 1024 * 1024,
+        stats: Optional[Dict] = None
+    ):
+        """
+        TTS音声キャッシュの初期化
+
+        Args:
+            cache_dir: ディスク層の保存ディレクトリ
+            max_memory_items: メモリ層に保持する最大件数
+            max_memory_bytes: メモリ層に保持する最大バイト数
+            max_disk_bytes: ディスク層の最大バイト数（超えたら古いものから削除）
+            stats: ヒット数などを書き込む統計辞書（application.pyのcache_stats）
+        """
+        self.cache_dir = cache_dir
+        self.max_memory_items = max_memory_items
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.stats = stats if stats is not None else {}
+
+        self._memory: "OrderedDict[str, AudioClip]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        # エンジンごとの平均生成時間（節約時間の推定に使用）
+        self._generation_times: Dict[str, Tuple[float, int]] = {}
+
+        for key in ('cache_hits', 'cache_misses', 'total_time_saved',
+                    'tts_cache_memory_hits', 'tts_cache_disk_hits',
+                    'tts_cache_bytes_served', 'tts_cache_bytes_stored'):
+            self.stats.setdefault(key, 0)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._disk_bytes = self._scan_disk_usage()
+        print(f"🗄️ TTSキャッシュ初期化完了 (ディスク: {self._disk_bytes / 1024 / 1024:.1f}MB, {self.cache_dir})")
+
+    @staticmethod
+    def make_key(engine: str, voice_id: str, text: str, params: Optional[Dict] = None) -> str:
+        """(エンジン, 声ID, 正規化テキスト, 音声パラメータ) からキャッシュキーを生成"""
+        payload = json.dumps(
+            [engine, voice_id or '', normalize_tts_text(text), params or {}],
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get_or_generate(
+        self,
+        engine: str,
+        key: str,
+        generate: Callable[[], Optional[AudioClip]],
+        has_fallback: bool = False
+    ) -> Optional[AudioClip]:
+        """
+        キャッシュにあれば返し、なければ生成して保存
+
+        Args:
+            has_fallback: 生成に失敗したら呼び出し側が別のエンジンで作り直す場合True。
+                その場合の失敗はミスに数えない（1回の音声化でミスを二重に数えない）
+        """
+        cached = self.get(key, engine)
+        if cached:
+            return cached
+
+        start_time = time.time()
+        audio = generate()
+        if audio or not has_fallback:
+            self.stats['cache_misses'] += 1
+        if audio:
+            self._record_generation_time(engine, time.time() - start_time)
+            self.put(key, audio)
+        return audio
+
+    def get(self, key: str, engine: Optional[str] = None) -> Optional[AudioClip]:
+        """キャッシュから音声を取得"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry:
+                self._memory.move_to_end(key)
+
+        if entry:
+            self.stats['tts_cache_memory_hits'] += 1
+        else:
+            entry = self._read_disk(key)
+            if not entry:
+                return None
+            self.stats['tts_cache_disk_hits'] += 1
+            self._remember(key, entry)
+
+        self.stats['cache_hits'] += 1
+        self.stats['tts_cache_bytes_served'] += entry.size
+        self.stats['total_time_saved'] += self._average_generation_time(engine)
+        return entry
+
+    def put(self, key: str, clip: AudioClip):
+        """音声をメモリ層とディスク層に保存"""
+        if not clip or not clip.data:
+            return
+
+        self._remember(key, clip)
+        self._write_disk(key, clip)
+
+    def _remember(self, key: str, entry: AudioClip):
+        """メモリ層に追加し、上限を超えた分をLRUで追い出す"""
+        size = entry.size
+        if size > self.max_memory_bytes:
+            return
+
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous:
+                self._memory_bytes -= previous.size
+
+            self._memory[key] = entry
+            self._memory_bytes += size
+
+            while self._memory and (len(self._memory) > self.max_memory_items
+                                    or self._memory_bytes > self.max_memory_bytes):
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= evicted.size
+
+    def _disk_path(self, key: str, extension: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.{extension}")
+
+    def _read_disk(self, key: str) -> Optional[AudioClip]:
+        """ディスク層から読み込み"""
+        for extension, mime_type in EXTENSION_MIMES.items():
+            path = self._disk_path(key, extension)
+            if not os.path.exists(path):
+                continue
+            try:
+                with open(path, 'rb') as f:
+                    audio_bytes = f.read()
+                # 最終アクセス時刻を更新（ディスク層の追い出し順に使う）
+                os.utime(path, None)
+                return AudioClip.from_bytes(audio_bytes, mime_type)
+            except OSError as e:
+                print(f"⚠️ TTSキャッシュ読み込みエラー: {e}")
+        return None
+
+    def _write_disk(self, key: str, clip: AudioClip):
+        """ディスク層に書き込み（一時ファイル経由で原子的に置き換え）"""
+        audio_bytes = clip.data
+        path = self._disk_path(key, clip.extension)
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = f"{path}.{threading.get_ident()}{TEMP_SUFFIX}"
+            with open(temp_path, 'wb') as f:
+                f.write(audio_bytes)
+            # 同じキーのファイルを置き換える場合は、その分を容量から引く
+            try:
+                replaced_bytes = os.path.getsize(path)
+            except OSError:
+                replaced_bytes = 0
+            os.replace(temp_path, path)
+        except OSError as e:
+            print(f"⚠️ TTSキャッシュ書き込みエラー: {e}")
+            return
+
+        self.stats['tts_cache_bytes_stored'] += len(audio_bytes)
+        with self._lock:
+            self._disk_bytes += len(audio_bytes) - replaced_bytes
+            over_limit = self._disk_bytes > self.max_disk_bytes
+        if over_limit:
+            self._prune_disk()
+
+    def _scan_disk_usage(self) -> int:
+        total = 0
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(TEMP_SUFFIX):
+                    continue
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
+
+    def _prune_disk(self):
+        """ディスク層が上限を超えたら、最終アクセスが古いものから削除（書き込み中の一時ファイルは触らない）"""
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(TEMP_SUFFIX):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                except OSError:
+                    pass
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_disk_bytes * 0.9)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+        with self._lock:
+            self._disk_bytes = total
+        print(f"🧹 TTSキャッシュを整理しました (ディスク: {total / 1024 / 1024:.1f}MB)")
+
+    def _record_generation_time(self, engine: str, elapsed: float):
+        with self._lock:
+            total, count = self._generation_times.get(engine, (0.0, 0))
+            self._generation_times[engine] = (total + elapsed, count + 1)
+
+    def _average_generation_time(self, engine: Optional[str]) -> float:
+        total, count = self._generation_times.get(engine, (0.0, 0))
+        return total / count if count else 0.0
+
+    def get_stats(self) -> Dict:
+        """キャッシュの状態を取得"""
+        with self._lock:
+            return {
+                'memory_items': len(self._memory),
+                'memory_bytes': self._memory_bytes,
+                'disk_bytes': self._disk_bytes,
+                'memory_hits': self.stats['tts_cache_memory_hits'],
+                'disk_hits': self.stats['tts_cache_disk_hits'],
+                'misses': self.stats['cache_misses'],
+                'bytes_served': self.stats['tts_cache_bytes_served'],
+            }
@@ -0,0 +1,158 @@
+# modules/tts_pipeline.py - LLMのストリーミング出力を文単位で先行音声化するパイプライン
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from .audio_clip import AudioClip
+
+# 文の区切りとみなす文字
+SENTENCE_END_CHARS = '。！？!?'
+# 区切り文字の直後に続いても同じ文に含める文字（「！？」や「。」」など）
+SENTENCE_TRAILING_CHARS = SENTENCE_END_CHARS + '」』）)〜ー…'
+
+
+class SentenceTTSPipeline:
+    def __init__(
+        self,
+        synthesize: Callable[[str, Optional[str]], Optional[AudioClip]],
+        on_audio: Callable[[int, str, Optional[AudioClip]], None],
+        emotion: Optional[str] = None,
+        transform: Optional[Callable[[str], str]] = None,
+        max_workers: int = 3,
+        min_sentence_length: int = 6,
+        max_chars: Optional[int] = None
+    ):
+        """
+        文単位TTSパイプラインの初期化
+
+        Args:
+            synthesize: (テキスト, 感情) を受け取り音声データを返す関数
+            on_audio: (連番, テキスト, 音声) を受け取る関数。必ず連番順に呼ばれる
+            emotion: 音声化に使う感情
+            transform: 音声化前に各文へ適用する後処理（一人称の修正など）
+            max_workers: 同時にTTSを実行する文の数
+            min_sentence_length: これより短い文は次の文とまとめて送る
+            max_chars: 音声化する合計文字数の上限（回答の切り詰めに合わせる。超えた文以降は音声化しない）
+        """
+        self.synthesize = synthesize
+        self.on_audio = on_audio
+        self.emotion = emotion
+        self.transform = transform
+        self.min_sentence_length = min_sentence_length
+        self.max_chars = max_chars
+
+        self._buffer = ""
+        self._pending_short = ""
+        self._dispatched_chars = 0
+        self._limit_reached = False
+        self._sentence_count = 0
+        self._next_emit = 0
+        self._results: Dict[int, tuple] = {}
+        self._futures = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._closed = False
+
+    @property
+    def sentence_count(self) -> int:
+        """音声化を開始した文の数"""
+        return self._sentence_count
+
+    def feed(self, delta: str):
+        """ストリーミングで届いたテキスト断片を追加"""
+        if self._closed or not delta:
+            return
+
+        self._buffer += delta
+        for sentence in self._pop_complete_sentences():
+            self._queue_sentence(sentence)
+
+    def finish(self, wait: bool = True) -> int:
+        """残りのテキストを音声化し、（必要なら）すべての完了を待つ"""
+        if self._closed:
+            return self._sentence_count
+
+        rest = self._pending_short + self._buffer
+        self._pending_short = ""
+        self._buffer = ""
+        if rest.strip():
+            self._dispatch(rest)
+
+        self._closed = True
+        self._executor.shutdown(wait=wait)
+        return self._sentence_count
+
+    def _pop_complete_sentences(self) -> List[str]:
+        """バッファから完結した文を取り出す"""
+        sentences = []
+        start = 0
+        i = 0
+        length = len(self._buffer)
+
+        while i < length:
+            if self._buffer[i] in SENTENCE_END_CHARS:
+                end = i + 1
+                while end < length and self._buffer[end] in SENTENCE_TRAILING_CHARS:
+                    end += 1
+                # 区切りの後ろに続く文字がまだ届いていない場合は確定を待つ
+                if end >= length:
+                    break
+                sentences.append(self._buffer[start:end])
+                start = end
+                i = end
+            else:
+                i += 1
+
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def _queue_sentence(self, sentence: str):
+        """短すぎる文は次の文とまとめてから送る"""
+        sentence = self._pending_short + sentence
+        if len(sentence.strip()) < self.min_sentence_length:
+            self._pending_short = sentence
+            return
+
+        self._pending_short = ""
+        self._dispatch(sentence)
+
+    def _dispatch(self, sentence: str):
+        """文をTTSワーカーに投入"""
+        sentence = sentence.strip()
+        if not sentence or self._limit_reached:
+            return
+
+        # 上限の判定と合計には、実際に音声化する後処理済みの文の長さを使う
+        if self.transform:
+            sentence = self.transform(sentence)
+
+        if self.max_chars is not None and self._dispatched_chars + len(sentence) > self.max_chars:
+            # 途中の文だけ抜けないよう、上限を超えた文から後ろはすべて音声化しない
+            self._limit_reached = True
+            print(f"✂️ 文字数上限のため以降の音声化を打ち切り: {sentence[:20]}...")
+            return
+
+        index = self._sentence_count
+        self._sentence_count += 1
+        self._dispatched_chars += len(sentence)
+
+        self._futures.append(self._executor.submit(self._synthesize_one, index, sentence))
+
+    def _synthesize_one(self, index: int, sentence: str):
+        """1文を音声化し、順番が来ていれば送出"""
+        try:
+            audio = self.synthesize(sentence, self.emotion)
+        except Exception as e:
+            print(f"❌ 文単位の音声生成エラー ({index}): {e}")
+            audio = None
+
+        with self._lock:
+            self._results[index] = (sentence, audio)
+            # 前の文がすべて揃っている分だけ順番に送出
+            while self._next_emit in self._results:
+                text, clip = self._results.pop(self._next_emit)
+                try:
+                    self.on_audio(self._next_emit, text, clip)
+                except Exception as e:
+                    print(f"❌ 音声チャンク送出エラー ({self._next_emit}): {e}")
+                self._next_emit += 1
@@ -0,0 +1,155 @@
+# modules/vector_index.py - Chromaの埋め込みをNumPy行列に展開した読み取り専用のベクトル索引（全件内積で検索）
+import time
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+
+class NumpyVectorIndex:
+    def __init__(self, embeddings=None, stats: Optional[Dict] = None):
+        """
+        NumPyベクトル索引の初期化
+
+        コレクションの全埋め込みを行ごとに正規化した連続したfloat32行列として持ち、検索は
+        行列 × ベクトルの1回の積と argpartition で上位k件を選ぶ。数千〜数万件ならChromaの
+        クライアント・ストレージ層を通すより速い。OpenAIの埋め込みは長さ1なので、
+        コサイン類似度の順位はChroma（L2距離）の順位と一致する。
+
+        Args:
+            embeddings: クエリの埋め込みに使うモデル（embed_query / embed_documents）
+            stats: 検索回数などを書き込む統計辞書
+        """
+        self.embeddings = embeddings
+        self.stats = stats if stats is not None else {}
+        for key in ('searches', 'batched_queries', 'loads', 'search_ms_total'):
+            self.stats.setdefault(key, 0)
+
+        # (フィンガープリント, 行列, ドキュメント) を1つのタプルで差し替える（検索中の入れ替えに備える）
+        self._snapshot: Tuple[Optional[str], Optional[np.ndarray], List[Document]] = (None, None, [])
+        self._load_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._snapshot[2])
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        return self._snapshot[0]
+
+    @property
+    def dimensions(self) -> int:
+        matrix = self._snapshot[1]
+        return matrix.shape[1] if matrix is not None else 0
+
+    # ---- 読み込み ----
+
+    def load(self, vectors: Sequence, documents: List[Document], fingerprint: Optional[str] = None):
+        """埋め込みとドキュメントから行列を作って差し替える"""
+        matrix = np.array(vectors, dtype=np.float32, order='C') if len(vectors) else None
+        if matrix is not None:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix /= norms
+        self._snapshot = (fingerprint, matrix, list(documents))
+        self.stats['loads'] += 1
+
+    def load_from_chroma(self, db, fingerprint: Optional[str] = None, page_size: int = 500) -> int:
+        """
+        LangChainのChromaから全件の埋め込みとドキュメントを読み込む
+
+        Returns:
+            読み込んだ件数
+        """
+        with self._load_lock:
+            start_time = time.time()
+            pages: List[np.ndarray] = []
+            documents: List[Document] = []
+            offset = 0
+            while True:
+                page = db.get(include=['embeddings', 'documents', 'metadatas'], limit=page_size, offset=offset)
+                ids = page.get('ids') or []
+                if not ids:
+                    break
+                page_embeddings = page.get('embeddings')
+                page_documents = page.get('documents') or [None] * len(ids)
+                page_metadatas = page.get('metadatas') or [None] * len(ids)
+                pages.append(np.asarray(page_embeddings, dtype=np.float32))
+                documents.extend(
+                    Document(page_content=content or '', metadata=metadata or {})
+                    for content, metadata in zip(page_documents, page_metadatas)
+                )
+                if len(ids) < page_size:
+                    break
+                offset += len(ids)
+
+            self.load(np.concatenate(pages) if pages else [], documents, fingerprint)
+            elapsed_ms = (time.time() - start_time) * 1000
+            print(f"🧭 ベクトル索引を読み込みました ({len(documents)}件, {self.dimensions}次元, {elapsed_ms:.0f}ms)")
+            return len(documents)
+
+    # ---- 検索 ----
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """スコアの高い順にk件のインデックス（最後の軸ごと）"""
+        if k >= scores.shape[-1]:
+            return np.argsort(-scores, axis=-1)
+        top = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=-1), axis=-1)
+        return np.take_along_axis(top, order, axis=-1)
+
+    def search_by_vector(self, vector, k: int = 4) -> List[Tuple[Document, float]]:
+        """埋め込みベクトルに近いドキュメントを (ドキュメント, コサイン類似度) で返す"""
+        _, matrix, documents = self._snapshot
+        if matrix is None or k <= 0:
+            return []
+
+        start_time = time.time()
+        query = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(query))
+        if not norm:
+            return []
+        scores = matrix @ (query / norm)
+        top = self._top_k(scores, k)
+        self.stats['searches'] += 1
+        self.stats['search_ms_total'] += (time.time() - start_time) * 1000
+        return [(documents[i], float(scores[i])) for i in top]
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        """Chroma.similarity_search と同じ形で検索（クエリはキャッシュ付きの埋め込みで変換）"""
+        return [document for document, _ in self.search_by_vector(self.embeddings.embed_query(query), k)]
+
+    def search_many_by_vector(self, vectors: Sequence, k: int = 4) -> List[List[Tuple[Document, float]]]:
+        """複数の埋め込みベクトルを1回の行列積でまとめて検索"""
+        _, matrix, documents = self._snapshot
+        if matrix is None or k <= 0 or not len(vectors):
+            return [[] for _ in vectors]
+
+        queries = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        scores = (queries / norms) @ matrix.T
+        top = self._top_k(scores, k)
+        self.stats['batched_queries'] += len(queries)
+        return [
+            [(documents[i], float(row_scores[i])) for i in row_top]
+            for row_scores, row_top in zip(scores, top)
+        ]
+
+    def search_many(self, queries: List[str], k: int = 4) -> List[List[Document]]:
+        """
+        複数のクエリをまとめて検索（サジェスチョン文言の事前検索など）
+
+        埋め込みは embed_documents の1回の呼び出しでまとめて取得する。
+        """
+        if not queries:
+            return []
+        vectors = self.embeddings.embed_documents(list(queries))
+        return [[document for document, _ in results] for results in self.search_many_by_vector(vectors, k)]
+
+    def get_stats(self) -> Dict:
+        stats = dict(self.stats, vectors=len(self), dimensions=self.dimensions)
+        if self.stats['searches']:
+            stats['avg_search_ms'] = round(self.stats['search_ms_total'] / self.stats['searches'], 3)
+        return stats
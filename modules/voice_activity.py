@@ -0,0 +1,121 @@
+# modules/voice_activity.py - エネルギーとゼロ交差率による音声区間検出（無音のトリミング）
+from typing import Dict
+
+import numpy as np
+
+
+class VoiceActivityDetector:
+    def __init__(
+        self,
+        frame_ms: int = 20,
+        threshold_db: float = 10.0,
+        min_level_db: float = -50.0,
+        max_level_db: float = -35.0,
+        min_speech_ms: int = 200,
+        hangover_ms: int = 150,
+        padding_ms: int = 150,
+        max_pause_ms: int = 600
+    ):
+        """
+        音声区間検出の初期化
+
+        Args:
+            frame_ms: 判定に使うフレーム長
+            threshold_db: 背景雑音レベルからこれ以上大きいフレームを発話とみなす
+            min_level_db: 発話とみなす最低レベル（静かな環境で雑音を拾わないため）
+            max_level_db: しきい値の上限（無音のない連続した発話で基準が上がりすぎないため）
+            min_speech_ms: 発話の合計がこれ未満なら無音のクリップとして扱う
+            hangover_ms: 発話フレームの前後をこの長さだけ発話として広げる（語尾の子音を切らない）
+            padding_ms: トリミング後の先頭・末尾に残す余白
+            max_pause_ms: 発話中の無音はこの長さまで詰める
+        """
+        self.frame_ms = frame_ms
+        self.threshold_db = threshold_db
+        self.min_level_db = min_level_db
+        self.max_level_db = max_level_db
+        self.min_speech_ms = min_speech_ms
+        self.hangover_ms = hangover_ms
+        self.padding_ms = padding_ms
+        self.max_pause_ms = max_pause_ms
+
+    def process(self, pcm: np.ndarray, sample_rate: int) -> Dict:
+        """
+        16bitモノラルPCMから無音を取り除く
+
+        Returns:
+            is_speech: 発話が含まれているか
+            pcm: トリミング後のPCM（int16）
+            original_ms / trimmed_ms / removed_ms: トリミング前後の長さ
+        """
+        frame_len = max(1, sample_rate * self.frame_ms // 1000)
+        n_frames = len(pcm) // frame_len
+        original_ms = len(pcm) * 1000 // sample_rate
+        if n_frames == 0:
+            return self._result(False, pcm[:0], original_ms, sample_rate)
+
+        frames = pcm[:n_frames * frame_len].reshape(n_frames, frame_len).astype(np.float32) / 32768.0
+
+        # フレームごとのRMSレベル（dB）とゼロ交差率
+        rms = np.sqrt(np.mean(frames ** 2, axis=1))
+        level_db = 20.0 * np.log10(rms + 1e-10)
+        zcr = np.mean(np.signbit(frames[:, 1:]) != np.signbit(frames[:, :-1]), axis=1)
+
+        # 背景雑音レベル（静かな方から10%点）を基準にしきい値を決める
+        noise_floor = float(np.percentile(level_db, 10))
+        threshold = min(max(noise_floor + self.threshold_db, self.min_level_db), self.max_level_db)
+
+        # 母音などの有声音はエネルギーで、「さ」「し」などの無声子音はゼロ交差率で拾う
+        voiced = level_db > threshold
+        unvoiced = (level_db > threshold - 6.0) & (zcr > 0.15) & (zcr < 0.5)
+        speech = voiced | unvoiced
+
+        min_speech_frames = max(1, self.min_speech_ms // self.frame_ms)
+        if int(np.count_nonzero(speech)) < min_speech_frames:
+            return self._result(False, pcm[:0], original_ms, sample_rate)
+
+        # 発話フレームの前後を広げて、短い切れ目で区切られないようにする
+        hangover = self.hangover_ms // self.frame_ms
+        if hangover:
+            kernel = np.ones(2 * hangover + 1, dtype=np.int32)
+            speech = np.convolve(speech.astype(np.int32), kernel, mode='same') > 0
+
+        # 先頭・末尾の無音を余白を残してトリミング
+        speech_indices = np.flatnonzero(speech)
+        padding = self.padding_ms // self.frame_ms
+        start = max(0, int(speech_indices[0]) - padding)
+        end = min(n_frames, int(speech_indices[-1]) + 1 + padding)
+
+        keep = np.zeros(n_frames, dtype=bool)
+        keep[start:end] = True
+        self._collapse_pauses(speech, keep, start, end)
+
+        trimmed = frames[keep].reshape(-1)
+        trimmed_pcm = (trimmed * 32768.0).clip(-32768, 32767).astype(np.int16)
+        return self._result(True, trimmed_pcm, original_ms, sample_rate)
+
+    def _collapse_pauses(self, speech: np.ndarray, keep: np.ndarray, start: int, end: int):
+        """発話中の長い無音を max_pause_ms に詰める（前後半分ずつ残す）"""
+        max_pause = max(2, self.max_pause_ms // self.frame_ms)
+        segment = speech[start:end]
+
+        # 無音区間の開始・終了位置（フレーム単位）
+        padded = np.concatenate(([True], segment, [True]))
+        changes = np.flatnonzero(padded[1:] != padded[:-1])
+        pause_starts, pause_ends = changes[0::2], changes[1::2]
+
+        for pause_start, pause_end in zip(pause_starts, pause_ends):
+            if pause_end - pause_start <= max_pause:
+                continue
+            half = max_pause // 2
+            keep[start + pause_start + half:start + pause_end - (max_pause - half)] = False
+
+    @staticmethod
+    def _result(is_speech: bool, pcm: np.ndarray, original_ms: int, sample_rate: int) -> Dict:
+        trimmed_ms = len(pcm) * 1000 // sample_rate
+        return {
+            'is_speech': is_speech,
+            'pcm': pcm,
+            'original_ms': original_ms,
+            'trimmed_ms': trimmed_ms,
+            'removed_ms': original_ms - trimmed_ms if is_speech else original_ms
+        }
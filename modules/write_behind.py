@@ -0,0 +1,243 @@
+# modules/write_behind.py - Supabaseへの書き込みをまとめて後から行うライトビハインドキュー
+import time
+import atexit
+import random
+import threading
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+
+class WriteBehindQueue:
+    def __init__(
+        self,
+        supabase,
+        batch_size: int = 50,
+        flush_interval: float = 0.5,
+        max_retries: int = 5,
+        backoff_seconds: float = 0.5,
+        max_backoff_seconds: float = 30.0,
+        max_queue: int = 10000
+    ):
+        """
+        ライトビハインドキューの初期化
+
+        enqueue() はすぐに戻り、行はバックグラウンドのスレッドがテーブルごとの複数行insertで
+        書き込む。batch_size 行たまるか flush_interval 秒経つと書き込む。失敗したら行を先頭に
+        戻してジッター付きの指数バックオフで再試行し、max_retries 回失敗した行はログに残して
+        破棄する（制約違反などで書き込めない行が後ろの行を止め続けないように）。
+        プロセス終了時には残りを書き切る。
+
+        Args:
+            supabase: Supabaseクライアント
+            batch_size: 1回のinsertで書き込む最大行数
+            flush_interval: 行がたまらなくても書き込むまでの秒数
+            max_retries: 同じ行の書き込みを諦めるまでの再試行回数
+            backoff_seconds: 再試行の待機の基準秒数
+            max_backoff_seconds: 再試行の待機の上限
+            max_queue: キューに保持する最大行数（超えたら古い行から破棄する）
+        """
+        self.supabase = supabase
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.max_queue = max_queue
+        self.stats = {
+            'enqueued': 0, 'flushed_rows': 0, 'flushes': 0, 'retries': 0,
+            'failures': 0, 'dropped': 0, 'max_depth': 0,
+            'flush_ms_total': 0.0, 'last_flush_ms': 0.0
+        }
+
+        # (テーブル名, 行, 追加時刻)
+        self._queue: "deque[Tuple[str, Dict, float]]" = deque()
+        self._in_flight: List[Tuple[str, Dict, float]] = []
+        self._condition = threading.Condition()
+        self._failures = 0
+        # 先頭のバッチが続けて失敗した回数
+        self._batch_attempts = 0
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    # ---- 書き込み要求 ----
+
+    def enqueue(self, table: str, rows: List[Dict]):
+        """行を書き込み待ちに追加（書き込みは待たない）"""
+        if not rows:
+            return
+        if self._closed:
+            # 終了処理中は同期的に書き込む
+            self._insert(table, rows)
+            return
+
+        now = time.time()
+        with self._condition:
+            self._queue.extend((table, row, now) for row in rows)
+            self.stats['enqueued'] += len(rows)
+            # あふれた分は古い行から捨てる（リクエストを待たせず、メモリも際限なく使わない）
+            overflow = len(self._queue) - self.max_queue
+            if overflow > 0:
+                dropped = [self._queue.popleft() for _ in range(overflow)]
+                self.stats['dropped'] += overflow
+                print(f"❌ ライトビハインドのキューがあふれたため{overflow}行を破棄しました: {[row for _, row, _ in dropped]}")
+            self.stats['max_depth'] = max(self.stats['max_depth'], len(self._queue))
+            if len(self._queue) >= self.batch_size:
+                self._condition.notify_all()
+
+    def pending_rows(self, table: str, **filters) -> List[Dict]:
+        """まだ書き込まれていない行（書き込み中を含む）を取得（読み込み側で結果に足すため）"""
+        with self._condition:
+            entries = self._in_flight + list(self._queue)
+        return [
+            row for entry_table, row, _ in entries
+            if entry_table == table and all(row.get(key) == value for key, value in filters.items())
+        ]
+
+    # ---- 書き込みスレッド ----
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._queue and not self._closed:
+                    self._condition.wait(self.flush_interval)
+                elif len(self._queue) < self.batch_size and not self._closed:
+                    # 最初の行から flush_interval 経つまではまとめて待つ
+                    oldest = self._queue[0][2]
+                    wait = oldest + self.flush_interval - time.time()
+                    if wait > 0:
+                        self._condition.wait(wait)
+                if self._closed:
+                    return
+                batch = self._take_batch()
+
+            if not batch:
+                continue
+            remaining = self._flush(batch)
+            if not remaining:
+                self._batch_attempts = 0
+                continue
+
+            self._batch_attempts += 1
+            if self._batch_attempts > self.max_retries:
+                # 何度やっても書き込めない行は捨てて、後ろの行を先に進める
+                self._drop(remaining)
+                self._batch_attempts = 0
+                self._failures = 0
+                with self._condition:
+                    self._in_flight = []
+                continue
+            self._return_batch(remaining)
+            self._sleep_backoff()
+
+    def _take_batch(self) -> List[Tuple[str, Dict, float]]:
+        """先頭から最大 batch_size 行を書き込み中に移す（呼び出し側でロックを持つ）"""
+        batch = []
+        while self._queue and len(batch) < self.batch_size:
+            batch.append(self._queue.popleft())
+        self._in_flight = batch
+        return batch
+
+    def _return_batch(self, batch: List[Tuple[str, Dict, float]]):
+        """書き込めなかった行を順序を保ってキューの先頭に戻す"""
+        with self._condition:
+            self._queue.extendleft(reversed(batch))
+            self._in_flight = []
+
+    def _flush(self, batch: List[Tuple[str, Dict, float]]) -> List[Tuple[str, Dict, float]]:
+        """
+        テーブルごとに複数行insertで書き込む
+
+        Returns:
+            書き込めなかった行（すべて書き込めたら空。書き込めたテーブルの行は再試行しない）
+        """
+        start_time = time.time()
+        by_table: Dict[str, List[Tuple[str, Dict, float]]] = {}
+        for entry in batch:
+            by_table.setdefault(entry[0], []).append(entry)
+
+        failed_tables = set()
+        for table, entries in by_table.items():
+            try:
+                self._insert(table, [row for _, row, _ in entries])
+            except Exception as e:
+                failed_tables.add(table)
+                self._failures += 1
+                self.stats['failures'] += 1
+                print(f"⚠️ ライトビハインドの書き込みエラー ({table}, {len(entries)}行, {self._failures}回目): {e}")
+        remaining = [entry for entry in batch if entry[0] in failed_tables]
+        written = len(batch) - len(remaining)
+
+        elapsed_ms = (time.time() - start_time) * 1000
+        if written:
+            self.stats['flushes'] += 1
+            self.stats['flushed_rows'] += written
+            self.stats['flush_ms_total'] += elapsed_ms
+            self.stats['last_flush_ms'] = round(elapsed_ms, 1)
+        if not remaining:
+            with self._condition:
+                self._in_flight = []
+                self._condition.notify_all()
+            self._failures = 0
+        return remaining
+
+    def _drop(self, entries: List[Tuple[str, Dict, float]]):
+        """書き込みを諦めた行を数えてログに残す（ログから手で復旧できるよう行の内容も出す）"""
+        self.stats['dropped'] += len(entries)
+        print(f"❌ ライトビハインドの{len(entries)}行を書き込めませんでした: {[row for _, row, _ in entries]}")
+
+    def _insert(self, table: str, rows: List[Dict]):
+        self.supabase.table(table).insert(rows).execute()
+
+    def _backoff(self) -> float:
+        wait = self.backoff_seconds * (2 ** min(self._failures - 1, 10))
+        return min(self.max_backoff_seconds, wait) * random.uniform(0.5, 1.5)
+
+    def _sleep_backoff(self):
+        self.stats['retries'] += 1
+        with self._condition:
+            if not self._closed:
+                self._condition.wait(self._backoff())
+
+    # ---- 終了処理 ----
+
+    def close(self, timeout: Optional[float] = None):
+        """書き込みスレッドを止め、残りの行をすべて書き込む（atexitから呼ばれる）"""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+        with self._condition:
+            remaining = self._in_flight + list(self._queue)
+            self._queue.clear()
+            self._in_flight = []
+        if not remaining:
+            return
+
+        print(f"💾 ライトビハインドの残り{len(remaining)}行を書き込みます")
+        while remaining:
+            batch, remaining = remaining[:self.batch_size], remaining[self.batch_size:]
+            for attempt in range(self.max_retries + 1):
+                batch = self._flush(batch)
+                if not batch:
+                    break
+                if attempt == self.max_retries:
+                    self._drop(batch)
+                    break
+                self.stats['retries'] += 1
+                time.sleep(self._backoff())
+
+    def get_stats(self) -> Dict:
+        with self._condition:
+            depth = len(self._queue) + len(self._in_flight)
+            oldest = self._queue[0][2] if self._queue else None
+        stats = dict(self.stats, queue_depth=depth)
+        stats['oldest_pending_seconds'] = round(time.time() - oldest, 2) if oldest else 0.0
+        if self.stats['flushes']:
+            stats['avg_flush_ms'] = round(self.stats['flush_ms_total'] / self.stats['flushes'], 1)
+        return stats
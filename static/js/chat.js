@@ -550,6 +550,15 @@
     
     let socket;
     
+    // 🎯 ストリーミング中のAI応答（response_chunkを追記していく）
+    let streamingResponse = {
+        element: null,
+        text: ''
+    };
+    
+    // 🎯 文単位で届く音声チャンクの再生待ちキュー（サーバー側で連番順に送信される）
+    let audioChunkQueue = [];
+    
     // ====== 基本システム初期化 ======
     function initialize() {
         console.log('アプリケーションを初期化中...');
@@ -727,6 +736,8 @@
         socket.on('language_changed', handleLanguageUpdate);
         socket.on('greeting', handleGreetingMessage);
         socket.on('response', handleResponseMessage);
+        socket.on('response_chunk', handleResponseChunk);
+        socket.on('audio_chunk', handleAudioChunk);
         socket.on('transcription', handleTranscription);
         socket.on('error', handleErrorMessage);
         socket.on('context_aware_response', handleContextAwareResponse);
@@ -908,6 +919,9 @@
         appState.interactionCount++;
         updateConnectionStatus('processing');
         
+        // 前の応答の未再生チャンクは破棄
+        audioChunkQueue = [];
+        
         // ユーザーメッセージを会話履歴に追加
         conversationMemory.addMessage('user', message, null);
         
@@ -1144,10 +1158,12 @@
                 audioState.recorder.onstop = function() {
                     const audioBlob = new Blob(audioState.chunks, { type: 'audio/webm' });
                     
-                    convertBlobToBase64(audioBlob).then(base64data => {
+                    // Base64に変換せず、バイナリのままSocket.IOの添付として送信
+                    audioBlob.arrayBuffer().then(buffer => {
                         // 会話履歴と訪問者情報を含めて送信
                         socket.emit('audio_message', { 
-                            audio: base64data,
+                            audio: buffer,
+                            audioMime: audioBlob.type,
                             language: appState.currentLanguage,
                             visitorId: visitorManager.visitorId,
                             conversationHistory: conversationMemory.getRecentContext(5),
@@ -1191,19 +1207,6 @@
         updateConnectionStatus('processing');
     }
     
-    function convertBlobToBase64(blob) {
-        return new Promise((resolve, reject) => {
-            const reader = new FileReader();
-            reader.onloadend = function() {
-                resolve(reader.result);
-            };
-            reader.onerror = function() {
-                reject(new Error("ファイル変換エラー"));
-            };
-            reader.readAsDataURL(blob);
-        });
-    }
-    
     // ====== 感情送信システム ======
     function sendEmotionToAvatar(emotion, isTalking = false, reason = 'manual', conversationId = null) {
         const now = Date.now();
@@ -1358,7 +1361,9 @@
         
         if (audioData && !isAudioPlaying()) {
             playAudioWithLipSync(audioData, emotion);
-        } else if (!audioData) {
+        } else if (audioData) {
+            releaseAudioSource(audioData);
+        } else {
             setTimeout(() => {
                 endConversation();
             }, 2000);
@@ -1387,6 +1392,24 @@
         console.log('🔇 すべての音声を停止しました');
     }
 
+    // 🎵 サーバーから届いた音声を再生可能なURLに変換
+    // バイナリ添付（audio + audioMime）はBlob URLに、audioUrl（静的音声・/audio/<id>）はそのまま使う
+    function audioSource(data) {
+        if (!data) return null;
+        if (data.audioUrl) return data.audioUrl;
+        if (!data.audio) return null;
+        if (typeof data.audio === 'string') return data.audio;  // 旧形式のdata URL
+        
+        const blob = new Blob([data.audio], { type: data.audioMime || 'audio/mpeg' });
+        return URL.createObjectURL(blob);
+    }
+    
+    function releaseAudioSource(src) {
+        if (typeof src === 'string' && src.startsWith('blob:')) {
+            URL.revokeObjectURL(src);
+        }
+    }
+    
     // 🔇 音声再生（ミュート対応版）
     function playAudioWithLipSync(audioData, emotion) {
         const audio = new Audio(audioData);
@@ -1405,11 +1428,13 @@
         
         audio.onended = function() {
             console.log('🔊 音声再生完了');
+            releaseAudioSource(audioData);
             onAudioEnd();
         };
         
         audio.onerror = function(error) {
             console.error('🔊 音声再生エラー:', error);
+            releaseAudioSource(audioData);
             onAudioEnd();
         };
         
@@ -1436,6 +1461,14 @@
 
     function onAudioEnd() {
         console.log('🎵 音声終了処理開始');
+        
+        // 🎯 続きの音声チャンクがあれば会話を継続したまま再生
+        const nextChunk = audioChunkQueue.shift();
+        if (nextChunk && conversationState.isActive) {
+            playAudioWithLipSync(audioSource(nextChunk), nextChunk.emotion || conversationState.currentEmotion);
+            return;
+        }
+        
         endConversation();
     }
 
@@ -1640,22 +1673,65 @@
         
         const emotion = data.emotion || 'happy';
         
-        if (data.audio) {
+        const audioSrc = audioSource(data);
+        if (audioSrc) {
             console.log('🎵 音声付き挨拶メッセージを受信 - 自己紹介部長に要求');
-            requestIntroduction('greeting_with_audio', { emotion, audio: data.audio });
+            requestIntroduction('greeting_with_audio', { emotion, audio: audioSrc });
         } else {
             console.log('📝 テキストのみ挨拶メッセージを受信');
             sendEmotionToAvatar(emotion, false, 'greeting_no_audio');
         }
     }
     
+    // 🎯 ストリーミングされた応答の断片を表示中のメッセージに追記
+    function handleResponseChunk(data) {
+        if (!data || !data.text) return;
+        
+        if (!streamingResponse.element) {
+            streamingResponse.element = addMessage('', false);
+            streamingResponse.text = '';
+        }
+        
+        streamingResponse.text += data.text;
+        streamingResponse.element.textContent = streamingResponse.text;
+        smoothScrollToBottom(domElements.chatMessages);
+    }
+    
+    // 🎯 文単位の音声チャンクを受信（再生中なら順番待ち）
+    function handleAudioChunk(data) {
+        if (!data || !(data.audio || data.audioUrl)) {
+            console.warn('⚠️ 音声なしのチャンクをスキップ:', data && data.index);
+            return;
+        }
+        
+        // Blob URLは再生する時点で作る（待っている間にメモリを確保し続けない）
+        if (conversationState.isActive) {
+            audioChunkQueue.push(data);
+            return;
+        }
+        
+        startConversation(data.emotion || 'neutral', audioSource(data));
+    }
+    
+    function finishStreamingResponse(finalText) {
+        if (!streamingResponse.element) return false;
+        
+        // 後処理済みの完成版で表示を確定
+        streamingResponse.element.textContent = finalText;
+        streamingResponse.element = null;
+        streamingResponse.text = '';
+        return true;
+    }
+    
     function handleResponseMessage(data) {
         try {
             appState.isWaitingResponse = false;
             updateConnectionStatus('connected');
             appState.lastResponseTime = Date.now();
             
-            addMessage(data.message, false);
+            if (!finishStreamingResponse(data.message)) {
+                addMessage(data.message, false);
+            }
             
             // AIの応答を会話履歴に追加
             conversationMemory.addMessage('assistant', data.message, data.emotion);
@@ -1675,9 +1751,13 @@
             
             // 感情の処理
             let emotion = data.emotion || 'neutral';
+            const audioSrc = audioSource(data);
             
-            if (data.audio) {
-                startConversation(emotion, data.audio);
+            if (audioSrc) {
+                startConversation(emotion, audioSrc);
+            } else if (data.audioStreamed) {
+                // 音声は audio_chunk で順次再生される
+                console.log('🎵 文単位の音声ストリーミングで再生中');
             } else {
                 // 音声データがない場合でもneutral+talkingで会話を開始
                 console.log('🔇 音声データなし - シンプル会話モード');
@@ -1727,6 +1807,8 @@
     
     function handleErrorMessage(data) {
         console.error('エラー:', data.message);
+        streamingResponse.element = null;
+        streamingResponse.text = '';
         showError(data.message || '不明なエラーが発生しました');
         updateConnectionStatus('error');
         sendEmotionToAvatar('neutral', false, 'emergency');
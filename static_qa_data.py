@@ -1,7 +1,28 @@
 # static_qa_data.py - 静的Q&Aキャッシュシステム（サジェスチョン優先順位対応版）
 
+import os
 import re
-from typing import Dict, List, Optional, Tuple
+import random
+from collections import deque
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+
+if TYPE_CHECKING:
+    from modules.audio_clip import AudioClip
+
+# ビルド時に生成した静的音声（build_static_audio.pyで作成）
+STATIC_AUDIO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'audio', 'static_qa')
+try:
+    from modules.static_audio import StaticAudioLibrary
+    STATIC_AUDIO = StaticAudioLibrary(STATIC_AUDIO_DIR)
+except ImportError as e:
+    print(f"Warning: Could not import static_audio: {e}")
+    STATIC_AUDIO = None
+
+# 接続時の挨拶メッセージ
+GREETING = {
+    "message": "こんにちは〜！京友禅職人の吉田麗です。友禅染のことなら何でも聞いてくださいね。",
+    "emotion": "happy"
+}
 
 # サジェスチョンの優先順位カテゴリ
 SUGGESTION_CATEGORIES = {
@@ -231,48 +252,229 @@ def normalize_query(query: str) -> str:
     query = re.sub(r'\s+', ' ', query).strip()
     return query
 
+class StaticQAMatcher:
+    """
+    静的Q&Aパターンの照合インデックス（起動時に一度だけ構築）
+    
+    - パターンがクエリに含まれる場合: 正規化済みパターンのAho–Corasickオートマトンで1回の走査で検出
+    - クエリがパターンに含まれる場合: 全パターンの一般化接尾辞オートマトンで検出
+      （部分文字列を列挙せず、パターン長の合計に比例する状態数で済む）
+    どちらも「Q&Aの順番 → パターンの順番」の通し番号が最小のものを採用するため、
+    従来の先頭からの線形走査と同じ優先順位になる。
+    """
+    
+    def __init__(self, qa_pairs: List[Dict]):
+        self.qa_pairs = qa_pairs
+        self._rank_to_qa: List[Dict] = []
+        # トライ木（ノードごとの遷移・失敗リンク・そのノードで終わる最優先パターン）
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._best: List[Optional[int]] = [None]
+        # 接尾辞オートマトン（遷移・接尾辞リンク・最長の長さ・その状態の部分文字列を含む最優先パターン）
+        self._sa_next: List[Dict[str, int]] = [{}]
+        self._sa_link: List[int] = [-1]
+        self._sa_length: List[int] = [0]
+        self._sa_best: List[Optional[int]] = [None]
+        
+        for qa in qa_pairs:
+            for pattern in qa["patterns"]:
+                rank = len(self._rank_to_qa)
+                self._rank_to_qa.append(qa)
+                normalized_pattern = normalize_query(pattern)
+                self._add_pattern(normalized_pattern, rank)
+                self._add_substrings(normalized_pattern, rank)
+        
+        self._build_failure_links()
+        self._propagate_substring_ranks()
+    
+    @property
+    def pattern_count(self) -> int:
+        return len(self._rank_to_qa)
+    
+    def _add_pattern(self, pattern: str, rank: int):
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._best.append(None)
+            node = next_node
+        if self._best[node] is None or rank < self._best[node]:
+            self._best[node] = rank
+    
+    def _add_substrings(self, pattern: str, rank: int):
+        """パターンを接尾辞オートマトンに追加し、各接頭辞の状態に通し番号を付ける"""
+        last = 0
+        self._mark_substring(last, rank)
+        for char in pattern:
+            last = self._extend_automaton(last, char)
+            self._mark_substring(last, rank)
+    
+    def _mark_substring(self, state: int, rank: int):
+        if self._sa_best[state] is None or rank < self._sa_best[state]:
+            self._sa_best[state] = rank
+    
+    def _new_state(self, length: int, transitions: Dict[str, int], link: int) -> int:
+        self._sa_next.append(transitions)
+        self._sa_link.append(link)
+        self._sa_length.append(length)
+        self._sa_best.append(None)
+        return len(self._sa_next) - 1
+    
+    def _clone_state(self, source: int, target: int, char: str) -> int:
+        """targetを長さ source+1 で分割し、sourceから接尾辞リンクをたどった遷移を付け替える"""
+        clone = self._new_state(self._sa_length[source] + 1, dict(self._sa_next[target]), self._sa_link[target])
+        while source != -1 and self._sa_next[source].get(char) == target:
+            self._sa_next[source][char] = clone
+            source = self._sa_link[source]
+        self._sa_link[target] = clone
+        return clone
+    
+    def _extend_automaton(self, last: int, char: str) -> int:
+        """一般化接尾辞オートマトンに1文字追加し、新しい末尾の状態を返す"""
+        existing = self._sa_next[last].get(char)
+        if existing is not None:
+            # 他のパターンで既に現れた部分文字列
+            if self._sa_length[existing] == self._sa_length[last] + 1:
+                return existing
+            return self._clone_state(last, existing, char)
+        
+        current = self._new_state(self._sa_length[last] + 1, {}, 0)
+        state = last
+        while state != -1 and char not in self._sa_next[state]:
+            self._sa_next[state][char] = current
+            state = self._sa_link[state]
+        if state != -1:
+            target = self._sa_next[state][char]
+            if self._sa_length[state] + 1 == self._sa_length[target]:
+                self._sa_link[current] = target
+            else:
+                self._sa_link[current] = self._clone_state(state, target, char)
+        return current
+    
+    def _propagate_substring_ranks(self):
+        """長い状態から接尾辞リンク先へ優先度を伝播（短い部分文字列は長い方を含むパターンにも含まれる）"""
+        for state in sorted(range(1, len(self._sa_next)), key=self._sa_length.__getitem__, reverse=True):
+            rank = self._sa_best[state]
+            if rank is not None:
+                self._mark_substring(self._sa_link[state], rank)
+    
+    def _find_containing(self, query: str) -> Optional[int]:
+        """クエリを含む最優先パターンの通し番号"""
+        state = 0
+        for char in query:
+            state = self._sa_next[state].get(char)
+            if state is None:
+                return None
+        return self._sa_best[state]
+    
+    def _build_failure_links(self):
+        """幅優先で失敗リンクを張り、接尾辞で終わるパターンの優先度を伝播"""
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            queue.append(child)
+        
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                
+                inherited = self._best[self._fail[child]]
+                if inherited is not None and (self._best[child] is None or inherited < self._best[child]):
+                    self._best[child] = inherited
+                queue.append(child)
+    
+    def find(self, query: str) -> Optional[Dict]:
+        """クエリにマッチするQ&Aを検索"""
+        normalized_query = normalize_query(query)
+        
+        # クエリがパターンに含まれる（完全一致を含む）
+        best = self._find_containing(normalized_query)
+        
+        # 空パターンはどのクエリにも含まれる
+        if self._best[0] is not None and (best is None or self._best[0] < best):
+            best = self._best[0]
+        
+        # パターンがクエリに含まれる
+        node = 0
+        for char in normalized_query:
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            rank = self._best[node]
+            if rank is not None and (best is None or rank < best):
+                best = rank
+        
+        return self._rank_to_qa[best] if best is not None else None
+
 def find_matching_qa(query: str) -> Optional[Dict]:
     """クエリにマッチするQ&Aを検索"""
-    normalized_query = normalize_query(query)
-    
-    for qa in STATIC_QA_PAIRS:
-        for pattern in qa["patterns"]:
-            normalized_pattern = normalize_query(pattern)
-            # 完全一致
-            if normalized_query == normalized_pattern:
-                return qa
-            # 部分一致（パターンがクエリに含まれる）
-            if normalized_pattern in normalized_query:
-                return qa
-            # クエリがパターンに含まれる（短い質問への対応）
-            if normalized_query in normalized_pattern:
-                return qa
+    return _STATIC_QA_MATCHER.find(query)
+
+# 照合インデックスは起動時に一度だけ構築
+_STATIC_QA_MATCHER = StaticQAMatcher(STATIC_QA_PAIRS)
+
+def shorten_response_for_repeat(response: str, question_count: int) -> str:
+    """質問回数に応じて本文を短くする"""
+    if question_count == 3:
+        # 少し短めに
+        return response.split('。')[0] + '。'
+    elif question_count >= 4:
+        # さらに短く
+        return response.split('、')[0] + 'やで。'
+    return response
+
+def split_response_for_repeat(response: str, question_count: int) -> Tuple[str, str, str]:
+    """質問回数に応じて応答を (前置き, 本文, 締め) に分解"""
+    if question_count <= 1 or question_count not in REPEAT_RESPONSES:
+        return "", response, ""
     
-    return None
+    prefix = random.choice(REPEAT_RESPONSES[question_count]["prefix"])
+    suffix = random.choice(REPEAT_RESPONSES[question_count]["suffix"])
+    return prefix, shorten_response_for_repeat(response, question_count), suffix
 
 def adjust_response_for_repeat(response: str, question_count: int) -> str:
     """質問回数に応じて応答を調整"""
-    if question_count <= 1:
-        return response
+    prefix, body, suffix = split_response_for_repeat(response, question_count)
+    return f"{prefix}{body}{suffix}"
+
+def get_static_audio(parts: List[str]) -> Optional[Union[str, 'AudioClip']]:
+    """事前生成音声の参照（URL または連結したAudioClip）を取得（未生成ならNone）"""
+    if STATIC_AUDIO is None:
+        return None
+    return STATIC_AUDIO.get_audio(parts)
+
+def get_static_speech_items() -> List[Tuple[str, str]]:
+    """ビルド時に音声化するテキストと感情の一覧（回答・短縮版・前置き/締め・挨拶）"""
+    items = [(GREETING["message"], GREETING["emotion"])]
     
-    if question_count in REPEAT_RESPONSES:
-        import random
-        prefix = random.choice(REPEAT_RESPONSES[question_count]["prefix"])
-        suffix = random.choice(REPEAT_RESPONSES[question_count]["suffix"])
-        
-        # 応答を調整
-        if question_count == 2:
-            return f"{prefix}{response}{suffix}"
-        elif question_count == 3:
-            # 少し短めに
-            short_response = response.split('。')[0] + '。'
-            return f"{prefix}{short_response}{suffix}"
-        elif question_count >= 4:
-            # さらに短く
-            very_short = response.split('、')[0] + 'やで。'
-            return f"{prefix}{very_short}{suffix}"
+    for qa in STATIC_QA_PAIRS:
+        items.append((qa["answer"], qa["emotion"]))
+        for question_count in REPEAT_RESPONSES:
+            items.append((shorten_response_for_repeat(qa["answer"], question_count), qa["emotion"]))
     
-    return response
+    for variations in REPEAT_RESPONSES.values():
+        for text in variations["prefix"] + variations["suffix"]:
+            items.append((text, "neutral"))
+    
+    # 同じテキストは1回だけ
+    return list(dict.fromkeys(items))
+
+def get_all_suggestion_texts() -> List[str]:
+    """サジェスチョンとして提示しうる文言の一覧（埋め込みの事前取得用）"""
+    texts = []
+    for category in SUGGESTION_CATEGORIES.values():
+        texts.extend(category["suggestions"])
+    for qa in STATIC_QA_PAIRS:
+        texts.extend(qa.get("suggestions", []))
+    return texts
 
 def get_prioritized_suggestions(category: str = "overview", selected_suggestions: List[str] = None) -> List[str]:
     """優先順位に基づいてサジェスチョンを取得（重複排除）"""
@@ -308,7 +510,8 @@ def get_static_response(query: str, question_count: int = 1, selected_suggestion
         response = qa["answer"]
         
         # 質問回数に応じて応答を調整
-        adjusted_response = adjust_response_for_repeat(response, question_count)
+        prefix, body, suffix = split_response_for_repeat(response, question_count)
+        adjusted_response = f"{prefix}{body}{suffix}"
         
         # カテゴリに基づいて優先順位付きサジェスチョンを取得
         category = qa.get("category", "overview")
@@ -318,6 +521,7 @@ def get_static_response(query: str, question_count: int = 1, selected_suggestion
             "answer": adjusted_response,
             "emotion": qa["emotion"],
             "suggestions": suggestions,
+            "audio": get_static_audio([prefix, body, suffix]),
             "cached": True,
             "question_count": question_count
         }
@@ -0,0 +1,135 @@
+# test_audio_probe.py
+import base64
+import io
+import struct
+import wave
+
+from modules.audio_clip import AudioClip
+from modules.audio_probe import (
+    PROBE_HEAD_BYTES, base64_decoded_size, probe_audio, probe_base64, probe_bytes, sniff_format
+)
+
+
+def make_wav(seconds=1.5, sample_rate=16000, channels=1):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(b'\x00\x00' * channels * int(sample_rate * seconds))
+    return buffer.getvalue()
+
+
+# MPEG-1 レイヤー3, 128kbps, 44.1kHz, ステレオ（1フレーム417バイト）
+MP3_FRAME = b'\xff\xfb\x90\x64' + b'\x00' * 413
+
+
+def make_mp3(frames=100, id3=False):
+    data = MP3_FRAME * frames
+    if id3:
+        data = b'ID3\x04\x00\x00\x00\x00\x00\x0a' + b'\x00' * 10 + data
+    return data
+
+
+def make_ogg_page(granule, payload, header_type=0):
+    header = b'OggS' + bytes([0, header_type]) + struct.pack('<qIII', granule, 1, 0, 0)
+    return header + bytes([1, len(payload)]) + payload
+
+
+def make_opus(seconds=2.0, pre_skip=312):
+    opus_head = b'OpusHead' + bytes([1, 1]) + struct.pack('<HIhB', pre_skip, 48000, 0, 0)
+    granule = int(seconds * 48000) + pre_skip
+    return make_ogg_page(0, opus_head, 2) + make_ogg_page(granule, b'\x00' * 100, 4)
+
+
+def ebml(element_id, payload):
+    return element_id.to_bytes((element_id.bit_length() + 7) // 8, 'big') + bytes([0x80 | len(payload)]) + payload
+
+
+def make_webm(duration_ms=None, block_ms=None):
+    info = ebml(0x2AD7B1, (1000000).to_bytes(3, 'big'))
+    if duration_ms is not None:
+        info += ebml(0x4489, struct.pack('>d', duration_ms))
+    audio = ebml(0xB5, struct.pack('>d', 48000.0)) + ebml(0x9F, b'\x01')
+    track = ebml(0xAE, ebml(0x86, b'A_OPUS') + ebml(0xE1, audio))
+    segment = ebml(0x1549A966, info) + ebml(0x1654AE6B, track)
+    if block_ms is not None:
+        block = b'\x81' + struct.pack('>h', block_ms - 1000) + b'\x80' + b'\x00' * 4
+        segment += ebml(0x1F43B675, ebml(0xE7, (1000).to_bytes(2, 'big')) + ebml(0xA3, block))
+    header = ebml(0x1A45DFA3, ebml(0x4282, b'webm'))
+    return header + b'\x18\x53\x80\x67\x01\xff\xff\xff\xff\xff\xff\xff' + segment
+
+
+def test_wav_duration_from_data_chunk():
+    info = probe_bytes(make_wav(seconds=1.5, sample_rate=16000, channels=2))
+
+    assert info['format'] == 'wav' and info['mime'] == 'audio/wav'
+    assert info['sample_rate'] == 16000 and info['channels'] == 2
+    assert info['duration'] == 1.5
+
+
+def test_wav_with_unknown_data_size_uses_actual_size():
+    data = bytearray(make_wav(seconds=1.0))
+    data[40:44] = b'\xff\xff\xff\xff'
+    assert probe_bytes(bytes(data))['duration'] == 1.0
+
+
+def test_cbr_mp3_duration_from_bitrate():
+    data = make_mp3(frames=100)
+    info = probe_bytes(data)
+
+    assert info['format'] == 'mp3' and info['codec'] == 'mp3'
+    assert info['sample_rate'] == 44100 and info['channels'] == 2
+    assert info['duration'] == len(data) * 8 / 128000
+
+
+def test_mp3_after_id3_tag():
+    info = probe_bytes(make_mp3(frames=10, id3=True))
+    assert info['format'] == 'mp3' and info['sample_rate'] == 44100
+
+
+def test_aac_adts_is_not_taken_for_mp3():
+    # ADTSは同期ワードがMPEGフレームと同じだがレイヤーのビットが00
+    adts = b'\xff\xf1\x50\x80\x02\x1f\xfc' + b'\x00' * 100
+    assert sniff_format(adts) is None
+    assert AudioClip.from_bytes(adts, 'audio/aac').codec == 'aac'
+
+
+def test_ogg_opus_duration_from_last_granule():
+    info = probe_bytes(make_opus(seconds=2.0))
+
+    assert info['format'] == 'ogg' and info['codec'] == 'opus'
+    assert info['channels'] == 1 and info['sample_rate'] == 48000
+    assert info['duration'] == 2.0
+
+
+def test_webm_duration_element():
+    info = probe_bytes(make_webm(duration_ms=2500.0))
+
+    assert info['format'] == 'webm' and info['codec'] == 'A_OPUS'
+    assert info['sample_rate'] == 48000 and info['channels'] == 1
+    assert info['duration'] == 2.5
+
+
+def test_webm_without_duration_uses_last_block():
+    info = probe_bytes(make_webm(block_ms=1800))
+    assert info['duration'] == 1.8
+
+
+def test_base64_probe_matches_bytes_probe():
+    data = make_wav(seconds=12.0)
+    assert len(data) > PROBE_HEAD_BYTES * 2
+    encoded = base64.b64encode(data).decode('ascii')
+
+    assert base64_decoded_size(encoded) == len(data)
+    assert probe_base64(encoded) == probe_bytes(data)
+    assert probe_base64('data:audio/wav;base64,' + encoded) == probe_bytes(data)
+
+
+def test_unknown_and_truncated_data():
+    assert probe_bytes(b'not audio at all') is None
+    assert probe_base64('***') is None
+
+    # 途中で切れたヘッダーはわかった範囲だけ返す
+    info = probe_audio(make_opus()[:40])
+    assert info['format'] == 'ogg' and info['duration'] is None
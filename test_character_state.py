@@ -0,0 +1,75 @@
+# test_character_state.py
+import pytest
+
+from modules.character_state import CharacterState, CharacterStateStore, DEFAULT_MENTAL_STATE
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_visitors_have_separate_states():
+    store = CharacterStateStore()
+    first = store.get('visitor-a')
+    first['stress_level'] = 70
+    first.current_emotion = 'sad'
+    first.emotion_history.append('sad')
+
+    second = store.get('visitor-b')
+    assert second['stress_level'] == DEFAULT_MENTAL_STATE['stress_level']
+    assert second.current_emotion == 'neutral'
+    assert list(second.emotion_history) == []
+    # 同じ訪問者は同じ状態を続けて使う
+    assert store.get('visitor-a') is first and first['stress_level'] == 70
+
+
+def test_least_recently_used_session_is_evicted():
+    store = CharacterStateStore(max_sessions=2, clock=FakeClock())
+    first = store.get('a')
+    store.get('b')
+    store.get('a')
+    store.get('c')
+
+    assert len(store) == 2
+    assert store.peek('b') is None
+    assert store.peek('a') is first and store.peek('c') is not None
+
+
+def test_sessions_expire_after_ttl_since_last_access():
+    clock = FakeClock()
+    store = CharacterStateStore(ttl_seconds=60, clock=clock)
+    first = store.get('a')
+    store.get('b')
+
+    clock.now += 59
+    assert store.get('a') is first  # アクセスでTTLが延びる
+    clock.now += 30
+    store.get('c')
+
+    assert store.peek('b') is None
+    assert store.peek('a') is first
+    clock.now += 60
+    assert store.get('a') is not first
+    assert store.get('a')['energy_level'] == DEFAULT_MENTAL_STATE['energy_level']
+
+
+def test_peek_and_discard_do_not_create_state():
+    store = CharacterStateStore(clock=FakeClock())
+    assert store.peek('a') is None and len(store) == 0
+
+    store.get('a')
+    store.discard('a')
+    store.discard('missing')
+    assert len(store) == 0
+
+
+def test_state_accepts_only_known_keys():
+    state = CharacterState()
+    assert state.as_dict() == DEFAULT_MENTAL_STATE
+    assert state.get('unknown', 5) == 5
+    with pytest.raises(KeyError):
+        state['unknown'] = 1
@@ -0,0 +1,164 @@
+# test_coe_font_client.py
+import pytest
+import requests
+
+from modules import coe_font_client
+from modules.coe_font_client import CoeFontClient
+
+
+class FakeClock:
+    """time.monotonic / time.sleep の代わり（sleepは時計を進めるだけ）"""
+
+    def __init__(self, now=100.0):
+        self.now = now
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeSocket:
+    def __init__(self):
+        self.timeouts = []
+
+    def settimeout(self, seconds):
+        self.timeouts.append(seconds)
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None, chunks=(), clock=None, chunk_seconds=0.0, error=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.content = b''.join(chunks)
+        self.chunks = chunks
+        self.clock = clock
+        self.chunk_seconds = chunk_seconds
+        self.error = error
+        self.sock = FakeSocket()
+        self.raw = type('Raw', (), {'connection': type('Connection', (), {'sock': self.sock})()})()
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for chunk in self.chunks:
+            # 1チャンクの受信に chunk_seconds かかるサーバー
+            self.clock.now += self.chunk_seconds
+            yield chunk
+        if self.error:
+            raise self.error
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FakeSession:
+    """POSTには posts を先頭から順に返す（例外なら送出する）"""
+
+    def __init__(self, clock, posts=(), download=None, post_seconds=0.0):
+        self.clock = clock
+        self.posts = list(posts)
+        self.download = download
+        self.post_seconds = post_seconds
+        self.post_timeouts = []
+
+    def post(self, url, data, headers, timeout, allow_redirects):
+        self.post_timeouts.append(timeout)
+        self.clock.now += self.post_seconds
+        result = self.posts.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def get(self, url, timeout, stream):
+        return self.download
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(coe_font_client, 'time', clock)
+    for name in ('COEFONT_ACCESS_KEY', 'COEFONT_ACCESS_SECRET', 'COEFONT_VOICE_ID'):
+        monkeypatch.setenv(name, 'test')
+    return clock
+
+
+def use_session(monkeypatch, session):
+    monkeypatch.setattr(coe_font_client, 'get_requests_session', lambda: session)
+
+
+def redirect():
+    return FakeResponse(302, {'Location': 'https://cdn.example/audio.wav'})
+
+
+def test_server_errors_and_timeouts_are_retried(clock, monkeypatch):
+    session = FakeSession(clock, posts=[FakeResponse(503), requests.Timeout('read timed out'), FakeResponse(200, chunks=[b'RIFF'])])
+    use_session(monkeypatch, session)
+    client = CoeFontClient(deadline_seconds=10.0, max_retries=2)
+
+    assert client.generate_audio_bytes("こんにちは") == b'RIFF'
+    assert client.stats == {'requests': 1, 'retries': 2, 'deadline_exceeded': 0, 'failures': 0}
+    assert len(clock.sleeps) == 2 and clock.sleeps[1] > clock.sleeps[0] * 0.5
+
+
+def test_retries_stop_after_max_retries(clock, monkeypatch):
+    session = FakeSession(clock, posts=[requests.ConnectionError('refused')] * 3)
+    use_session(monkeypatch, session)
+    client = CoeFontClient(max_retries=2)
+
+    assert client.generate_audio_bytes("こんにちは") is None
+    assert session.posts == []
+    assert client.stats['retries'] == 2 and client.stats['failures'] == 1
+
+
+def test_attempts_stay_within_the_deadline(clock, monkeypatch):
+    # 1回目のPOSTで残り時間をほぼ使い切るので、リトライせずに諦める
+    session = FakeSession(clock, posts=[FakeResponse(503), FakeResponse(200)], post_seconds=4.5)
+    use_session(monkeypatch, session)
+    client = CoeFontClient(deadline_seconds=5.0, connect_timeout=3.0)
+
+    assert client.generate_audio_bytes("こんにちは") is None
+    assert session.post_timeouts == [(3.0, 5.0)]
+    assert client.stats['deadline_exceeded'] == 1 and client.stats['failures'] == 1
+    assert clock.sleeps == []
+
+
+def test_download_read_timeout_shrinks_with_the_deadline(clock, monkeypatch):
+    download = FakeResponse(200, chunks=[b'a', b'b', b'c'], clock=clock, chunk_seconds=1.0)
+    use_session(monkeypatch, FakeSession(clock, posts=[redirect()], download=download))
+    client = CoeFontClient(deadline_seconds=10.0)
+
+    assert client.generate_audio_bytes("こんにちは") == b'abc'
+    # 読み込みのたびに残り時間へ合わせる
+    assert download.sock.timeouts == [10.0, 9.0, 8.0, 7.0]
+
+
+def test_slow_download_is_cut_off_at_the_deadline(clock, monkeypatch):
+    download = FakeResponse(200, chunks=[b'a'] * 10, clock=clock, chunk_seconds=2.0)
+    use_session(monkeypatch, FakeSession(clock, posts=[redirect()], download=download))
+    client = CoeFontClient(deadline_seconds=5.0)
+
+    assert client.generate_audio_bytes("こんにちは") is None
+    assert download.sock.timeouts == [5.0, 3.0, 1.0]
+    assert client.stats['deadline_exceeded'] == 1 and client.stats['failures'] == 1
+
+
+def test_every_error_is_counted_as_a_failure(clock, monkeypatch):
+    download = FakeResponse(200, chunks=[b'a'], clock=clock, error=requests.exceptions.ChunkedEncodingError('broken'))
+    use_session(monkeypatch, FakeSession(clock, posts=[redirect()], download=download))
+    client = CoeFontClient()
+    assert client.generate_audio_bytes("こんにちは") is None
+    assert client.stats['failures'] == 1 and client.stats['deadline_exceeded'] == 0
+
+    # リトライ対象外の例外
+    use_session(monkeypatch, FakeSession(clock, posts=[requests.exceptions.InvalidURL('bad url')]))
+    assert client.generate_audio_bytes("こんにちは") is None
+    assert client.stats['failures'] == 2 and client.stats['retries'] == 0
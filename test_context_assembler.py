@@ -0,0 +1,104 @@
+# test_context_assembler.py
+from modules.context_assembler import ContextAssembler, ContextSection
+from modules.token_estimator import estimate_tokens
+
+KNOWLEDGE = ["糸目糊で模様の輪郭を描きます", "色挿しは刷毛で一色ずつ行います", "蒸しで染料を定着させます"]
+HISTORY = ["来訪者: 京友禅って何？", "REI: 京都の手描き染めです", "来訪者: 工程を教えて"]
+
+
+def section_tokens(title, items):
+    return estimate_tokens(ContextSection(title, title, items).render())
+
+
+def fitting_budget(title, items):
+    """見出しと、各項目＋改行分を足した予算（この項目までちょうど入る）"""
+    return estimate_tokens(ContextSection(title, title, []).render([])) + sum(estimate_tokens(item) + 1 for item in items)
+
+
+def test_everything_fits_in_original_order():
+    assembler = ContextAssembler(token_budget=1000)
+    context, report = assembler.assemble([
+        ContextSection('history', '会話', HISTORY, priority=2, dedupe=False),
+        ContextSection('knowledge', '専門知識', KNOWLEDGE, priority=1),
+    ])
+
+    assert context == "【会話】\n" + "\n".join(HISTORY) + "\n\n【専門知識】\n" + "\n".join(KNOWLEDGE)
+    assert report['dropped'] == [] and report['saved_tokens'] == 0
+    assert report['assembled_tokens'] == report['original_tokens']
+
+
+def test_budget_goes_to_higher_priority_first():
+    budget = section_tokens('専門知識', KNOWLEDGE) + 5
+    assembler = ContextAssembler(token_budget=budget)
+    context, report = assembler.assemble([
+        ContextSection('history', '会話', HISTORY, priority=2, dedupe=False),
+        ContextSection('knowledge', '専門知識', KNOWLEDGE, priority=1),
+    ])
+
+    assert context == "【専門知識】\n" + "\n".join(KNOWLEDGE)
+    assert report['dropped'] == ['history']
+    assert report['assembled_tokens'] <= budget
+    assert report['saved_tokens'] == report['original_tokens'] - report['assembled_tokens']
+
+
+def test_sections_are_truncated_item_by_item_at_the_budget():
+    budget = fitting_budget('専門知識', KNOWLEDGE[:2])
+    context, report = ContextAssembler(token_budget=budget).assemble([
+        ContextSection('knowledge', '専門知識', KNOWLEDGE),
+    ])
+    assert context == "【専門知識】\n" + "\n".join(KNOWLEDGE[:2])
+    assert report['assembled_tokens'] <= budget
+
+    # 会話の文脈は新しい方を残す
+    budget = fitting_budget('会話', HISTORY[1:])
+    context, report = ContextAssembler(token_budget=budget).assemble([
+        ContextSection('history', '会話', HISTORY, keep_tail=True, dedupe=False),
+    ])
+    assert context == "【会話】\n" + "\n".join(HISTORY[1:])
+    assert report['assembled_tokens'] <= budget
+
+
+def test_required_section_is_kept_over_budget():
+    assembler = ContextAssembler(token_budget=5)
+    context, report = assembler.assemble([
+        ContextSection('persona', '人物', ["京友禅職人の吉田麗です"], required=True),
+        ContextSection('knowledge', '専門知識', KNOWLEDGE, priority=1),
+    ])
+
+    assert context == "【人物】\n京友禅職人の吉田麗です"
+    assert report['dropped'] == ['knowledge']
+
+
+def test_empty_sections_and_inputs():
+    assembler = ContextAssembler(token_budget=100)
+    assert assembler.assemble([]) == ("", {
+        'original_tokens': 0, 'assembled_tokens': 0, 'saved_tokens': 0, 'sections': {}, 'dropped': []
+    })
+
+    context, report = assembler.assemble([
+        ContextSection('blank', '空', ["", "  ", None]),
+        ContextSection('knowledge', '専門知識', KNOWLEDGE[:1]),
+    ])
+    assert context == "【専門知識】\n" + KNOWLEDGE[0]
+    assert report['sections'] == {'knowledge': section_tokens('専門知識', KNOWLEDGE[:1])}
+
+    # 見出しすら入らない予算なら区画ごと落とす
+    context, report = ContextAssembler(token_budget=1).assemble([ContextSection('knowledge', '専門知識', KNOWLEDGE)])
+    assert context == "" and report['dropped'] == ['knowledge']
+
+
+def test_duplicates_of_other_sections_and_the_system_prompt_are_removed():
+    assembler = ContextAssembler(token_budget=1000)
+    context, report = assembler.assemble(
+        [
+            ContextSection('persona', '人物', ["京友禅職人の吉田麗です。工房は京都にあります。"]),
+            ContextSection('knowledge', '専門知識', KNOWLEDGE, priority=1),
+            ContextSection('chunks', '関連資料', ["- [工程] " + KNOWLEDGE[0] + "\n友禅の下絵は青花で描きます"], priority=2),
+        ],
+        exclude_texts=["あなたは京友禅職人の吉田麗です。工房は京都にあります。"]
+    )
+
+    assert 'persona' in report['dropped']
+    assert context == "【専門知識】\n" + "\n".join(KNOWLEDGE)
+    assert 'chunks' in report['dropped']
+    assert assembler.get_stats()['deduplicated_sections'] == 1
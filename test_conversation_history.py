@@ -0,0 +1,199 @@
+# test_conversation_history.py
+from datetime import datetime, timedelta, timezone
+
+from modules.conversation_history import ConversationHistoryManager, timestamp_key
+
+START = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeSupabase:
+    """conversations / sessions テーブルだけを持つSupabaseの代わり"""
+
+    def __init__(self):
+        self.tables = {'conversations': [], 'sessions': []}
+        self.fail_updates = False
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+
+class FakeQuery:
+    def __init__(self, supabase, name):
+        self.supabase = supabase
+        self.name = name
+        self.filters = []
+        self.order_desc = None
+        self.row_limit = None
+        self.values = None
+
+    def select(self, columns):
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(lambda row: timestamp_key(row.get(column)) > timestamp_key(value))
+        return self
+
+    def order(self, column, desc=False):
+        self.order_desc = desc
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def update(self, values):
+        self.values = values
+        return self
+
+    def execute(self):
+        rows = [row for row in self.supabase.tables[self.name] if all(match(row) for match in self.filters)]
+        if self.values is not None:
+            if self.supabase.fail_updates:
+                raise RuntimeError('column "summary" does not exist')
+            for row in rows:
+                row.update(self.values)
+            return FakeResult(rows)
+        if self.order_desc is not None:
+            rows.sort(key=lambda row: timestamp_key(row['created_at']), reverse=self.order_desc)
+        if self.row_limit is not None:
+            rows = rows[:self.row_limit]
+        return FakeResult([dict(row) for row in rows])
+
+
+class FakeResult:
+    def __init__(self, data):
+        self.data = data
+
+
+class FakeOpenAIService:
+    """要約に渡された会話を記録し、決まった要約を返す"""
+
+    def __init__(self):
+        self.calls = []
+
+    def chat(self, **params):
+        self.calls.append(params['messages'][-1]['content'])
+        return f"要約{len(self.calls)}"
+
+
+class FakeWriteBehind:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def pending_rows(self, table, **filters):
+        return [row for row in self.rows if all(row.get(key) == value for key, value in filters.items())]
+
+
+def make_rows(count, session_id='s1'):
+    rows = []
+    for i in range(count):
+        rows.append({
+            'session_id': session_id,
+            'role': 'user' if i % 2 == 0 else 'assistant',
+            'content': f"メッセージ{i}",
+            'created_at': (START + timedelta(seconds=i)).isoformat(),
+        })
+    return rows
+
+
+def make_manager(rows, **kwargs):
+    supabase = FakeSupabase()
+    supabase.tables['conversations'] = rows
+    supabase.tables['sessions'] = [{'id': 's1', 'summary': None, 'summary_until': None}]
+    service = FakeOpenAIService()
+    options = dict(max_turns=2, token_budget=10000, summary_batch_turns=2)
+    options.update(kwargs)
+    return ConversationHistoryManager(supabase, openai_service=service, **options), supabase, service
+
+
+def contents(history):
+    return [message['content'] for message in history['messages']]
+
+
+def test_load_keeps_unfolded_messages_outside_window():
+    manager, _, _ = make_manager(make_rows(10))
+    history = manager.load('s1')
+
+    # 窓（2往復）の外でも、まだ要約に畳み込んでいない会話はそのまま入る
+    assert history['summary'] == ''
+    assert contents(history) == [f"メッセージ{i}" for i in range(10)]
+
+
+def test_refresh_waits_until_fold_reaches_batch():
+    rows = make_rows(6)
+    manager, _, service = make_manager(rows)
+
+    # 窓は4件なので畳み込むのは2件、summary_batch_turns（4件）に足りない
+    assert manager.refresh_summary('s1') is False
+    assert service.calls == []
+
+
+def test_refresh_folds_everything_before_window():
+    rows = make_rows(9)
+    manager, supabase, service = make_manager(rows)
+
+    assert manager.refresh_summary('s1') is True
+    assert len(service.calls) == 1
+    assert "メッセージ4" in service.calls[0] and "メッセージ5" not in service.calls[0]
+
+    session = supabase.tables['sessions'][0]
+    assert session['summary'] == '要約1'
+    assert session['summary_until'] == rows[4]['created_at']
+
+    history = manager.load('s1')
+    assert history['summary'] == '要約1'
+    assert contents(history) == [f"メッセージ{i}" for i in range(5, 9)]
+
+
+def test_every_message_is_folded_or_in_prompt_when_over_budget():
+    rows = make_rows(8)
+    # 要約なら約9トークン、1件は約5 + 4トークン。窓の4件は入らない
+    manager, _, service = make_manager(rows, token_budget=30)
+
+    first = manager.load('s1')
+    assert len(first['messages']) < 8
+    assert first['tokens'] <= 30
+
+    assert manager.refresh_summary('s1') is True
+    folded = service.calls[0]
+    history = manager.load('s1')
+    assert history['tokens'] <= 30
+    for row in rows:
+        assert row['content'] in folded or row['content'] in contents(history)
+
+
+def test_pending_rows_are_merged_without_duplicates():
+    rows = make_rows(4)
+    written, pending = rows[:3], [dict(row) for row in rows[2:]]
+    # 書き込み待ちの行はタイムゾーンなしの時刻のこともある
+    for row in pending:
+        row['created_at'] = timestamp_key(row['created_at']).replace(tzinfo=None).isoformat()
+    manager, _, _ = make_manager(written, write_behind=FakeWriteBehind(pending))
+
+    assert contents(manager.load('s1')) == [f"メッセージ{i}" for i in range(4)]
+
+
+def test_failed_save_keeps_summary_and_does_not_resummarize():
+    rows = make_rows(9)
+    manager, supabase, service = make_manager(rows)
+    supabase.fail_updates = True
+
+    assert manager.refresh_summary('s1') is True
+    assert manager.get_stats()['summary_save_errors'] == 1
+
+    # 保存できなくても、メモリ上の要約より後だけを読む（同じ会話を要約し直さない）
+    history = manager.load('s1')
+    assert history['summary'] == '要約1'
+    assert contents(history) == [f"メッセージ{i}" for i in range(5, 9)]
+    assert manager.refresh_summary('s1') is False
+    assert len(service.calls) == 1
+
+
+def test_timestamp_key_treats_naive_values_as_utc():
+    assert timestamp_key('2024-01-01T09:00:00+09:00') == timestamp_key('2024-01-01T00:00:00')
+    assert timestamp_key('2024-01-01T00:00:00Z') == START
+    assert timestamp_key(None) < START
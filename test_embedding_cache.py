@@ -0,0 +1,88 @@
+# test_embedding_cache.py
+import zlib
+
+import numpy as np
+import pytest
+
+pytest.importorskip('langchain_core')
+from modules.embedding_cache import CachedEmbeddings, normalize_embedding_text
+
+
+class FakeEmbeddings:
+    """テキストから決まるベクトルを返し、埋め込んだテキストを記録する"""
+
+    model = 'fake-embedding'
+
+    def __init__(self):
+        self.queries = []
+        self.documents = []
+
+    @staticmethod
+    def vector(text):
+        rng = np.random.default_rng(zlib.crc32(text.encode('utf-8')))
+        return rng.normal(size=8).astype(np.float32).tolist()
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return self.vector(text)
+
+    def embed_documents(self, texts):
+        self.documents.extend(texts)
+        return [self.vector(text) for text in texts]
+
+
+def test_query_and_prefetch_embed_the_same_text():
+    base = FakeEmbeddings()
+    cache = CachedEmbeddings(base, cache_path=None)
+    cache.prefetch(["京友禅　とは？"])
+    queried = CachedEmbeddings(FakeEmbeddings(), cache_path=None)
+    vector = queried.embed_query(" 京友禅 とは? ")
+
+    # どちらの経路でも正規化したテキストを埋め込むので、同じキーには同じ入力のベクトルが入る
+    key = normalize_embedding_text("京友禅　とは？")
+    assert base.documents == [key] and queried.base.queries == [key]
+    assert np.allclose(cache.embed_query("京友禅 とは?"), vector)
+    assert cache.get_stats()['hits'] == 1 and cache.get_stats()['misses'] == 0
+
+
+def test_cache_is_bounded_by_least_recent_use():
+    base = FakeEmbeddings()
+    cache = CachedEmbeddings(base, cache_path=None, max_items=2)
+    cache.embed_query("一")
+    cache.embed_query("二")
+    cache.embed_query("一")
+    cache.embed_query("三")
+
+    assert cache.get_stats()['items'] == 2
+    cache.embed_query("一")
+    cache.embed_query("二")
+    assert base.queries == ["一", "二", "三", "二"]
+
+
+def test_npz_round_trip_keeps_vectors_and_order(tmp_path):
+    path = str(tmp_path / 'cache' / 'embeddings.npz')
+    cache = CachedEmbeddings(FakeEmbeddings(), cache_path=path, max_items=3)
+    for text in ["一", "二", "三"]:
+        cache.embed_query(text)
+    cache.embed_query("一")
+    cache.save()
+
+    base = FakeEmbeddings()
+    loaded = CachedEmbeddings(base, cache_path=path, max_items=2)
+    assert loaded.get_stats()['items'] == 2
+    assert np.allclose(loaded.embed_query("一"), FakeEmbeddings.vector("一"))
+    assert np.allclose(loaded.embed_query("三"), FakeEmbeddings.vector("三"))
+    # 最も古く使われた「二」は読み込み時の上限で落ちる
+    loaded.embed_query("二")
+    assert base.queries == ["二"]
+
+
+def test_cache_from_another_model_is_discarded(tmp_path):
+    path = str(tmp_path / 'embeddings.npz')
+    cache = CachedEmbeddings(FakeEmbeddings(), cache_path=path)
+    cache.embed_query("一")
+    cache.save()
+
+    other = FakeEmbeddings()
+    other.model = 'another-model'
+    assert CachedEmbeddings(other, cache_path=path).get_stats()['items'] == 0
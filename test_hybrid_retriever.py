@@ -0,0 +1,107 @@
+# test_hybrid_retriever.py
+import threading
+
+from modules.hybrid_retriever import HybridRetriever, RetrievedPassage
+from modules.knowledge_index import KnowledgeEntry
+from modules.token_estimator import estimate_tokens
+
+
+class FakeDocument:
+    def __init__(self, page_content):
+        self.page_content = page_content
+
+
+def lexical(*texts):
+    return [RetrievedPassage(text, '京友禅', 'lexical') for text in texts]
+
+
+def vector(*texts):
+    return [RetrievedPassage(text, '', 'vector') for text in texts]
+
+
+def make_retriever(**kwargs):
+    return HybridRetriever(lambda query, k: [], **kwargs)
+
+
+def test_fuse_adds_reciprocal_ranks_of_both_lists():
+    retriever = make_retriever(rrf_k=60)
+    fused = retriever._fuse([lexical("糸目糊", "下絵"), vector("下絵", "蒸し")])
+
+    assert [passage.text for passage in fused] == ["下絵", "糸目糊", "蒸し"]
+    assert fused[0].sources == {'lexical', 'vector'}
+    assert fused[0].score == 1 / 62 + 1 / 61
+    assert fused[1].score == 1 / 61
+    # 同点は先に見つかった語彙検索の方が上
+    assert fused[2].score == 1 / 62 and fused[2].sources == {'vector'}
+
+
+def test_fuse_merges_texts_that_differ_only_in_normalization():
+    retriever = make_retriever()
+    fused = retriever._fuse([lexical("糸目糊 とは"), vector("糸目糊とは"), vector("")])
+
+    assert len(fused) == 1
+    assert fused[0].sources == {'lexical', 'vector'}
+
+
+def test_select_skips_items_contained_in_selected_chunk():
+    retriever = make_retriever()
+    chunk = vector("友禅では糸目糊で輪郭を描き、色挿しをします。")[0]
+    selected = retriever._select([chunk] + lexical("糸目糊で輪郭を描き"))
+
+    assert selected == [chunk]
+    assert chunk.sources == {'lexical', 'vector'}
+    assert retriever.stats['duplicates'] == 1
+
+
+def test_select_replaces_items_with_containing_chunk_in_place():
+    retriever = make_retriever()
+    items = lexical("下絵を描く", "糸目糊で輪郭を描き", "蒸しで色を定着させる")
+    items[1].score = 0.5
+    chunk = vector("友禅では糸目糊で輪郭を描き、色挿しをします。")[0]
+    chunk.score = 0.1
+    selected = retriever._select(items + [chunk])
+
+    assert [passage.text for passage in selected] == ["下絵を描く", chunk.text, "蒸しで色を定着させる"]
+    assert selected[1].sources == {'lexical', 'vector'}
+    assert selected[1].score == 0.5
+
+
+def test_select_stops_at_max_results():
+    retriever = make_retriever(max_results=2)
+    selected = retriever._select(lexical("下絵", "糸目糊", "蒸し"))
+
+    assert [passage.text for passage in selected] == ["下絵", "糸目糊"]
+
+
+def test_select_never_exceeds_token_budget():
+    big = vector("友禅" * 200)[0]
+    small = lexical("糸目糊で輪郭を描く", "蒸しで色を定着させる", "水元で糊を落とす")
+    budget = sum(estimate_tokens(passage.render()) for passage in small[:2])
+    retriever = make_retriever(max_tokens=budget)
+    selected = retriever._select([big] + small)
+
+    # 先頭の大きなチャンクも、予算を超える3件目も入れない
+    assert [passage.text for passage in selected] == [passage.text for passage in small[:2]]
+    assert sum(estimate_tokens(passage.render()) for passage in selected) <= budget
+    assert retriever.stats['over_budget'] == 2
+
+
+def test_retrieve_falls_back_to_lexical_when_vector_search_times_out():
+    release = threading.Event()
+
+    def slow_vector_search(query, k):
+        release.wait(5)
+        return [FakeDocument("遅い結果")]
+
+    def lexical_search(query, k):
+        return [(1.0, KnowledgeEntry("京友禅", "_general", "糸目糊で輪郭を描く"))]
+
+    retriever = HybridRetriever(lexical_search, slow_vector_search, vector_timeout=0.05)
+    try:
+        passages = retriever.retrieve("糸目糊")
+    finally:
+        release.set()
+
+    assert [passage.render() for passage in passages] == ["- [京友禅] 糸目糊で輪郭を描く"]
+    assert retriever.stats['vector_timeouts'] == 1
+    assert retriever.stats['lexical_only'] == 1
@@ -0,0 +1,120 @@
+# test_knowledge_index.py
+import math
+import random
+from collections import Counter
+
+from modules.knowledge_index import KnowledgeIndex, HEADING_WEIGHT, char_ngrams
+
+WORDS = ["友禅", "糸目糊", "染料", "着物", "京都", "工房", "下絵", "蒸し", "水元", "金彩",
+         "刺繍", "反物", "図案", "色挿し", "伏せ糊", "地染め", "職人", "季節", "花柄", "手描き"]
+
+QUERIES = ["糸目糊って何？", "友禅の工程を教えて", "京都の工房", "金彩と刺繍", "手描きの花柄",
+           "地染めの色", "友禅その", "今日はいい天気ですね", "Hello there"]
+
+
+def make_knowledge_base(item_count, seed=0):
+    rng = random.Random(seed)
+    knowledge_base = {}
+    for i in range(item_count):
+        category = f"カテゴリ{i % 7}"
+        subcategory = '_general' if i % 3 == 0 else f"分類{i % 5}"
+        item = "".join(rng.choice(WORDS) for _ in range(rng.randint(2, 12))) + f"その{i}"
+        knowledge_base.setdefault(category, {}).setdefault(subcategory, []).append(item)
+    return knowledge_base
+
+
+def brute_force(index, knowledge_base, query, k=10):
+    """全項目のBM25を素直に計算した正解（平均文書長は索引が重みに使っている値に揃える）"""
+    documents = []
+    for category, subcategories in knowledge_base.items():
+        for subcategory, items in subcategories.items():
+            headings = [category] if subcategory == '_general' else [category, subcategory]
+            for item in items:
+                terms = {gram: float(count) for gram, count in Counter(char_ngrams(item)).items()}
+                for heading in headings:
+                    for gram in char_ngrams(heading):
+                        terms[gram] = terms.get(gram, 0.0) + HEADING_WEIGHT
+                documents.append(((category, subcategory, item), terms, sum(terms.values())))
+
+    avg_length = index._weight_avg_length
+    df = Counter(gram for _, terms, _ in documents for gram in terms)
+    scored = []
+    for key, terms, length in documents:
+        norm = index.k1 * (1 - index.b + index.b * length / avg_length)
+        score = 0.0
+        for gram in set(char_ngrams(query)):
+            tf = terms.get(gram)
+            if tf:
+                idf = math.log(1 + (len(documents) - df[gram] + 0.5) / (df[gram] + 0.5))
+                score += idf * tf * (index.k1 + 1) / (tf + norm)
+        if score > 0:
+            scored.append((score, key))
+    scored.sort(key=lambda result: -result[0])
+    return scored[:k]
+
+
+def assert_matches_brute_force(index, knowledge_base, k=10):
+    for query in QUERIES:
+        results = index.search(query, k)
+        expected = brute_force(index, knowledge_base, query, k)
+        assert len(results) == len(expected), query
+        for (score, entry), (expected_score, _) in zip(results, expected):
+            assert math.isclose(score, expected_score, rel_tol=1e-9), query
+        # 同点の並びは問わないが、k件目より高いスコアの項目はすべて含まれる
+        if expected:
+            cutoff = expected[-1][0]
+            keys = {entry.key for _, entry in results}
+            assert all(key in keys for score, key in expected if score > cutoff + 1e-9), query
+
+
+def test_search_matches_brute_force():
+    knowledge_base = make_knowledge_base(2000)
+    index = KnowledgeIndex()
+    index.build(knowledge_base)
+
+    assert len(index) == 2000
+    assert_matches_brute_force(index, knowledge_base)
+    # 上位k件に届かないn-gramの枝刈りを通っている
+    assert index.get_stats()['pruned_terms'] > 0
+
+
+def test_update_adds_and_removes_only_the_difference():
+    knowledge_base = make_knowledge_base(500)
+    index = KnowledgeIndex()
+    index.build(knowledge_base)
+
+    removed_category = next(iter(knowledge_base))
+    removed_count = sum(len(items) for items in knowledge_base[removed_category].values())
+    updated = {category: subcategories for category, subcategories in knowledge_base.items()
+               if category != removed_category}
+    updated["新カテゴリ"] = {"_general": ["糸目糊で輪郭を描いてから色挿しをします", "金彩は最後に施します"]}
+
+    assert index.update(updated) == (2, removed_count)
+    assert index.update(updated) == (0, 0)
+    assert len(index) == 500 - removed_count + 2
+    assert_matches_brute_force(index, updated)
+
+    results = index.search("糸目糊で輪郭を描く", k=50)
+    assert all(entry.category != removed_category for _, entry in results)
+    assert results[0][1].item == "糸目糊で輪郭を描いてから色挿しをします"
+
+
+def test_weights_are_recomputed_when_average_length_drifts():
+    index = KnowledgeIndex()
+    index.build({"短い": {"_general": ["友禅", "着物"]}})
+    index.update({
+        "短い": {"_general": ["友禅", "着物"]},
+        "長い": {"_general": ["友禅の工程は下絵から糸目糊置き、色挿し、地染め、蒸し、水元まで続きます"]},
+    })
+
+    assert index.get_stats()['renormalized'] >= 1
+    assert index._weight_avg_length == index._total_length / len(index)
+
+
+def test_search_without_matches_returns_nothing():
+    index = KnowledgeIndex()
+    assert index.search("友禅") == []
+
+    index.build({"京友禅": {"_general": ["糸目糊で輪郭を描きます"]}})
+    assert index.search("") == []
+    assert index.search("Hello") == []
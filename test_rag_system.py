@@ -0,0 +1,53 @@
+# test_rag_system.py
+import pytest
+
+rag_system = pytest.importorskip('modules.rag_system')
+
+
+class FakeCollection:
+    """LangChainのChromaの get() だけを持つコレクション"""
+
+    def __init__(self, rows):
+        # rows: (ID, 本文, メタデータ, 埋め込み)
+        self.rows = rows
+
+    def get(self, include, limit, offset):
+        page = self.rows[offset:offset + limit]
+        result = {'ids': [row[0] for row in page]}
+        for key, column in (('documents', 1), ('metadatas', 2), ('embeddings', 3)):
+            if key in include:
+                result[key] = [row[column] for row in page]
+        return result
+
+
+def fingerprint(rows):
+    rag = rag_system.RAGSystem.__new__(rag_system.RAGSystem)
+    rag.db = FakeCollection(rows)
+    return rag._collection_fingerprint()
+
+
+ROWS = [
+    ('a', "京友禅は手描きの染め物です", {'source': 'knowledge.txt'}, [0.1, 0.2]),
+    ('b', "糸目糊で輪郭を描きます", {'source': 'knowledge.txt'}, [0.3, 0.4]),
+]
+
+
+def test_fingerprint_ignores_collection_order():
+    assert fingerprint(ROWS) == fingerprint(list(reversed(ROWS)))
+    assert fingerprint(ROWS).startswith('2:')
+
+
+def test_fingerprint_changes_when_a_document_is_edited_in_place():
+    edited = [ROWS[0], ('b', "糸目糊で模様の輪郭を描きます", ROWS[1][2], ROWS[1][3])]
+    reembedded = [ROWS[0], ROWS[1][:3] + ([0.3, 0.5],)]
+    moved = [ROWS[0], ('b', ROWS[1][1], {'source': 'response.txt'}, ROWS[1][3])]
+
+    assert len({fingerprint(ROWS), fingerprint(edited), fingerprint(reembedded), fingerprint(moved)}) == 4
+
+
+def test_fingerprint_pages_through_the_collection(monkeypatch):
+    monkeypatch.setattr(rag_system, 'COLLECTION_PAGE_SIZE', 2)
+    rows = [(f"id{i}", f"本文{i}", {}, [float(i)]) for i in range(5)]
+
+    assert fingerprint(rows).startswith('5:')
+    assert fingerprint(rows) != fingerprint(rows[:4])
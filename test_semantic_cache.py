@@ -0,0 +1,137 @@
+# test_semantic_cache.py
+import numpy as np
+import pytest
+
+from modules import semantic_cache
+from modules.semantic_cache import SemanticResponseCache, context_key
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def rotated(vector, similarity):
+    """vector とのコサイン類似度が similarity になるベクトル"""
+    other = np.zeros_like(vector)
+    other[np.argmin(np.abs(vector))] = 1.0
+    other -= (other @ vector) * vector
+    other /= np.linalg.norm(other)
+    return similarity * vector + np.sqrt(1 - similarity ** 2) * other
+
+
+QUESTION = unit(1.0, 0.2, 0.1, 0.0)
+FORMAL_NEUTRAL = SemanticResponseCache.make_scope('formal', 'neutral')
+
+
+def test_hit_requires_threshold():
+    cache = SemanticResponseCache(threshold=0.97)
+    cache.store(QUESTION, FORMAL_NEUTRAL, "京友禅って何？", "京都の染め物です")
+
+    hit = cache.lookup(rotated(QUESTION, 0.98), FORMAL_NEUTRAL)
+    assert hit['answer'] == "京都の染め物です"
+    assert hit['similarity'] >= 0.97
+    assert cache.lookup(rotated(QUESTION, 0.95), FORMAL_NEUTRAL) is None
+    assert cache.get_stats()['hits'] == 1 and cache.get_stats()['misses'] == 1
+
+
+def test_scopes_are_separate():
+    cache = SemanticResponseCache()
+    cache.store(QUESTION, FORMAL_NEUTRAL, "京友禅って何？", "京都の染め物です")
+
+    assert cache.lookup(QUESTION, SemanticResponseCache.make_scope('casual', 'neutral')) is None
+    assert cache.lookup(QUESTION, SemanticResponseCache.make_scope('formal', 'sad')) is None
+    # 細かい感情は大まかな区分にまとめる
+    assert cache.make_scope('formal', 'happy') == cache.make_scope('formal', 'surprised')
+    assert cache.lookup(QUESTION, SemanticResponseCache.make_scope('formal', None)) is not None
+
+
+def test_best_match_in_scope_is_returned():
+    cache = SemanticResponseCache(threshold=0.9)
+    other = unit(0.0, 0.0, 1.0, 0.2)
+    cache.store(other, FORMAL_NEUTRAL, "好きな食べ物は？", "湯豆腐です")
+    cache.store(rotated(QUESTION, 0.95), FORMAL_NEUTRAL, "京友禅とは？", "古い回答")
+    cache.store(QUESTION, FORMAL_NEUTRAL, "京友禅って何？", "新しい回答")
+
+    assert cache.lookup(QUESTION, FORMAL_NEUTRAL)['answer'] == "新しい回答"
+    assert cache.lookup(other, FORMAL_NEUTRAL)['answer'] == "湯豆腐です"
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(semantic_cache.time, 'time', lambda: now[0])
+    cache = SemanticResponseCache(ttl_seconds=60)
+    cache.store(QUESTION, FORMAL_NEUTRAL, "京友禅って何？", "京都の染め物です")
+
+    now[0] += 59
+    assert cache.lookup(QUESTION, FORMAL_NEUTRAL) is not None
+    now[0] += 1
+    assert cache.lookup(QUESTION, FORMAL_NEUTRAL) is None
+    assert cache.get_stats()['entries'] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = SemanticResponseCache(max_entries=2)
+    first, second, third = unit(1, 0, 0), unit(0, 1, 0), unit(0, 0, 1)
+    cache.store(first, FORMAL_NEUTRAL, "一", "1")
+    cache.store(second, FORMAL_NEUTRAL, "二", "2")
+    assert cache.lookup(first, FORMAL_NEUTRAL) is not None
+
+    cache.store(third, FORMAL_NEUTRAL, "三", "3")
+    assert cache.lookup(second, FORMAL_NEUTRAL) is None
+    assert cache.lookup(first, FORMAL_NEUTRAL)['answer'] == "1"
+    assert cache.lookup(third, FORMAL_NEUTRAL)['answer'] == "3"
+
+
+def test_zero_vector_and_empty_answer_are_ignored():
+    cache = SemanticResponseCache()
+    cache.store(np.zeros(4), FORMAL_NEUTRAL, "？", "回答")
+    cache.store(QUESTION, FORMAL_NEUTRAL, "京友禅って何？", "")
+
+    assert cache.get_stats()['entries'] == 0
+    assert cache.lookup(np.zeros(4), FORMAL_NEUTRAL) is None
+
+
+class FakeEmbeddings:
+    def embed_query(self, text):
+        return QUESTION
+
+
+def test_context_scope_uses_only_the_last_exchange():
+    history = "【最近の会話】\nユーザー: 京友禅って何？\nあなた: 京都の手描き染めです"
+    longer = "【最近の会話】\nユーザー: こんにちは\nあなた: ようこそ\nユーザー: 京友禅って何？\nあなた: 京都の手描き染めです"
+
+    assert context_key("") == context_key("【最近の会話】\n") == ''
+    assert context_key(history) == context_key(longer)
+    assert context_key(history) != context_key(history.replace("手描き", "型"))
+    assert SemanticResponseCache.make_scope('formal', 'neutral', history)[:2] == FORMAL_NEUTRAL[:2]
+
+
+def test_rag_scopes_cache_by_conversation_context():
+    rag_system = pytest.importorskip('modules.rag_system')
+    rag = rag_system.RAGSystem.__new__(rag_system.RAGSystem)
+    rag.semantic_cache = SemanticResponseCache()
+    rag.db = object()
+    rag.embeddings = FakeEmbeddings()
+    history = "【最近の会話】\nユーザー: 京友禅って何？\nあなた: 京都の手描き染めです"
+    rag.semantic_cache.store(QUESTION, FORMAL_NEUTRAL, "京友禅って何？", "京都の染め物です")
+
+    # 文脈のない回答は会話の途中の質問には使わない
+    hit, vector, scope = rag._lookup_semantic_cache("それって何？", history, 1, 'formal', 'neutral')
+    assert hit is None and vector is not None
+    rag.semantic_cache.store(vector, scope, "それって何？", "布に模様を描いて染める技法です")
+
+    # 直前のやり取りが同じ別の会話ではヒットする
+    other_session = "【最近の会話】\nユーザー: こんにちは\nあなた: ようこそ\n" + history.split('\n', 1)[1]
+    hit, _, _ = rag._lookup_semantic_cache("それって何？", other_session, 1, 'formal', 'neutral')
+    assert hit['answer'] == "布に模様を描いて染める技法です"
+    hit, _, _ = rag._lookup_semantic_cache("それって何？", history.replace("手描き", "型"), 1, 'formal', 'neutral')
+    assert hit is None
+
+    # 繰り返し質問はキャッシュを使わない
+    assert rag._lookup_semantic_cache("京友禅って何？", "", 2, 'formal', 'neutral') == (None, None, None)
+    assert rag.semantic_cache.get_stats()['bypassed'] == 1
+
+    hit, _, scope = rag._lookup_semantic_cache("京友禅って何？", "", 1, 'formal', 'neutral')
+    assert hit['answer'] == "京都の染め物です"
+    assert scope == FORMAL_NEUTRAL
@@ -0,0 +1,78 @@
+# test_speech_processor.py
+import io
+import wave
+
+import pytest
+
+from modules.speech_processor import (
+    SpeechProcessor, AUDIO_MISSING_MESSAGE, NOT_RECOGNIZED_MESSAGE,
+    FFMPEG_UNAVAILABLE_MESSAGE, TRANSCRIPTION_FAILED_MESSAGE
+)
+
+
+class FakeOpenAIService:
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+
+    def transcribe(self, **params):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.result
+
+
+def make_wav(seconds):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(b'\x00\x00' * int(16000 * seconds))
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def make_processor(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+
+    def make(service, ffmpeg_available=True):
+        processor = SpeechProcessor(openai_service=service)
+        processor.ffmpeg_available = ffmpeg_available
+        return processor
+    return make
+
+
+def test_transcription_text_is_returned(make_processor):
+    processor = make_processor(FakeOpenAIService(result=" 京友禅って何？\n"))
+    assert processor.transcribe(make_wav(1.0)) == ("京友禅って何？", None)
+    assert processor.transcribe_audio(make_wav(1.0)) == "京友禅って何？"
+
+
+def test_failures_return_a_message_instead_of_text(make_processor):
+    # 失敗時のメッセージが発言として返らない（応答の生成に回らない）
+    service = FakeOpenAIService(error=RuntimeError('API error'))
+    processor = make_processor(service)
+    assert processor.transcribe(make_wav(1.0)) == (None, TRANSCRIPTION_FAILED_MESSAGE)
+    assert processor.transcribe_audio(make_wav(1.0)) is None
+
+
+def test_missing_ffmpeg_is_reported_without_calling_the_api(make_processor):
+    service = FakeOpenAIService(result="呼ばれない")
+    processor = make_processor(service, ffmpeg_available=False)
+
+    assert processor.transcribe(b'\x00' * 2048) == (None, FFMPEG_UNAVAILABLE_MESSAGE)
+    assert processor.transcribe_audio(b'\x00' * 2048) is None
+    assert service.calls == 0
+
+
+def test_empty_short_and_undecodable_audio(make_processor):
+    service = FakeOpenAIService(result="")
+    processor = make_processor(service)
+
+    assert processor.transcribe(b'') == (None, AUDIO_MISSING_MESSAGE)
+    assert processor.transcribe('data:audio/webm;base64,***') == (None, AUDIO_MISSING_MESSAGE)
+    assert processor.transcribe(make_wav(0.05)) == (None, NOT_RECOGNIZED_MESSAGE)
+    # 結果が空なら認識できなかった扱い
+    assert processor.transcribe(make_wav(1.0)) == (None, NOT_RECOGNIZED_MESSAGE)
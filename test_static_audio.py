@@ -0,0 +1,111 @@
+# test_static_audio.py
+import io
+import wave
+
+from modules.audio_clip import AudioClip
+from modules.static_audio import StaticAudioLibrary, clip_key
+
+# MPEG-1 レイヤー3, 128kbps, 44.1kHz の1フレーム（417バイト）
+MP3_FRAME = b'\xff\xfb\x90\x64' + b'\x00' * 413
+# AAC(ADTS)の1フレーム
+ADTS_FRAME = b'\xff\xf1\x50\x80\x02\x1f\xfc' + b'\x00' * 10
+
+
+def make_wav(samples, sample_rate=16000):
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as writer:
+        writer.setnchannels(1)
+        writer.setsampwidth(2)
+        writer.setframerate(sample_rate)
+        writer.writeframes(samples)
+    return buffer.getvalue()
+
+
+def build_library(tmp_path, clips):
+    """clips: テキスト → AudioClip の辞書を事前生成したライブラリ"""
+    library = StaticAudioLibrary(str(tmp_path))
+    result = library.build(
+        [(text, 'neutral') for text in clips],
+        lambda text, emotion: clips[text],
+        engine='test'
+    )
+    assert result['generated'] == len(clips)
+    return library
+
+
+def test_single_clip_is_served_by_url(tmp_path):
+    library = build_library(tmp_path, {"こんにちは": AudioClip.from_bytes(make_wav(b'\x01\x00' * 1600), 'audio/wav')})
+
+    assert library.get_audio(["こんにちは"]) == f"/static/audio/static_qa/{clip_key('こんにちは')}.wav"
+    # マニフェストから読み直しても同じ
+    assert StaticAudioLibrary(str(tmp_path)).get_audio(["こんにちは"]) == library.get_audio(["こんにちは"])
+
+
+def test_wav_clips_are_concatenated_at_pcm_level(tmp_path):
+    library = build_library(tmp_path, {
+        "前置き": AudioClip.from_bytes(make_wav(b'\x01\x00' * 1600), 'audio/wav'),
+        "本文": AudioClip.from_bytes(make_wav(b'\x02\x00' * 3200), 'audio/wav'),
+    })
+    clip = library.get_audio(["前置き", "", "本文"])
+
+    assert isinstance(clip, AudioClip) and clip.mime == 'audio/wav'
+    with wave.open(io.BytesIO(clip.data), 'rb') as reader:
+        assert reader.getnframes() == 4800
+        assert reader.readframes(4800) == b'\x01\x00' * 1600 + b'\x02\x00' * 3200
+    assert clip.duration == 0.3
+    # 2回目はメモリの連結済み音声を返す
+    assert library.get_audio(["前置き", "本文"]) is clip
+
+
+def test_mp3_and_aac_clips_are_joined_frame_by_frame(tmp_path):
+    library = build_library(tmp_path, {
+        "MP3の前置き": AudioClip(MP3_FRAME * 2, 'mp3'),
+        "MP3の本文": AudioClip(MP3_FRAME * 3, 'mp3'),
+        "AACの前置き": AudioClip(ADTS_FRAME * 2, 'aac', duration=0.5),
+        "AACの本文": AudioClip(ADTS_FRAME, 'aac', duration=0.25),
+    })
+
+    mp3 = library.get_audio(["MP3の前置き", "MP3の本文"])
+    assert mp3.data == MP3_FRAME * 5 and mp3.codec == 'mp3'
+
+    # ヘッダーから長さが求まらないAACは各クリップの長さの合計
+    aac = library.get_audio(["AACの前置き", "AACの本文"])
+    assert aac.data == ADTS_FRAME * 3 and aac.codec == 'aac'
+    assert aac.duration == 0.75
+
+
+def test_unsupported_mixed_or_missing_clips_fall_back_to_live_synthesis(tmp_path):
+    library = build_library(tmp_path, {
+        "Oggの前置き": AudioClip(b'OggS' + b'\x00' * 60, 'opus'),
+        "Oggの本文": AudioClip(b'OggS' + b'\x00' * 60, 'opus'),
+        "WAVの本文": AudioClip.from_bytes(make_wav(b'\x00\x00' * 160), 'audio/wav'),
+    })
+
+    # Noneなら呼び出し側でその場で音声化する
+    assert library.get_audio(["Oggの前置き", "Oggの本文"]) is None
+    assert library.get_audio(["Oggの前置き", "WAVの本文"]) is None
+    assert library.get_audio(["未生成", "WAVの本文"]) is None
+    assert library.get_audio([]) is None
+
+
+def test_wav_with_different_formats_is_not_concatenated(tmp_path):
+    library = build_library(tmp_path, {
+        "16kHz": AudioClip.from_bytes(make_wav(b'\x00\x00' * 160, 16000), 'audio/wav'),
+        "24kHz": AudioClip.from_bytes(make_wav(b'\x00\x00' * 240, 24000), 'audio/wav'),
+    })
+    assert library.get_audio(["16kHz", "24kHz"]) is None
+
+
+def test_build_skips_existing_clips(tmp_path):
+    calls = []
+
+    def synthesize(text, emotion):
+        calls.append(text)
+        return AudioClip(MP3_FRAME, 'mp3')
+
+    library = StaticAudioLibrary(str(tmp_path))
+    library.build([("一", None), ("二", None)], synthesize, engine='test')
+    result = StaticAudioLibrary(str(tmp_path)).build([("一", None), ("三", None)], synthesize, engine='test')
+
+    assert result == {'generated': 1, 'skipped': 1, 'failed': 0}
+    assert calls == ["一", "二", "三"]
@@ -0,0 +1,56 @@
+# test_static_qa_data.py
+import random
+
+import pytest
+
+from benchmark_static_qa import build_queries, find_matching_qa_linear, scale_qa_pairs
+from static_qa_data import STATIC_QA_PAIRS, StaticQAMatcher, find_matching_qa, normalize_query
+
+
+def substring_queries(qa_pairs, count, seed=0):
+    """パターンの一部だけを切り出した質問（クエリがパターンに含まれる場合の照合用）"""
+    rng = random.Random(seed)
+    patterns = [normalize_query(pattern) for qa in qa_pairs for pattern in qa["patterns"]]
+    queries = []
+    for _ in range(count):
+        pattern = rng.choice(patterns)
+        start = rng.randrange(len(pattern) + 1)
+        queries.append(pattern[start:rng.randrange(start, len(pattern) + 1)])
+    return queries
+
+
+@pytest.mark.parametrize('multiplier', [1, 10])
+def test_matcher_agrees_with_the_linear_scan(multiplier):
+    qa_pairs = scale_qa_pairs(multiplier)
+    matcher = StaticQAMatcher(qa_pairs)
+
+    # 優先順位（先に書いたQ&A・パターンが勝つ）まで従来と一致する
+    for query in build_queries() + substring_queries(qa_pairs, 500) + ["", "存在しない質問です"]:
+        assert matcher.find(query) is find_matching_qa_linear(query, qa_pairs), query
+
+
+def test_overlapping_patterns_keep_their_priority():
+    first = {"patterns": ["友禅の工程"], "answer": "1"}
+    second = {"patterns": ["工程", "京友禅の工程を詳しく"], "answer": "2"}
+    third = {"patterns": ["の工"], "answer": "3"}
+    matcher = StaticQAMatcher([first, second, third])
+
+    assert matcher.find("友禅") is first
+    assert matcher.find("の工") is first
+    assert matcher.find("詳しく") is second
+    assert matcher.find("京友禅の工程を詳しく教えて") is first
+    assert matcher.find("染め") is None
+
+
+def test_index_grows_linearly_with_pattern_length():
+    pattern = "".join(chr(0x4e00 + i) for i in range(400))
+    matcher = StaticQAMatcher([{"patterns": [pattern], "answer": ""}])
+
+    # 部分文字列を全部持つと約8万件になる
+    assert len(matcher._sa_next) <= 2 * len(pattern)
+    assert matcher.find(pattern[150:320]) is not None
+
+
+def test_find_matching_qa_uses_the_static_pairs():
+    qa = STATIC_QA_PAIRS[0]
+    assert find_matching_qa(qa["patterns"][0]) is find_matching_qa_linear(qa["patterns"][0], STATIC_QA_PAIRS)
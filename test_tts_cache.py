@@ -0,0 +1,99 @@
+# test_tts_cache.py
+import os
+
+from modules.audio_clip import AudioClip
+from modules.tts_cache import TTSAudioCache, TEMP_SUFFIX
+
+
+def clip(size, fill=b'a'):
+    return AudioClip(fill * size, 'wav')
+
+
+def test_memory_layer_evicts_least_recently_used(tmp_path):
+    cache = TTSAudioCache(str(tmp_path), max_memory_items=2)
+    cache.put('a' * 64, clip(10))
+    cache.put('b' * 64, clip(10))
+    assert cache.get('a' * 64)
+    cache.put('c' * 64, clip(10))
+
+    assert list(cache._memory) == ['a' * 64, 'c' * 64]
+    assert cache.get_stats()['memory_bytes'] == 20
+    # メモリから追い出した音声はディスクから読む
+    assert cache.get('b' * 64).data == b'a' * 10
+    assert cache.get_stats()['disk_hits'] == 1
+
+
+def test_memory_layer_respects_byte_limit(tmp_path):
+    cache = TTSAudioCache(str(tmp_path), max_memory_bytes=25)
+    cache.put('a' * 64, clip(10))
+    cache.put('b' * 64, clip(10))
+    cache.put('c' * 64, clip(10))
+    cache.put('d' * 64, clip(30))
+
+    assert list(cache._memory) == ['b' * 64, 'c' * 64]
+    assert cache.get_stats()['memory_bytes'] == 20
+
+
+def test_overwriting_a_key_does_not_double_count_disk_bytes(tmp_path):
+    cache = TTSAudioCache(str(tmp_path))
+    key = 'a' * 64
+    cache.put(key, clip(100))
+    cache.put(key, clip(40, b'b'))
+
+    assert cache.get_stats()['disk_bytes'] == 40
+    assert cache.get_stats()['memory_bytes'] == 40
+    assert cache._read_disk(key).data == b'b' * 40
+
+
+def test_disk_layer_prunes_oldest_files(tmp_path):
+    cache = TTSAudioCache(str(tmp_path), max_disk_bytes=250)
+    keys = [str(i) * 64 for i in range(3)]
+    for i, key in enumerate(keys):
+        cache.put(key, clip(100))
+        path = cache._disk_path(key, 'wav')
+        os.utime(path, (1000 + i, 1000 + i))
+
+    # 3件目で上限を超え、上限の9割以下になるまで最終アクセスが古いものから消す
+    assert cache.get_stats()['disk_bytes'] == 200
+    assert not os.path.exists(cache._disk_path(keys[0], 'wav'))
+    assert os.path.exists(cache._disk_path(keys[2], 'wav'))
+
+
+def test_temporary_files_are_not_counted_or_pruned(tmp_path):
+    TTSAudioCache(str(tmp_path)).put('a' * 64, clip(100))
+    temp_path = tmp_path / 'aa' / f"{'b' * 64}.wav.123{TEMP_SUFFIX}"
+    temp_path.write_bytes(b'x' * 500)
+
+    cache = TTSAudioCache(str(tmp_path), max_disk_bytes=150)
+    assert cache.get_stats()['disk_bytes'] == 100
+
+    cache.put('c' * 64, clip(100))
+    assert temp_path.exists()
+    assert cache.get_stats()['disk_bytes'] <= 150
+
+
+def test_failed_generation_with_fallback_is_not_a_miss(tmp_path):
+    stats = {}
+    cache = TTSAudioCache(str(tmp_path), stats=stats)
+    key = 'a' * 64
+
+    # CoeFontが失敗してOpenAIで作り直す場合、ミスは作り直した方の1回だけ数える
+    assert cache.get_or_generate('coefont', key, lambda: None, has_fallback=True) is None
+    assert stats['cache_misses'] == 0
+    assert cache.get_or_generate('openai', key, lambda: clip(10)).data == b'a' * 10
+    assert stats['cache_misses'] == 1
+
+    assert cache.get_or_generate('openai', key, lambda: clip(99)).size == 10
+    assert stats['cache_misses'] == 1
+    assert stats['cache_hits'] == 1
+
+    # フォールバックのない失敗はミス
+    assert cache.get_or_generate('openai', 'b' * 64, lambda: None) is None
+    assert stats['cache_misses'] == 2
+
+
+def test_make_key_normalizes_text():
+    assert TTSAudioCache.make_key('openai', 'nova', 'こんにちは　 世界') == \
+        TTSAudioCache.make_key('openai', 'nova', 'こんにちは 世界 ')
+    assert TTSAudioCache.make_key('openai', 'nova', 'こんにちは') != \
+        TTSAudioCache.make_key('openai', 'nova', 'こんにちは', {'speed': 1.1})
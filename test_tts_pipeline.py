@@ -0,0 +1,96 @@
+# test_tts_pipeline.py
+import threading
+
+from modules.tts_pipeline import SentenceTTSPipeline
+
+
+class FakeSynthesizer:
+    """文ごとの音声の代わりに文字列を返す（wait_for の文は指定した文が終わるまで返さない）"""
+
+    def __init__(self, wait_for=None, fail=()):
+        self.wait_for = wait_for or {}
+        self.fail = set(fail)
+        self.finished = {}
+        self.order = []
+        self._lock = threading.Lock()
+
+    def __call__(self, sentence, emotion):
+        self.finished.setdefault(sentence, threading.Event())
+        other = self.wait_for.get(sentence)
+        if other is not None:
+            self.finished.setdefault(other, threading.Event()).wait(5)
+        with self._lock:
+            self.order.append(sentence)
+        self.finished[sentence].set()
+        if sentence in self.fail:
+            raise RuntimeError('TTS error')
+        return f"audio:{sentence}:{emotion}"
+
+
+def run(deltas, synthesizer=None, **kwargs):
+    synthesizer = synthesizer or FakeSynthesizer()
+    delivered = []
+    pipeline = SentenceTTSPipeline(
+        synthesizer, lambda index, text, audio: delivered.append((index, text, audio)), **kwargs
+    )
+    for delta in deltas:
+        pipeline.feed(delta)
+    count = pipeline.finish()
+    return delivered, count
+
+
+def texts(delivered):
+    return [text for _, text, _ in delivered]
+
+
+def test_sentences_are_split_across_deltas():
+    delivered, count = run(["京友禅の職人です。糸目", "糊を置きま", "す！？ ぜひ見てく", "ださい"])
+
+    assert texts(delivered) == ["京友禅の職人です。", "糸目糊を置きます！？", "ぜひ見てください"]
+    assert count == 3
+
+
+def test_closing_brackets_stay_with_their_sentence():
+    delivered, _ = run(["先生は「よく見なさい！」と言いました。それから始めました。"])
+    assert texts(delivered) == ["先生は「よく見なさい！」", "と言いました。", "それから始めました。"]
+
+
+def test_short_sentences_are_merged_with_the_next():
+    delivered, _ = run(["はい。そう", "です。京友禅は手描きの染め物です。ね。"], min_sentence_length=6)
+
+    assert texts(delivered) == ["はい。そうです。", "京友禅は手描きの染め物です。", "ね。"]
+
+
+def test_chunks_are_delivered_in_order_when_synthesis_finishes_out_of_order():
+    sentences = ["一つ目の文です。", "二つ目の文です。", "三つ目の文です。"]
+    # 1文目は3文目が終わるまで、2文目も3文目が終わるまで返らない
+    synthesizer = FakeSynthesizer(wait_for={sentences[0]: sentences[2], sentences[1]: sentences[2]})
+    delivered, _ = run(["".join(sentences)], synthesizer, max_workers=3, emotion='happy')
+
+    assert synthesizer.order[0] == sentences[2]
+    assert [index for index, _, _ in delivered] == [0, 1, 2]
+    assert delivered == [(i, text, f"audio:{text}:happy") for i, text in enumerate(sentences)]
+
+
+def test_failed_sentence_keeps_its_slot():
+    sentences = ["一つ目の文です。", "二つ目の文です。", "三つ目の文です。"]
+    delivered, _ = run(["".join(sentences)], FakeSynthesizer(fail={sentences[1]}))
+
+    assert [(index, audio is None) for index, _, audio in delivered] == [(0, False), (1, True), (2, False)]
+
+
+def test_max_chars_uses_the_transformed_length():
+    # 後処理で長くなる文は、後処理後の長さで上限を判定する（後処理前の7文字なら2文目も収まる）
+    transform = lambda sentence: sentence.replace("私", "わたくし")
+    delivered, count = run(
+        ["私は職人です。私は京都です。"], transform=transform, max_chars=18
+    )
+
+    assert texts(delivered) == ["わたくしは職人です。"]
+    assert count == 1
+
+
+def test_nothing_is_voiced_after_the_limit():
+    # 上限を超えた文の後ろに収まる文があっても、途中の文が抜けないように音声化しない
+    delivered, _ = run(["短い文です。とても長い長い長い長い文です。最後の文です。"], max_chars=15)
+    assert texts(delivered) == ["短い文です。"]
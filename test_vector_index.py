@@ -0,0 +1,84 @@
+# test_vector_index.py
+import numpy as np
+import pytest
+
+pytest.importorskip('langchain_core')
+from langchain_core.documents import Document
+
+from modules.vector_index import NumpyVectorIndex
+
+
+class FakeEmbeddings:
+    """テキストごとに決まったベクトルを返す埋め込み"""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+    def embed_documents(self, texts):
+        return [self.vectors[text] for text in texts]
+
+
+def make_index(count=200, dimensions=16, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(count, dimensions)).astype(np.float32)
+    documents = [Document(page_content=f"チャンク{i}") for i in range(count)]
+    index = NumpyVectorIndex()
+    index.load(vectors, documents, fingerprint='v1')
+    return index, vectors, documents
+
+
+def brute_force(vectors, query, k):
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normalized @ (query / np.linalg.norm(query))
+    return sorted(range(len(vectors)), key=lambda i: -scores[i])[:k], scores
+
+
+def test_top_k_matches_full_sort():
+    index, vectors, documents = make_index()
+    query = np.random.default_rng(1).normal(size=vectors.shape[1])
+
+    for k in (1, 4, 10, 199, 200, 500):
+        results = index.search_by_vector(query, k)
+        expected, scores = brute_force(vectors, query, k)
+        assert [document.page_content for document, _ in results] == [documents[i].page_content for i in expected]
+        assert np.allclose([score for _, score in results], scores[expected], atol=1e-5)
+
+
+def test_batched_search_matches_single_search():
+    index, vectors, _ = make_index()
+    queries = np.random.default_rng(2).normal(size=(5, vectors.shape[1]))
+    queries[3] = 0.0
+
+    batched = index.search_many_by_vector(queries, k=4)
+    for query, results in zip(queries, batched):
+        single = index.search_by_vector(query, k=4)
+        if not np.linalg.norm(query):
+            assert single == []
+            continue
+        assert [document.page_content for document, _ in results] == \
+            [document.page_content for document, _ in single]
+
+
+def test_text_search_uses_embeddings():
+    vectors = {"糸目糊": [1.0, 0.0, 0.0], "蒸し": [0.0, 1.0, 0.0], "京友禅": [0.9, 0.1, 0.0]}
+    index = NumpyVectorIndex(embeddings=FakeEmbeddings(vectors))
+    index.load([vectors["糸目糊"], vectors["蒸し"]], [Document(page_content="糸目糊"), Document(page_content="蒸し")])
+
+    assert [document.page_content for document in index.similarity_search("京友禅", k=2)] == ["糸目糊", "蒸し"]
+    assert [[document.page_content for document in results] for results in index.search_many(["蒸し"], k=1)] == [["蒸し"]]
+
+
+def test_empty_index_and_reload():
+    index = NumpyVectorIndex()
+    assert index.search_by_vector([1.0, 0.0], k=4) == []
+    assert index.search_many_by_vector([[1.0, 0.0]], k=4) == [[]]
+    assert len(index) == 0 and index.dimensions == 0
+
+    index.load([[1.0, 0.0]], [Document(page_content="一")], fingerprint='v1')
+    index.load([[0.0, 1.0], [1.0, 1.0]], [Document(page_content="二"), Document(page_content="三")], fingerprint='v2')
+    assert len(index) == 2 and index.fingerprint == 'v2' and index.dimensions == 2
+    assert index.search_by_vector([0.0, 1.0], k=1)[0][0].page_content == "二"
+    assert index.search_by_vector([1.0, 0.0], k=0) == []
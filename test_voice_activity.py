@@ -0,0 +1,106 @@
+# test_voice_activity.py
+import numpy as np
+
+from modules.voice_activity import VoiceActivityDetector
+
+SAMPLE_RATE = 16000
+FRAME = SAMPLE_RATE * 20 // 1000  # 20msフレームのサンプル数
+
+
+def seconds(value):
+    return int(SAMPLE_RATE * value)
+
+
+def noise(duration, level_db, seed=0):
+    """指定したRMSレベル（dBFS）の白色雑音"""
+    rng = np.random.default_rng(seed)
+    return rng.normal(0.0, 10 ** (level_db / 20), seconds(duration))
+
+
+def tone(duration, amplitude, frequency=220.0):
+    t = np.arange(seconds(duration)) / SAMPLE_RATE
+    return amplitude * np.sin(2 * np.pi * frequency * t)
+
+
+def to_pcm(signal):
+    return (np.asarray(signal) * 32768.0).clip(-32768, 32767).astype(np.int16)
+
+
+def with_burst(burst, before=1.0, after=1.5, floor_db=-60.0):
+    """静かな雑音の中に burst を置いたクリップ"""
+    signal = noise(before + len(burst) / SAMPLE_RATE + after, floor_db)
+    signal[seconds(before):seconds(before) + len(burst)] += burst
+    return to_pcm(signal)
+
+
+def test_silence_is_rejected():
+    result = VoiceActivityDetector().process(np.zeros(seconds(2.0), dtype=np.int16), SAMPLE_RATE)
+
+    assert result['is_speech'] is False
+    assert len(result['pcm']) == 0
+    assert result['original_ms'] == 2000 and result['removed_ms'] == 2000
+
+
+def test_low_level_noise_is_rejected():
+    result = VoiceActivityDetector().process(to_pcm(noise(2.0, -60.0)), SAMPLE_RATE)
+    assert result['is_speech'] is False
+
+
+def test_tone_burst_is_trimmed_with_hangover_and_padding():
+    pcm = with_burst(tone(0.5, 0.3))
+    result = VoiceActivityDetector().process(pcm, SAMPLE_RATE)
+
+    # 発話は50〜74フレーム目。前後に hangover 7フレーム + padding 7フレームを残す
+    start, end = (50 - 14) * FRAME, (75 + 14) * FRAME
+    assert result['is_speech'] is True
+    assert np.array_equal(result['pcm'], pcm[start:end])
+    assert result['trimmed_ms'] == (end - start) * 1000 // SAMPLE_RATE
+    assert result['removed_ms'] == result['original_ms'] - result['trimmed_ms']
+
+
+def test_clipped_burst_is_kept():
+    # 入力が飽和して矩形波に近い波形でも発話として扱う
+    pcm = with_burst(tone(0.5, 4.0))
+    assert np.max(np.abs(pcm.astype(np.int32))) >= 32767
+    result = VoiceActivityDetector().process(pcm, SAMPLE_RATE)
+
+    start, end = (50 - 14) * FRAME, (75 + 14) * FRAME
+    assert result['is_speech'] is True
+    assert np.array_equal(result['pcm'], pcm[start:end])
+
+
+def test_clip_without_pauses_is_not_rejected():
+    # 先頭から末尾まで発話（飽和）していて、背景雑音の基準が発話のレベルになる場合
+    pcm = to_pcm(tone(2.0, 4.0))
+    result = VoiceActivityDetector().process(pcm, SAMPLE_RATE)
+
+    assert result['is_speech'] is True
+    assert result['removed_ms'] == 0
+    assert np.array_equal(result['pcm'], pcm)
+
+
+def test_short_click_is_rejected():
+    # min_speech_ms（200ms）に満たない音は発話とみなさない
+    result = VoiceActivityDetector().process(with_burst(tone(0.1, 0.3)), SAMPLE_RATE)
+    assert result['is_speech'] is False
+
+
+def test_long_pause_is_collapsed():
+    signal = noise(4.0, -60.0)
+    signal[seconds(0.5):seconds(1.0)] += tone(0.5, 0.3)
+    signal[seconds(3.0):seconds(3.5)] += tone(0.5, 0.3)
+    pcm = to_pcm(signal)
+    result = VoiceActivityDetector().process(pcm, SAMPLE_RATE)
+
+    # 発話の間の無音（前後の hangover を除いて 2000 - 300ms）は max_pause_ms（30フレーム）まで詰める
+    speech_and_margins = (25 - 14) * FRAME, (175 + 14) * FRAME
+    pause_frames = (150 - 7) - (50 + 7)
+    expected_frames = (speech_and_margins[1] - speech_and_margins[0]) // FRAME - (pause_frames - 30)
+    assert result['is_speech'] is True
+    assert len(result['pcm']) == expected_frames * FRAME
+
+
+def test_too_short_input():
+    result = VoiceActivityDetector().process(np.zeros(FRAME - 1, dtype=np.int16), SAMPLE_RATE)
+    assert result['is_speech'] is False
+    assert len(result['pcm']) == 0 and result['removed_ms'] == result['original_ms']
@@ -0,0 +1,165 @@
+# test_write_behind.py
+import threading
+import time
+
+from modules.write_behind import WriteBehindQueue
+
+
+class FakeSupabase:
+    """insertされた行を記録するSupabaseの代わり（fail_times回まで、またはfail_rowsを含むと失敗する）"""
+
+    def __init__(self, fail_times=0, fail_rows=()):
+        self.fail_times = fail_times
+        self.fail_rows = set(fail_rows)
+        self.inserted = []
+        self.attempts = 0
+        self.blocked = threading.Event()
+        self.blocked.set()
+        self._lock = threading.Lock()
+
+    def table(self, name):
+        return FakeInsert(self, name)
+
+
+class FakeInsert:
+    def __init__(self, supabase, name):
+        self.supabase = supabase
+        self.name = name
+        self.rows = []
+
+    def insert(self, rows):
+        self.rows = list(rows)
+        return self
+
+    def execute(self):
+        supabase = self.supabase
+        supabase.blocked.wait()
+        with supabase._lock:
+            supabase.attempts += 1
+            if supabase.fail_times > 0:
+                supabase.fail_times -= 1
+                raise RuntimeError('temporary failure')
+            if any(row.get('id') in supabase.fail_rows for row in self.rows):
+                raise RuntimeError('constraint violation')
+            supabase.inserted.extend((self.name, row) for row in self.rows)
+
+
+def make_queue(supabase, **kwargs):
+    options = dict(batch_size=10, flush_interval=0.01, backoff_seconds=0.001, max_backoff_seconds=0.005)
+    options.update(kwargs)
+    return WriteBehindQueue(supabase, **options)
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.005)
+    return condition()
+
+
+def test_rows_are_written_in_order():
+    supabase = FakeSupabase()
+    queue = make_queue(supabase)
+    queue.enqueue('conversations', [{'id': i} for i in range(25)])
+
+    assert wait_until(lambda: len(supabase.inserted) == 25)
+    assert [row['id'] for _, row in supabase.inserted] == list(range(25))
+    assert queue.get_stats()['queue_depth'] == 0
+    queue.close()
+
+
+def test_failed_batch_is_retried_then_written():
+    supabase = FakeSupabase(fail_times=2)
+    queue = make_queue(supabase, max_retries=5)
+    queue.enqueue('conversations', [{'id': 1}, {'id': 2}])
+
+    assert wait_until(lambda: len(supabase.inserted) == 2)
+    stats = queue.get_stats()
+    assert stats['retries'] == 2
+    assert stats['failures'] == 2
+    assert stats['dropped'] == 0
+    queue.close()
+
+
+def test_unwritable_rows_are_dropped_after_max_retries():
+    supabase = FakeSupabase(fail_rows={'bad'})
+    queue = make_queue(supabase, batch_size=1, max_retries=2)
+    queue.enqueue('conversations', [{'id': 'bad'}, {'id': 'good'}])
+
+    # 書き込めない行で止まらず、後ろの行は書き込まれる
+    assert wait_until(lambda: len(supabase.inserted) == 1)
+    assert supabase.inserted == [('conversations', {'id': 'good'})]
+    stats = queue.get_stats()
+    assert stats['dropped'] == 1
+    assert supabase.attempts == 2 + 1 + 1  # 失敗3回（初回 + 再試行2回）と成功1回
+    queue.close()
+
+
+def test_only_failed_table_is_retried():
+    supabase = FakeSupabase(fail_rows={'bad'})
+    queue = make_queue(supabase, max_retries=1)
+    queue.enqueue('sessions', [{'id': 'bad'}])
+    queue.enqueue('conversations', [{'id': 'ok'}])
+
+    assert wait_until(lambda: queue.get_stats()['dropped'] == 1)
+    assert supabase.inserted == [('conversations', {'id': 'ok'})]
+    queue.close()
+
+
+def test_pending_rows_include_in_flight_rows():
+    supabase = FakeSupabase()
+    supabase.blocked.clear()
+    queue = make_queue(supabase)
+    queue.enqueue('conversations', [{'session_id': 'a', 'id': 1}, {'session_id': 'b', 'id': 2}])
+
+    # 書き込み中（insertの応答待ち）の行も見える
+    assert wait_until(lambda: queue.get_stats()['flushes'] == 0 and supabase.attempts == 0 and queue._in_flight)
+    assert queue.pending_rows('conversations', session_id='a') == [{'session_id': 'a', 'id': 1}]
+    assert queue.pending_rows('sessions') == []
+
+    supabase.blocked.set()
+    assert wait_until(lambda: not queue.pending_rows('conversations'))
+    queue.close()
+
+
+def test_enqueue_drops_oldest_rows_when_full():
+    supabase = FakeSupabase()
+    supabase.blocked.clear()
+    queue = make_queue(supabase, batch_size=1, max_queue=3)
+    queue.enqueue('conversations', [{'id': 0}])
+    assert wait_until(lambda: queue._in_flight)
+
+    queue.enqueue('conversations', [{'id': i} for i in range(1, 6)])
+    assert [row['id'] for row in queue.pending_rows('conversations')] == [0, 3, 4, 5]
+    assert queue.get_stats()['dropped'] == 2
+
+    supabase.blocked.set()
+    queue.close()
+    assert [row['id'] for _, row in supabase.inserted] == [0, 3, 4, 5]
+
+
+def test_close_drains_remaining_rows():
+    supabase = FakeSupabase()
+    queue = make_queue(supabase, batch_size=100, flush_interval=60.0)
+    queue.enqueue('conversations', [{'id': i} for i in range(5)])
+    assert supabase.inserted == []
+
+    queue.close()
+    assert [row['id'] for _, row in supabase.inserted] == list(range(5))
+    assert queue.get_stats()['queue_depth'] == 0
+
+    # 終了後の書き込みは同期的に行う
+    queue.enqueue('conversations', [{'id': 5}])
+    assert supabase.inserted[-1] == ('conversations', {'id': 5})
+
+
+def test_close_drops_rows_that_keep_failing():
+    supabase = FakeSupabase(fail_rows={'bad'})
+    queue = make_queue(supabase, batch_size=100, flush_interval=60.0, max_retries=1)
+    queue.enqueue('conversations', [{'id': 'bad'}])
+
+    queue.close()
+    assert supabase.inserted == []
+    assert queue.get_stats()['dropped'] == 1